@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from settings import (RATE_LIMIT_RPS, RATE_LIMIT_BURST, RATE_LIMIT_MAX_KEYS, INGEST_CONCURRENCY, RETRIEVAL_CONCURRENCY,
+                      LLM_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT)
+
+
+class RateLimited(Exception):
+    """api_key超出速率限制（429）"""
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("请求过于频繁，请稍后重试")
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """服务繁忙，排队已满或排队超时（503）"""
+    status_code = 503
+
+    def __init__(self, stage: str, retry_after: float):
+        super().__init__(f"服务繁忙（{stage}），请稍后重试")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+# -------------------------- 令牌桶限速 --------------------------
+class RateLimiter:
+    """每个api_key一个令牌桶，按时间连续补充令牌"""
+
+    def __init__(self, rate: float = RATE_LIMIT_RPS, burst: float = RATE_LIMIT_BURST,
+                 max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [令牌数, 上次更新时间]
+        self.allowed = 0
+        self.limited = 0
+        self.paced = 0  # wait()中因令牌不足而等待的次数
+
+    def _take(self, api_key: str, cost: float) -> float:
+        """扣除令牌并返回0；不足时不扣除，返回需要等待的秒数"""
+        # 只保存api_key的哈希
+        key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        cost = min(cost, self.burst)
+        if bucket[0] < cost:
+            return (cost - bucket[0]) / self.rate
+        bucket[0] -= cost
+        self.allowed += 1
+        return 0.0
+
+    def acquire(self, api_key: str, cost: float = 1.0):
+        """扣除令牌，不足时抛出RateLimited（带需要等待的秒数）"""
+        if self.rate <= 0:
+            return
+        retry_after = self._take(api_key, cost)
+        if retry_after > 0:
+            self.limited += 1
+            raise RateLimited(retry_after)
+
+    async def wait(self, api_key: str, cost: float = 1.0):
+        """扣除令牌，不足时等待补充而不是拒绝（批量任务按api_key的速率逐条进行）"""
+        if self.rate <= 0:
+            return
+        while True:
+            retry_after = self._take(api_key, cost)
+            if retry_after <= 0:
+                return
+            self.paced += 1
+            await asyncio.sleep(retry_after)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"rate": self.rate, "burst": self.burst, "keys": len(self._buckets),
+                "allowed": self.allowed, "limited": self.limited, "paced": self.paced}
+
+
+# -------------------------- 分阶段并发控制 --------------------------
+class Stage:
+    """
+    一个处理阶段的并发上限 + 有界等待队列
+    并发已满时排队等待；队列已满或排队超时时抛出Overloaded，不让请求无限堆积
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timeouts = 0
+        self.completed = 0
+        self.total_seconds = 0.0
+
+    def retry_after(self) -> float:
+        """按平均处理时间估计排到的时间"""
+        average = self.total_seconds / self.completed if self.completed else 1.0
+        return max(1.0, average * (self.waiting + 1) / self.concurrency)
+
+    @asynccontextmanager
+    async def slot(self, shed: bool = True):
+        """
+        占用一个并发名额
+        shed=False 时不受队列长度和排队时间限制（用于批量任务，宁可等待也不失败）
+        """
+        if shed and self._semaphore.locked() and self.waiting >= self.queue_size:
+            self.shed += 1
+            raise Overloaded(self.name, self.retry_after())
+        self.waiting += 1
+        try:
+            if shed:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.shed += 1
+            raise Overloaded(self.name, self.retry_after())
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self.total_seconds += time.monotonic() - started
+            self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timeouts": self.timeouts,
+            "avg_seconds": round(self.total_seconds / self.completed, 4) if self.completed else None,
+        }
+
+
+rate_limiter = RateLimiter()
+ingest = Stage("ingest", INGEST_CONCURRENCY)
+retrieval = Stage("retrieval", RETRIEVAL_CONCURRENCY)
+llm = Stage("llm", LLM_CONCURRENCY)
+
+
+def snapshot() -> Dict[str, Any]:
+    return {
+        "rate_limit": rate_limiter.snapshot(),
+        "stages": {stage.name: stage.snapshot() for stage in (ingest, retrieval, llm)},
+    }
@@ -1,40 +1,127 @@
-import requests
+import asyncio
+import hashlib
 import json
 import os
 import re
 import subprocess
-from typing import List, Dict, Optional, Tuple
-from dotenv import load_dotenv
-from fastapi import FastAPI, Body, UploadFile, File, HTTPException
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Callable, List, Dict, Optional, Set, Tuple
+from fastapi import FastAPI, Body, UploadFile, File, Form, Header, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-# -------------------------- 加载环境变量 --------------------------
-load_dotenv()
+import admission
+import batch_query
+import file_io
+import file_sniffer
+import git_history
+import http_cache
+import llm_client
+import log_index
+import passages
+import profiler
+import retrieval_cache
+import sessions
+import tabular
+from fs_watcher import WATCHER_ENABLED, DirectoryWatcher
+from lifecycle import INDEX_WARMUP, lifecycle
+from llm_transport import LLMError
+from query_analysis import DEFAULT_SYNONYMS, SynonymTable, analyze_query
+from query_plan import plan_query
+from search_index import ChunkIndex, IndexRegistry
+from settings import (API_URL, MODEL_NAME, DOCS_FOLDER, GIT_REPOS_FOLDER, CONFIG_FOLDER, FILES_PAGE_SIZE,
+                      FILE_CONTENT_MAX_BYTES)
 
-# 从环境变量中读取配置
-API_URL = os.getenv("API_URL")
-MODEL_NAME = os.getenv("MODEL_NAME")
-DOCS_FOLDER = os.getenv("DOCS_FOLDER", "docs")
-GIT_REPOS_FOLDER = os.getenv("GIT_REPOS_FOLDER", "git_repos")
-CONFIG_FOLDER = os.getenv("CONFIG_FOLDER", "config")
+# -------------------------- 生命周期 --------------------------
+def prepare_directories():
+    """确保必要的目录存在"""
+    os.makedirs(DOCS_FOLDER, exist_ok=True)
+    os.makedirs(CONFIG_FOLDER, exist_ok=True)
+    os.makedirs("static", exist_ok=True)
 
-# 确保必要的目录存在
-os.makedirs(DOCS_FOLDER, exist_ok=True)
-os.makedirs(CONFIG_FOLDER, exist_ok=True)
-os.makedirs("static", exist_ok=True)
+async def warm_up():
+    """先启动文件监听再构建索引，构建期间的文件变化不会遗漏"""
+    await lifecycle.run("watcher", lambda: file_watcher.start())
+    await lifecycle.run("index", lambda: index_registry.get(DOCS_FOLDER))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    导入模块时只做轻量的定义；启动时创建监听器和索引注册表（不访问磁盘）、创建目录，其余组件在后台初始化，
+    存活检查立即可用，全部必需组件就绪后就绪检查才返回200
+    """
+    lifecycle.startup_began = time.monotonic()
+    create_components()
+    await lifecycle.run("directories", prepare_directories, background=False)
+    tasks = [
+        asyncio.create_task(lifecycle.run("git", is_git_available)),
+        asyncio.create_task(warm_up()),
+        asyncio.create_task(lifecycle.run("history", ingest_all_histories)),
+    ]
+    yield
+    lifecycle.shutting_down = True
+    for task in tasks:
+        task.cancel()
+    if file_watcher is not None:
+        file_watcher.stop()
+    await llm_client.transport.aclose()
 
 # -------------------------- FastAPI 初始化 --------------------------
-app = FastAPI(root_path="/rag")
+app = FastAPI(root_path="/rag", lifespan=lifespan)
 
-# 挂载静态文件
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 挂载静态文件（目录在启动时创建）
+app.mount("/static", StaticFiles(directory="static", check_dir=False), name="static")
+
+# 没有设置 Cache-Control 的响应按路径补上默认缓存策略
+app.add_middleware(http_cache.CacheControlMiddleware)
+
+# 单请求性能分析：请求头 X-Profile: 1（需管理令牌）时用cProfile分析该请求
+# 只在开启性能分析时注册该中间件，默认关闭时没有任何额外开销
+if profiler.PROFILING_ENABLED:
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        if request.headers.get("X-Profile") != "1" or \
+                not profiler.check_admin_token(request.headers.get("X-Admin-Token")):
+            return await call_next(request)
+        profile = profiler.request_profiles.start()
+        if profile is None:
+            response = await call_next(request)
+            response.headers["X-Profile-Skipped"] = "busy"
+            return response
+        try:
+            response = await call_next(request)
+        finally:
+            profile_id = profiler.request_profiles.finish(profile, f"{request.method} {request.url.path}")
+        response.headers["X-Profile-Id"] = profile_id
+        return response
 
 # -------------------------- 请求模型 --------------------------
+class QueryFilters(BaseModel):
+    """检索范围过滤条件，多个条件同时满足"""
+    path_prefix: Optional[str] = None           # 目录（含子目录）或文件的相对路径，如 "docs/api"
+    extensions: Optional[List[str]] = None      # 扩展名，满足其一即可，如 ["java", ".kt"]
+    modified_after: Optional[datetime] = None   # 文件修改时间范围（ISO时间或时间戳）
+    modified_before: Optional[datetime] = None
+    repo: Optional[str] = None                  # 在已克隆的仓库中检索（仓库名）
+    author: Optional[str] = None                # 提交作者的姓名或邮箱（开启提交历史时，只检索该作者的提交）
+
+    def index_filters(self) -> Dict:
+        filters = {
+            "path_prefix": self.path_prefix,
+            "extensions": self.extensions,
+            "modified_after": self.modified_after.timestamp() if self.modified_after else None,
+            "modified_before": self.modified_before.timestamp() if self.modified_before else None,
+            "author": self.author,
+        }
+        return {key: value for key, value in filters.items() if value}
+
 class QueryRequest(BaseModel):
     api_key: str
     user_query: str
+    filters: Optional[QueryFilters] = None
 
 class PromptConfig(BaseModel):
     system_prompt: str
@@ -51,13 +138,22 @@ class ExampleCode(BaseModel):
     code: str
     description: Optional[str] = ""
 
+class SynonymConfig(BaseModel):
+    synonyms: List[List[str]]
+
 # -------------------------- Git相关工具函数 --------------------------
+_git_available: Optional[bool] = None
+
 def is_git_available() -> bool:
-    try:
-        subprocess.run(["git", "--version"], check=True, capture_output=True, text=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+    """只检测一次（启动时在后台执行），之后使用缓存的结果"""
+    global _git_available
+    if _git_available is None:
+        try:
+            subprocess.run(["git", "--version"], check=True, capture_output=True, text=True)
+            _git_available = True
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            _git_available = False
+    return _git_available
 
 def extract_github_url(query: str) -> Optional[str]:
     github_pattern = r"https://github\.com/[a-zA-Z0-9_-]+/[a-zA-Z0-9_-]+(?:\.git)?"
@@ -78,6 +174,51 @@ def get_repo_name_from_url(repo_url: str) -> str:
     repo_name = repo_url.rstrip(".git").split("/")[-1]
     return repo_name
 
+def get_git_head(local_repo_path: str) -> Optional[str]:
+    """获取仓库当前HEAD的提交哈希"""
+    try:
+        result = subprocess.run(
+            ["git", "-C", local_repo_path, "rev-parse", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+        return result.stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+def get_changed_files(local_repo_path: str, old_head: Optional[str], new_head: Optional[str]) -> Optional[List[str]]:
+    """两个提交之间变化的文件（相对路径），无法确定时返回None"""
+    if not old_head or not new_head:
+        return None
+    try:
+        result = subprocess.run(
+            ["git", "-C", local_repo_path, "diff", "--name-only", old_head, new_head],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+        return [os.path.normpath(line) for line in result.stdout.splitlines() if line.strip()]
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+def ingest_history(local_repo_path: str) -> List[str]:
+    """导入仓库上次记录的HEAD之后的新提交（未开启提交历史时不做任何事），返回变化的分片文件"""
+    if not git_history.GIT_HISTORY_ENABLED:
+        return []
+    return git_history.history.ingest(local_repo_path)
+
+def ingest_all_histories():
+    """启动时补齐已克隆仓库的提交历史（在本服务之外执行过git pull，或新开启提交历史）"""
+    if not os.path.isdir(GIT_REPOS_FOLDER) or not is_git_available():
+        return
+    for repo_name in os.listdir(GIT_REPOS_FOLDER):
+        local_repo_path = os.path.join(GIT_REPOS_FOLDER, repo_name)
+        if os.path.isdir(os.path.join(local_repo_path, ".git")):
+            history_files = ingest_history(local_repo_path)
+            if history_files:
+                apply_collection_changes(local_repo_path, history_files)
+
 def git_clone_or_pull(repo_url: str) -> Tuple[bool, str]:
     if not is_git_available():
         return False, "系统未安装Git，请先安装Git后重试"
@@ -89,12 +230,23 @@ def git_clone_or_pull(repo_url: str) -> Tuple[bool, str]:
     
     try:
         if os.path.exists(local_repo_path):
+            head_before = get_git_head(local_repo_path)
             result = subprocess.run(
                 ["git", "-C", local_repo_path, "pull"],
                 check=True,
                 capture_output=True,
                 text=True
             )
+            # 只有HEAD变化时才更新该仓库的索引，并且只重新读取变化的文件（以及追加了新提交的历史分片）
+            head_after = get_git_head(local_repo_path)
+            history_files = ingest_history(local_repo_path)
+            if head_after != head_before or history_files:
+                changed_files = get_changed_files(local_repo_path, head_before, head_after) \
+                    if head_after != head_before else []
+                if changed_files is None:
+                    retrieval_cache.generations.bump(local_repo_path)
+                else:
+                    apply_collection_changes(local_repo_path, changed_files + history_files)
         else:
             result = subprocess.run(
                 ["git", "clone", repo_url, local_repo_path],
@@ -102,6 +254,8 @@ def git_clone_or_pull(repo_url: str) -> Tuple[bool, str]:
                 capture_output=True,
                 text=True
             )
+            ingest_history(local_repo_path)
+            retrieval_cache.generations.bump(local_repo_path)
         
         return True, local_repo_path
     
@@ -113,19 +267,24 @@ def git_clone_or_pull(repo_url: str) -> Tuple[bool, str]:
         return False, error_msg
 
 # -------------------------- 文档加载和检索函数 --------------------------
+TEXT_EXTENSIONS = [
+    ".txt", ".md", ".markdown", ".json", ".yaml", ".yml", ".ini", ".conf",
+    ".py", ".js", ".jsx", ".mjs", ".ts", ".tsx", ".java", ".kt", ".cs", ".scala",
+    ".c", ".cc", ".cpp", ".h", ".hpp", ".html", ".css",
+    ".sh", ".bash", ".bat", ".cmd", ".php", ".rb", ".go", ".rs",
+    ".xml", ".csv", ".tsv", ".log", ".txt", ".jsonl", ".ndjson"
+]
+
+SKIP_FOLDERS = [".git", "__pycache__", "node_modules", "venv", ".env", ".github", "dist", "build"]
+
 def load_documents(folder_path: str, skip_binary_files: bool = True) -> Dict[str, str]:
     documents = {}
-    TEXT_EXTENSIONS = [
-        ".txt", ".md", ".markdown", ".json", ".yaml", ".yml", ".ini", ".conf",
-        ".py", ".js", ".ts", ".java", ".c", ".cpp", ".h", ".html", ".css",
-        ".sh", ".bash", ".bat", ".cmd", ".php", ".rb", ".go", ".rust",
-        ".xml", ".csv", ".tsv", ".log", ".txt"
-    ]
-    
-    SKIP_FOLDERS = [".git", "__pycache__", "node_modules", "venv", ".env", ".github", "dist", "build"]
     
     if not os.path.exists(folder_path):
         return documents
+    # 全量加载时重新登记该集合中的表格和日志
+    tabular.tables.clear(folder_path)
+    log_index.logs.clear(folder_path)
     
     for root, dirs, files in os.walk(folder_path):
         dirs[:] = [d for d in dirs if d not in SKIP_FOLDERS]
@@ -137,32 +296,70 @@ def load_documents(folder_path: str, skip_binary_files: bool = True) -> Dict[str
             file_path = os.path.join(root, filename)
             file_ext = os.path.splitext(filename)[1].lower()
             
-            if skip_binary_files:
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        pass
-                except UnicodeDecodeError:
-                    continue
-            
             if file_ext not in TEXT_EXTENSIONS and skip_binary_files:
                 continue
             
             try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
-                
                 relative_path = os.path.relpath(file_path, folder_path)
+                content = None
+                if skip_binary_files and file_ext in tabular.TABULAR_EXTENSIONS:
+                    # 表格数据按行流式解析，渲染为按行分组的片段（不是对象数组的JSON按普通文本读取）
+                    content = tabular.tables.load(folder_path, relative_path)
+                elif skip_binary_files and file_ext in log_index.LOG_EXTENSIONS:
+                    # 日志按时间戳分段，每段一个片段（日志中很少有空行，按段落切分会得到一个巨大的片段）
+                    content = log_index.logs.load(folder_path, relative_path)
+                if content is None and skip_binary_files:
+                    # 只读取文件开头判断：二进制、超大、压缩/生成的文件直接跳过，并识别编码
+                    content = file_sniffer.read_text_file(file_path)
+                    if content is None:
+                        continue
+                elif content is None:
+                    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                        content = f.read()
+                
                 documents[relative_path] = content
             
             except Exception as e:
                 continue
     
+    # 克隆仓库的提交历史分片（在 .git 目录中，不会被上面的遍历读到）
+    if git_history.GIT_HISTORY_ENABLED:
+        documents.update(git_history.history.documents(folder_path))
+    
     return documents
 
+def load_document(folder_path: str, relative_path: str) -> Optional[str]:
+    """按load_documents的规则读取单个文件（供增量索引使用），不应收录或已删除时返回None"""
+    if git_history.is_history_file(relative_path):
+        return git_history.history.read(folder_path, relative_path) if git_history.GIT_HISTORY_ENABLED else None
+    parts = relative_path.split(os.sep)
+    if parts[-1].startswith(".") or any(part in SKIP_FOLDERS for part in parts[:-1]):
+        return None
+    if os.path.splitext(parts[-1])[1].lower() not in TEXT_EXTENSIONS:
+        return None
+    file_path = os.path.join(folder_path, relative_path)
+    if not os.path.isfile(file_path):
+        tabular.tables.remove(folder_path, relative_path)
+        log_index.logs.remove(folder_path, relative_path)
+        return None
+    try:
+        file_ext = os.path.splitext(relative_path)[1].lower()
+        if file_ext in tabular.TABULAR_EXTENSIONS:
+            content = tabular.tables.load(folder_path, relative_path)
+            if content is not None:
+                return content
+        elif file_ext in log_index.LOG_EXTENSIONS:
+            # 持续追加的日志只解析新增的行
+            content = log_index.logs.load(folder_path, relative_path)
+            if content is not None:
+                return content
+        return file_sniffer.read_text_file(file_path)
+    except Exception:
+        return None
+
 def count_files_in_folder(folder_path: str) -> Tuple[int, List[str]]:
     file_count = 0
     file_paths = []
-    SKIP_FOLDERS = [".git", "__pycache__", "node_modules", "venv", ".env", ".github", "dist", "build"]
     
     if not os.path.exists(folder_path):
         return 0, []
@@ -178,31 +375,127 @@ def count_files_in_folder(folder_path: str) -> Tuple[int, List[str]]:
     
     return file_count, file_paths
 
-def retrieve_relevant_content(query: str, documents: Dict[str, str], top_k: int = 2) -> List[Dict[str, str]]:
-    relevant_chunks = []
+def corpus_fingerprint(folder_path: str) -> str:
+    """目录指纹：只读取文件元数据（路径、大小、修改时间），用于发现上传接口之外的改动"""
+    digest = hashlib.sha1()
     
-    if not documents:
-        return relevant_chunks
+    if not os.path.exists(folder_path):
+        return digest.hexdigest()
     
-    query_keywords = set(query.lower().split())
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_FOLDERS)
+        
+        for filename in sorted(files):
+            if filename.startswith("."):
+                continue
+            try:
+                stat = os.stat(os.path.join(root, filename))
+            except OSError:
+                continue
+            digest.update(f"{root}/{filename}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
     
-    for filename, content in documents.items():
-        chunks = [chunk.strip() for chunk in content.split("\n\n") if chunk.strip()]
+    return digest.hexdigest()
+
+def collection_for_path(path: str) -> Optional[Tuple[str, str]]:
+    """绝对路径所属的文档集合：(集合目录, 相对路径)；仓库目录本身变化时相对路径为空字符串"""
+    docs_root = os.path.abspath(DOCS_FOLDER)
+    repos_root = os.path.abspath(GIT_REPOS_FOLDER)
+    if path.startswith(docs_root + os.sep):
+        return DOCS_FOLDER, os.path.relpath(path, docs_root)
+    if path.startswith(repos_root + os.sep):
+        parts = os.path.relpath(path, repos_root).split(os.sep, 1)
+        return os.path.join(GIT_REPOS_FOLDER, parts[0]), parts[1] if len(parts) > 1 else ""
+    return None
+
+def on_files_changed(paths: Set[str], overflow: bool):
+    """文件监听回调（在监听线程中执行）：按集合分组，只把变化的文件交给增量索引"""
+    grouped: Dict[str, Set[str]] = {}
+    if overflow:
+        # 事件队列溢出，变化可能有遗漏，所有集合全量重建
+        grouped[DOCS_FOLDER] = {""}
+        if os.path.isdir(GIT_REPOS_FOLDER):
+            for repo_name in os.listdir(GIT_REPOS_FOLDER):
+                grouped[os.path.join(GIT_REPOS_FOLDER, repo_name)] = {""}
+    for path in paths:
+        located = collection_for_path(path)
+        if located is not None:
+            grouped.setdefault(located[0], set()).add(located[1])
+    for folder_path, relative_paths in grouped.items():
+        index_registry.apply_changes(folder_path, relative_paths)
+
+# 文件监听器和索引注册表在启动时（lifespan）创建，导入模块时不创建
+file_watcher: Optional[DirectoryWatcher] = None
+index_registry: Optional[IndexRegistry] = None
+
+def create_components():
+    """
+    监听 DOCS_FOLDER 和 GIT_REPOS_FOLDER 下的文件变化（rsync、挂载卷、git pull等），在后台增量更新索引；
+    每个文档集合一份倒排索引：被监听的集合增量更新，其他集合在语料版本号或目录指纹变化时重建
+    """
+    global file_watcher, index_registry
+    file_watcher = DirectoryWatcher([DOCS_FOLDER, GIT_REPOS_FOLDER], on_files_changed, skip_dirs=SKIP_FOLDERS) \
+        if WATCHER_ENABLED else None
+    index_registry = IndexRegistry(load_documents, corpus_fingerprint, load_document, watched=is_watched)
+
+def is_watched(folder_path: str) -> bool:
+    return file_watcher is not None and file_watcher.is_watching(folder_path)
+
+def apply_collection_changes(folder_path: str, relative_paths: List[str]):
+    """本服务自己修改了集合中的文件（上传、删除、git pull）：立即增量更新索引，并告知监听器不用再为这些修改重建"""
+    if is_watched(folder_path):
+        for relative_path in relative_paths:
+            file_watcher.mark_applied(os.path.join(folder_path, relative_path))
+    index_registry.apply_changes(folder_path, relative_paths)
+
+lifecycle.register("directories")
+lifecycle.register("git", required=False)
+# 监听器启动失败时退回到按目录指纹检查，不影响查询
+lifecycle.register("watcher", required=False, enabled=WATCHER_ENABLED)
+lifecycle.register("index", required=INDEX_WARMUP)
+lifecycle.register("history", required=False, enabled=git_history.GIT_HISTORY_ENABLED)
+
+def retrieve_relevant_content(query: str, index: ChunkIndex, top_k: int = 2,
+                              folder_path: Optional[str] = None,
+                              filters: Optional[Dict] = None) -> List[Dict[str, str]]:
+    """
+    按检索计划（见 query_plan.plan_query：查询分析、文件/符号/表格记录/日志时段的直接定位、元数据过滤）查倒排索引检索
+    filters: 元数据过滤条件（QueryFilters.index_filters）
+    传入folder_path时，按 (集合, 语料版本号, 分析后的查询词, 过滤条件) 缓存排序结果
+    """
+    # 持有索引锁，避免后台增量更新过程中读到不一致的数据
+    with index.lock:
+        plan = plan_query(index, query, top_k, get_synonym_table(), folder_path, filters)
+        if plan is None:
+            return []
         
-        for i, chunk in enumerate(chunks):
-            chunk_keywords = set(chunk.lower().split())
-            match_count = len(query_keywords.intersection(chunk_keywords))
-            
-            if match_count > 0:
-                relevant_chunks.append({
-                    "filename": filename,
-                    "chunk_id": i,
-                    "content": chunk,
-                    "match_count": match_count
-                })
+        cache_key = None
+        if folder_path is not None:
+            cache_tokens = list(plan.terms.items()) + [("path:" + path, 0.0) for path in plan.mentioned_files] + \
+                [("symbol:" + str(chunk_no), 0.0) for chunk_no in plan.priority_chunks]
+            if filters:
+                cache_tokens.append(("filter:" + json.dumps(filters, sort_keys=True), 0.0))
+            if plan.log_chunks:
+                cache_tokens.extend(("time:%d-%d" % (start, end), 0.0)
+                                    for start, end, _ in log_index.parse_time_ranges(query))
+            cache_key = retrieval_cache.cache.make_key(folder_path, cache_tokens, top_k)
+            ranked_ids = retrieval_cache.cache.get(cache_key)
+            if ranked_ids is not None:
+                relevant_chunks = []
+                for filename, chunk_id, score, match_count in ranked_ids:
+                    chunk_no = index.find_chunk(filename, chunk_id)
+                    if chunk_no is not None:
+                        relevant_chunks.append(index.result(chunk_no, score, match_count))
+                return relevant_chunks
+        
+        # 计划中的片段编号只在这次加锁内有效，检索也在锁内完成
+        relevant_chunks = plan.search(index, top_k)
     
-    relevant_chunks.sort(key=lambda x: x["match_count"], reverse=True)
-    return relevant_chunks[:top_k]
+    if cache_key is not None:
+        retrieval_cache.cache.put(
+            cache_key,
+            [(item["filename"], item["chunk_id"], item["score"], item["match_count"]) for item in relevant_chunks]
+        )
+    return relevant_chunks
 
 # -------------------------- 配置文件辅助函数 --------------------------
 def load_config(filename: str) -> dict:
@@ -214,10 +507,9 @@ def load_config(filename: str) -> dict:
     return {}
 
 def save_config(filename: str, data: dict):
-    """保存配置文件"""
+    """保存配置文件（整体替换，读取方不会读到写了一半的文件）"""
     config_path = os.path.join(CONFIG_FOLDER, filename)
-    with open(config_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    file_io.write_bytes(config_path, json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
 
 def get_prompt_config() -> dict:
     """获取 Prompt 配置"""
@@ -236,14 +528,31 @@ def get_example_codes() -> list:
     config = load_config("examples_config.json")
     return config.get("examples", [])
 
-def build_rag_prompt(query: str, relevant_content: List[Dict[str, str]], git_repo_info: Optional[Dict] = None) -> str:
-    # 加载配置
-    prompt_config = get_prompt_config()
+def get_synonyms() -> list:
+    """获取同义词组列表（同一组内的写法互相扩展）"""
+    config = load_config("synonyms_config.json")
+    return config.get("synonyms", DEFAULT_SYNONYMS)
+
+# 编译好的同义词表：(配置文件的修改时间和大小, 同义词表)，保存同义词配置时清除
+_synonym_table: Optional[Tuple[Optional[Tuple[int, int]], SynonymTable]] = None
+
+def get_synonym_table() -> SynonymTable:
+    """获取编译好的同义词表（配置文件没有变化时复用，检索时只需一次stat）"""
+    global _synonym_table
+    stat = file_io.stat_file(os.path.join(CONFIG_FOLDER, "synonyms_config.json"))
+    version = (stat.st_mtime_ns, stat.st_size) if stat is not None else None
+    cached = _synonym_table
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    table = SynonymTable(get_synonyms())
+    _synonym_table = (version, table)
+    return table
+
+def build_static_context(git_repo_info: Optional[Dict] = None) -> List[str]:
+    """项目背景、示例代码、仓库信息等与具体检索结果无关的参考信息"""
     context_config = get_context_config()
     example_codes = get_example_codes()
     
-    base_prompt = prompt_config["system_prompt"]
-    
     context_parts = []
     
     # 添加项目上下文
@@ -284,18 +593,57 @@ def build_rag_prompt(query: str, relevant_content: List[Dict[str, str]], git_rep
         
         if file_count > 0 and file_count <= 50:
             repo_info += f"- 所有文件列表:\n  " + "\n  ".join(git_repo_info.get("file_paths", [])) + "\n"
+        elif git_repo_info.get("matched_paths"):
+            # 文件太多时只列出查询中提到的文件
+            repo_info += f"- 查询涉及的文件:\n  " + "\n  ".join(git_repo_info["matched_paths"]) + "\n"
         
         context_parts.append(repo_info)
         context_parts.append("---")
     
+    return context_parts
+
+def format_relevant_content(relevant_content: List[Dict[str, str]]) -> List[str]:
+    """检索到的片段，每个片段一段"""
+    context_parts = []
     if relevant_content:
         for item in relevant_content:
+            source_note = ""
+            if item.get("sources"):
+                # 近似重复的内容只放一份，注明其他出处
+                source_note = "（相同内容也出现在: " + ", ".join(
+                    f"'{filename}' 片段 {chunk_id}" for filename, chunk_id in item["sources"][:5]
+                ) + "）\n"
+            location = f"片段 {item['chunk_id']}"
+            if item.get("lines"):
+                # 摘录：注明行号范围，并保留所在章节的标题路径
+                location += ", 第" + "、".join(f"{start}-{end}" for start, end in item["lines"]) + "行"
+                if item.get("heading"):
+                    source_note = f"所在章节: {item['heading']}\n" + source_note
             context_parts.append(
-                f"来自文件 '{item['filename']}' (片段 {item['chunk_id']}):\n"
+                f"来自文件 '{item['filename']}' ({location}):\n"
+                f"{source_note}"
                 f"{item['content']}\n"
                 "---"
             )
-    
+    return context_parts
+
+def build_rag_prompt(query: str, relevant_content: List[Dict[str, str]], git_repo_info: Optional[Dict] = None) -> str:
+    return compose_rag_prompt(query, relevant_content, get_prompt_config()["system_prompt"],
+                              build_static_context(git_repo_info), get_synonym_table())
+
+def batch_prompt_builder() -> Callable[[str, List[Dict]], str]:
+    """批量问答的提示词构建：配置和同义词表整批只读取一次"""
+    base_prompt = get_prompt_config()["system_prompt"]
+    static_context = build_static_context()
+    synonyms = get_synonym_table()
+    return lambda query, relevant_content: compose_rag_prompt(query, relevant_content, base_prompt,
+                                                              static_context, synonyms)
+
+def compose_rag_prompt(query: str, relevant_content: List[Dict[str, str]], base_prompt: str,
+                       static_context: List[str], synonyms: SynonymTable) -> str:
+    # 长片段只保留与问题最相关的部分
+    relevant_content = passages.extractor.extract_all(relevant_content, analyze_query(query, synonyms))
+    context_parts = static_context + format_relevant_content(relevant_content)
     context = "\n".join(context_parts) if context_parts else "无相关参考信息"
     
     rag_prompt = f"""
@@ -310,125 +658,251 @@ def build_rag_prompt(query: str, relevant_content: List[Dict[str, str]], git_rep
     
     return rag_prompt.strip()
 
+def build_session_system_prompt(git_repo_info: Optional[Dict] = None) -> str:
+    """会话的系统提示：只包含不随轮次变化的内容，作为每轮请求的公共前缀"""
+    base_prompt = get_prompt_config()["system_prompt"]
+    context_parts = build_static_context(git_repo_info)
+    if not context_parts:
+        return base_prompt
+    return f"{base_prompt}\n\n参考信息：\n" + "\n".join(context_parts)
+
+def build_session_message(query: str, new_chunks: List[Dict], reused_chunks: List[Dict]) -> str:
+    """会话中一轮的问题：只附带本轮新检索到的片段，之前发送过的片段只注明出处"""
+    parts = format_relevant_content(new_chunks)
+    if reused_chunks:
+        parts.append("前文已提供的相关片段: " + ", ".join(
+            f"'{item['filename']}' 片段 {item['chunk_id']}" for item in reused_chunks
+        ))
+    if not parts:
+        return query
+    return "参考信息：\n" + "\n".join(parts) + f"\n\n用户的问题：\n{query}"
+
 # -------------------------- API接口 --------------------------
 
-# 首页
+# 首页（压缩结果和ETag按文件修改时间缓存，内容不变时返回304）
+index_page = http_cache.StaticDocument("static/index.html", "text/html; charset=utf-8")
+
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    return FileResponse("static/index.html")
+async def root(request: Request):
+    response = await index_page.response(request)
+    if response is None:
+        raise HTTPException(status_code=404, detail="页面不存在")
+    return response
+
+# docs 文件夹的文件列表缓存
+docs_listing = file_io.DirectoryListing(DOCS_FOLDER)
+
+def docs_file_path(filename: str) -> str:
+    """docs 文件夹中的文件路径，文件名不能包含目录"""
+    if not filename or filename in (".", "..") or os.path.basename(filename) != filename:
+        raise HTTPException(status_code=400, detail="文件名不合法")
+    return os.path.join(DOCS_FOLDER, filename)
 
 # 文件上传接口
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     """上传文件到 docs 文件夹"""
+    file_path = docs_file_path(file.filename)
     try:
-        file_path = os.path.join(DOCS_FOLDER, file.filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        content = await file.read()
+        await file_io.run_io(file_io.write_bytes, file_path, content)
+        docs_listing.invalidate()
+        await asyncio.to_thread(profiler.profiled, apply_collection_changes, DOCS_FOLDER, [file.filename])
         return {"message": "文件上传成功", "filename": file.filename}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 获取文件列表
 @app.get("/files")
-async def list_files():
-    """获取 docs 文件夹中的文件列表"""
-    files = []
-    if os.path.exists(DOCS_FOLDER):
-        for filename in os.listdir(DOCS_FOLDER):
-            file_path = os.path.join(DOCS_FOLDER, filename)
-            if os.path.isfile(file_path):
-                files.append({
-                    "name": filename,
-                    "size": os.path.getsize(file_path),
-                    "modified": os.path.getmtime(file_path)
-                })
-    return {"files": files}
+async def list_files(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(FILES_PAGE_SIZE, ge=1, le=1000),
+    sort: str = Query("name"),
+    descending: bool = False
+):
+    """分页获取 docs 文件夹中的文件列表（目录列表有缓存）"""
+    if sort not in ("name", "size", "modified"):
+        raise HTTPException(status_code=400, detail="sort 只支持 name、size、modified")
+    return await http_cache.json_response(request, await docs_listing.page(offset, limit, sort, descending))
 
 # 删除文件
 @app.delete("/files/{filename}")
 async def delete_file(filename: str):
     """删除指定文件"""
-    file_path = os.path.join(DOCS_FOLDER, filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    file_path = docs_file_path(filename)
+    if await file_io.run_io(os.path.exists, file_path):
+        await file_io.run_io(os.remove, file_path)
+        docs_listing.invalidate()
+        await asyncio.to_thread(profiler.profiled, apply_collection_changes, DOCS_FOLDER, [filename])
         return {"message": "文件已删除"}
     raise HTTPException(status_code=404, detail="文件不存在")
 
 # 获取文件内容
 @app.get("/files/{filename}/content")
-async def get_file_content(filename: str):
-    """获取文件内容"""
-    file_path = os.path.join(DOCS_FOLDER, filename)
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            return {"content": content}
-        except UnicodeDecodeError:
-            raise HTTPException(status_code=400, detail="无法读取二进制文件")
-    raise HTTPException(status_code=404, detail="文件不存在")
+async def get_file_content(request: Request, filename: str):
+    """获取文件内容（过大的文件请使用 /files/{filename}/raw）"""
+    file_path = docs_file_path(filename)
+    stat = await file_io.run_io(file_io.stat_file, file_path)
+    if stat is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    if stat.st_size > FILE_CONTENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件过大，请通过 /files/{filename}/raw 分段读取")
+    try:
+        content = await file_io.run_io(file_io.read_text, file_path)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="无法读取二进制文件")
+    return await http_cache.json_response(request, {"content": content})
+
+# 获取原始文件（流式返回，支持 Range 请求分段读取）
+@app.get("/files/{filename}/raw")
+async def get_file_raw(filename: str):
+    file_path = docs_file_path(filename)
+    stat = await file_io.run_io(file_io.stat_file, file_path)
+    if stat is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return FileResponse(file_path, stat_result=stat, filename=filename, content_disposition_type="inline")
 
 # Prompt 配置接口
 @app.get("/config/prompt")
-async def get_prompt():
+async def get_prompt(request: Request):
     """获取 Prompt 配置"""
-    return get_prompt_config()
+    return await http_cache.json_response(request, await file_io.run_io(get_prompt_config))
 
 @app.post("/config/prompt")
 async def save_prompt(config: PromptConfig):
     """保存 Prompt 配置"""
-    save_config("prompt_config.json", config.dict())
+    await file_io.run_io(save_config, "prompt_config.json", config.dict())
     return {"message": "配置已保存"}
 
 # 项目上下文配置接口
 @app.get("/config/context")
-async def get_context():
+async def get_context(request: Request):
     """获取项目上下文配置"""
-    return get_context_config()
+    return await http_cache.json_response(request, await file_io.run_io(get_context_config))
 
 @app.post("/config/context")
 async def save_context(config: ContextConfig):
     """保存项目上下文配置"""
-    save_config("context_config.json", config.dict())
+    await file_io.run_io(save_config, "context_config.json", config.dict())
     return {"message": "配置已保存"}
 
 # 示例代码配置接口
 @app.get("/config/examples")
-async def get_examples():
+async def get_examples(request: Request):
     """获取示例代码列表"""
-    return {"examples": get_example_codes()}
+    return await http_cache.json_response(request, {"examples": await file_io.run_io(get_example_codes)})
+
+# 示例列表是"读取-修改-写回"，文件操作移到线程中后需要加锁避免并发修改丢失
+examples_lock = asyncio.Lock()
 
 @app.post("/config/examples")
 async def save_example(example: ExampleCode):
     """保存示例代码"""
-    config = load_config("examples_config.json")
-    examples = config.get("examples", [])
-    examples.append(example.dict())
-    save_config("examples_config.json", {"examples": examples})
+    async with examples_lock:
+        examples = await file_io.run_io(get_example_codes)
+        examples.append(example.dict())
+        await file_io.run_io(save_config, "examples_config.json", {"examples": examples})
     return {"message": "示例已保存"}
 
 @app.delete("/config/examples/{index}")
 async def delete_example(index: int):
     """删除指定示例代码"""
-    config = load_config("examples_config.json")
-    examples = config.get("examples", [])
-    if 0 <= index < len(examples):
-        examples.pop(index)
-        save_config("examples_config.json", {"examples": examples})
-        return {"message": "示例已删除"}
+    async with examples_lock:
+        examples = await file_io.run_io(get_example_codes)
+        if 0 <= index < len(examples):
+            examples.pop(index)
+            await file_io.run_io(save_config, "examples_config.json", {"examples": examples})
+            return {"message": "示例已删除"}
     raise HTTPException(status_code=404, detail="示例不存在")
 
+# 同义词配置接口
+@app.get("/config/synonyms")
+async def get_synonym_config(request: Request):
+    """获取同义词配置"""
+    return await http_cache.json_response(request, {"synonyms": await file_io.run_io(get_synonyms)})
+
+@app.post("/config/synonyms")
+async def save_synonym_config(config: SynonymConfig):
+    """保存同义词配置"""
+    global _synonym_table
+    await file_io.run_io(save_config, "synonyms_config.json", config.dict())
+    # 修改时间的精度可能不足以区分连续两次保存，直接清除缓存
+    _synonym_table = None
+    return {"message": "配置已保存"}
+
 @app.post("/query")
 async def query(request: QueryRequest):
     api_key = request.api_key
     user_query = request.user_query
+    filters = request.filters or QueryFilters()
     
-    # 从配置中获取 follow_up_query
-    prompt_config = get_prompt_config()
-    follow_up_query = prompt_config["follow_up_prompt"]
-    
+    try:
+        # 按api_key限速，超出时立即返回429
+        admission.rate_limiter.acquire(api_key)
+        
+        # 从配置中获取 follow_up_query
+        prompt_config = get_prompt_config()
+        follow_up_query = prompt_config["follow_up_prompt"]
+        
+        collection_path, git_repo_info, index = await admit_collection(user_query, filters.repo)
+        
+        def prepare_prompt() -> str:
+            if git_repo_info:
+                git_repo_info["matched_paths"] = index.paths.resolve_query(user_query)
+            # 检索相关内容（按集合和语料版本号缓存）
+            relevant_content = retrieve_relevant_content(user_query, index, folder_path=collection_path,
+                                                         filters=filters.index_filters())
+            # 构建RAG提示词
+            return build_rag_prompt(user_query, relevant_content, git_repo_info)
+        
+        async with admission.retrieval.slot():
+            rag_prompt = await asyncio.to_thread(profiler.profiled, prepare_prompt)
+        
+        # 两轮LLM调用（相同问题的并发请求会合并为一次上游调用）
+        async with admission.llm.slot():
+            return await llm_client.run_rag_conversation(api_key, rag_prompt, follow_up_query)
+    except (admission.RateLimited, admission.Overloaded) as e:
+        raise admission_http_error(e)
+    except LLMError as e:
+        raise llm_http_error(e)
+
+def llm_http_error(e: LLMError) -> HTTPException:
+    headers = {"Retry-After": str(int(e.retry_after + 0.999))} if e.retry_after is not None else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+def admission_http_error(e) -> HTTPException:
+    """限速返回429，排队已满或超时返回503，均带Retry-After"""
+    return HTTPException(status_code=e.status_code, detail=str(e),
+                         headers={"Retry-After": str(int(e.retry_after + 0.999))})
+
+async def admit_index(collection_path: str) -> ChunkIndex:
+    """获取索引：已缓存且无需访问磁盘时直接返回，否则在线程中加载并占用ingest名额"""
+    if index_registry.is_cached(collection_path):
+        return index_registry.get(collection_path)
+    async with admission.ingest.slot():
+        return await asyncio.to_thread(profiler.profiled, index_registry.get, collection_path)
+
+async def admit_collection(user_query: str, repo: Optional[str] = None) -> Tuple[str, Optional[Dict], ChunkIndex]:
+    """
+    确定文档集合并获取索引；克隆/更新仓库在线程中执行并占用ingest名额
+    repo: 指定已克隆的仓库时直接使用该仓库，不再从查询中识别仓库地址
+    """
+    if repo:
+        collection_path, git_repo_info = repo_collection(repo), None
+    elif is_git_related_query(user_query) and extract_github_url(user_query):
+        async with admission.ingest.slot():
+            collection_path, git_repo_info = await asyncio.to_thread(profiler.profiled, resolve_collection,
+                                                                     user_query)
+    else:
+        collection_path, git_repo_info = DOCS_FOLDER, None
+    return collection_path, git_repo_info, await admit_index(collection_path)
+
+def resolve_collection(user_query: str) -> Tuple[str, Optional[Dict]]:
+    """
+    确定查询使用的文档集合：查询中带GitHub仓库地址时克隆/更新仓库并使用仓库目录，否则使用docs文件夹
+    返回：(集合目录, 仓库信息)
+    """
     git_repo_info = None
     local_repo_path = None
     
@@ -448,69 +922,212 @@ async def query(request: QueryRequest):
                     "file_paths": file_paths
                 }
     
-    # 加载文档
     if local_repo_path and os.path.exists(local_repo_path):
-        documents = load_documents(local_repo_path)
-    else:
-        documents = load_documents(DOCS_FOLDER)
-    
-    # 检索相关内容
-    relevant_content = retrieve_relevant_content(user_query, documents)
+        return local_repo_path, git_repo_info
+    return DOCS_FOLDER, git_repo_info
+
+def repo_collection(repo_name: str) -> str:
+    """已克隆仓库的目录，仓库不存在时返回404"""
+    collection_path = os.path.join(GIT_REPOS_FOLDER, repo_name)
+    if os.path.basename(repo_name) != repo_name or not os.path.isdir(collection_path):
+        raise HTTPException(status_code=404, detail="仓库不存在")
+    return collection_path
+
+# -------------------------- 会话 --------------------------
+# 创建会话
+@app.post("/sessions")
+async def create_session():
+    session = sessions.store.create()
+    return {"session_id": session.session_id, "ttl": sessions.store.ttl}
+
+# 会话中提问
+@app.post("/sessions/{session_id}/query")
+async def session_query(session_id: str, request: QueryRequest):
+    """
+    多轮对话：历史保存在服务端，每轮只发送新检索到的片段和新问题
+    消息只追加不修改，相同的前缀可被上游的提示词缓存复用
+    与 /query 不同，会话中的片段不做摘录（PASSAGE_EXTRACTION），完整发送：
+    片段固定在首次发送的那一轮，之后的问题只引用它，按某个问题摘录会缺少后续问题需要的部分
+    超过 SESSION_MAX_TURNS 轮后成批丢弃最早的轮次，只保留其中的问题列表
+    """
+    session = sessions.store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
     
-    # 构建RAG提示词
-    rag_prompt = build_rag_prompt(user_query, relevant_content, git_repo_info)
+    filters = request.filters or QueryFilters()
+    async with session.lock:
+        user_query = request.user_query
+        try:
+            admission.rate_limiter.acquire(request.api_key)
+            if session.collection_path is None:
+                # 第一轮：确定文档集合（filters.repo 只在第一轮生效），固定系统提示
+                collection_path, git_repo_info, index = await admit_collection(user_query, filters.repo)
+                if git_repo_info:
+                    git_repo_info["matched_paths"] = index.paths.resolve_query(user_query)
+                session.bind(collection_path, build_session_system_prompt(git_repo_info))
+            else:
+                index = await admit_index(session.collection_path)
+            
+            # 增量检索：已在历史中的片段不再重复发送
+            async with admission.retrieval.slot():
+                relevant_content = await asyncio.to_thread(
+                    profiler.profiled, retrieve_relevant_content, user_query, index, folder_path=session.collection_path,
+                    filters=filters.index_filters())
+            new_chunks, reused_chunks = session.split_chunks(relevant_content)
+            user_message = build_session_message(user_query, new_chunks, reused_chunks)
+            
+            async with admission.llm.slot():
+                message = await llm_client.chat_message(request.api_key, session.messages(user_message))
+        except (admission.RateLimited, admission.Overloaded) as e:
+            raise admission_http_error(e)
+        except LLMError as e:
+            raise llm_http_error(e)
+        
+        assistant_message = {
+            "role": "assistant",
+            "content": message.get("content", ""),
+            "reasoning_details": message.get("reasoning_details")
+        }
+        session.add_turn(user_query, user_message, assistant_message, new_chunks)
+        return {
+            "session_id": session.session_id,
+            "response": assistant_message["content"],
+            "new_chunks": [{"filename": item["filename"], "chunk_id": item["chunk_id"]} for item in new_chunks],
+            "reused_chunks": [{"filename": item["filename"], "chunk_id": item["chunk_id"]} for item in reused_chunks]
+        }
+
+# 查看会话历史
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    session = sessions.store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return session.summary()
+
+# 结束会话
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not sessions.store.delete(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return {"message": "会话已删除"}
+
+# 批量问答（离线评估、批量回答）
+@app.post("/query/batch")
+async def query_batch(
+    api_key: str = Form(...),
+    file: UploadFile = File(...),
+    repo_name: Optional[str] = Form(None),
+    retrieve_only: bool = Form(False)
+):
+    """
+    上传JSONL文件（每行 {"id", "query", "top_k", "filters"}），所有问题在同一份索引上按与 /query 相同的流程检索，
+    LLM调用以有限并发进行，结果按完成顺序以JSONL流式返回
+    每个问题的LLM调用各扣api_key的一个令牌，令牌用完后按限速逐条进行（不会被拒绝）
+    repo_name: 在已克隆的Git仓库中检索，默认使用 docs 文件夹
+    """
+    content = (await file.read()).decode("utf-8-sig", errors="replace")
+    items = batch_query.parse_jsonl(content.splitlines())
+    if not items:
+        raise HTTPException(status_code=400, detail="输入文件中没有问题")
+    if len(items) > batch_query.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"问题数超过上限 {batch_query.BATCH_MAX_QUERIES}")
     
-    # 第一次API调用
-    response1 = requests.post(
-        url=API_URL,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": MODEL_NAME,
-            "messages": [{"role": "user", "content": rag_prompt}],
-            "extra_body": {"reasoning": {"enabled": True}}
-        }),
-        timeout=30
-    )
-    response1.raise_for_status()
-    response1_json = response1.json()
-    assistant_content1 = response1_json['choices'][0]['message']['content']
+    collection_path = repo_collection(repo_name) if repo_name else DOCS_FOLDER
+    try:
+        admission.rate_limiter.acquire(api_key)
+        index = await admit_index(collection_path)
+    except (admission.RateLimited, admission.Overloaded) as e:
+        raise admission_http_error(e)
+    follow_up_query = (await file_io.run_io(get_prompt_config))["follow_up_prompt"]
+    build_prompt = await file_io.run_io(batch_prompt_builder)
+    synonyms = await file_io.run_io(get_synonym_table)
     
-    # 保存对话历史并进行第二次调用
-    messages = [
-        {"role": "user", "content": rag_prompt},
-        {
-            "role": "assistant",
-            "content": assistant_content1,
-            "reasoning_details": response1_json['choices'][0]['message'].get('reasoning_details')
-        },
-        {"role": "user", "content": follow_up_query}
-    ]
+    async def stream_results():
+        async for result in batch_query.run_batch(items, index, api_key, build_prompt, follow_up_query,
+                                                  synonyms, retrieve_only=retrieve_only,
+                                                  rate_limiter=admission.rate_limiter,
+                                                  folder_path=collection_path):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
     
-    response2 = requests.post(
-        url=API_URL,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": MODEL_NAME,
-            "messages": messages,
-            "extra_body": {"reasoning": {"enabled": True}}
-        }),
-        timeout=30
-    )
-    response2.raise_for_status()
-    response2_json = response2.json()
-    assistant_content2 = response2_json['choices'][0]['message']['content']
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+# -------------------------- 性能分析 --------------------------
+def require_profiling_admin(token: Optional[str]):
+    if not profiler.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="性能分析未开启")
+    if not profiler.check_admin_token(token):
+        raise HTTPException(status_code=403, detail="管理令牌无效")
+
+# 采样分析：对运行中的进程采样指定时间，返回speedscope文件或折叠栈
+@app.get("/admin/profile")
+async def sample_profile(
+    seconds: float = 10,
+    interval_ms: float = 5,
+    output_format: str = Query("speedscope", alias="format"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    require_profiling_admin(x_admin_token)
+    if output_format not in ("speedscope", "collapsed"):
+        raise HTTPException(status_code=400, detail="format 只支持 speedscope 或 collapsed")
+    if not 0 < seconds <= profiler.PROFILE_MAX_SECONDS or not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail=f"seconds 需在 (0, {profiler.PROFILE_MAX_SECONDS}] 内，interval_ms 需在 [1, 1000] 内")
+    try:
+        result = await asyncio.to_thread(profiler.sampler.sample, seconds, interval_ms / 1000)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
+    if output_format == "collapsed":
+        return PlainTextResponse(profiler.to_collapsed(result),
+                                 headers={"Content-Disposition": 'attachment; filename="profile.collapsed.txt"'})
+    return JSONResponse(profiler.to_speedscope(result),
+                        headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'})
+
+# 单请求cProfile结果
+@app.get("/admin/profile/requests/{profile_id}")
+async def get_request_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    require_profiling_admin(x_admin_token)
+    report = profiler.request_profiles.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="分析结果不存在")
+    return PlainTextResponse(report)
+
+# -------------------------- 健康检查 --------------------------
+# 存活检查：进程能处理请求即返回200
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive", "uptime_seconds": lifecycle.snapshot()["uptime_seconds"]}
+
+# 就绪检查：必需组件全部初始化完成前返回503
+@app.get("/health/ready")
+async def readiness():
+    snapshot = lifecycle.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+# 运行统计
+@app.get("/stats")
+async def get_stats():
+    """获取运行统计信息"""
     return {
-        "first_response": assistant_content1,
-        "second_response": assistant_content2
+        "llm": llm_client.stats.snapshot(),
+        "loader": file_sniffer.stats.snapshot(),
+        "retrieval_cache": retrieval_cache.cache.snapshot(),
+        "sessions": sessions.store.snapshot(),
+        "index": index_registry.snapshot(),
+        "watcher": file_watcher.snapshot() if file_watcher is not None else None,
+        "lifecycle": lifecycle.snapshot(),
+        "admission": admission.snapshot(),
+        "passages": passages.extractor.snapshot(),
+        "tables": tabular.tables.snapshot(),
+        "logs": log_index.logs.snapshot(),
+        "history": git_history.history.snapshot(),
+        "http_compression": http_cache.compressed.snapshot()
     }
 
+lifecycle.mark_imported()
+
 if __name__ == "__main__":
+    import logging
     import uvicorn
+    # uvicorn只配置它自己的logger，这里让各模块的状态日志（INFO及以上）也输出到控制台
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(name)s - %(message)s")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,165 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+import admission
+import llm_client
+from llm_transport import LLMError
+from query_analysis import SynonymTable
+from query_plan import plan_query
+from search_index import ChunkIndex
+from settings import BATCH_LLM_CONCURRENCY, BATCH_MAX_QUERIES, BATCH_MAX_TOP_K
+
+# -------------------------- 输入解析 --------------------------
+def _parse_timestamp(value) -> float:
+    if isinstance(value, bool):
+        raise ValueError("时间格式错误")
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def parse_filters(data) -> Dict:
+    """
+    每行的元数据过滤条件（与 /query 的 filters 相同，仓库由接口参数指定）：
+    {"path_prefix", "extensions", "modified_after", "modified_before", "author"}，时间为ISO时间或时间戳
+    """
+    if not isinstance(data, dict):
+        raise ValueError("filters应为对象")
+    unknown = set(data) - {"path_prefix", "extensions", "modified_after", "modified_before", "author"}
+    if unknown:
+        raise ValueError(f"不支持的过滤条件: {', '.join(sorted(unknown))}")
+    filters: Dict = {}
+    for key in ("path_prefix", "author"):
+        if data.get(key):
+            if not isinstance(data[key], str):
+                raise ValueError(f"{key}应为字符串")
+            filters[key] = data[key]
+    if data.get("extensions"):
+        extensions = data["extensions"]
+        if not isinstance(extensions, list) or not all(isinstance(ext, str) for ext in extensions):
+            raise ValueError("extensions应为字符串列表")
+        filters["extensions"] = extensions
+    for key in ("modified_after", "modified_before"):
+        if data.get(key) is not None:
+            filters[key] = _parse_timestamp(data[key])
+    return filters
+
+
+def parse_jsonl(lines: Iterable[str]) -> List[Dict]:
+    """
+    解析JSONL输入，每行一个问题：
+    {"id": 可选, "query": "...", "top_k": 可选（1 ~ BATCH_MAX_TOP_K，默认2）, "filters": 可选（见parse_filters）}
+    无法解析的行也保留（带error字段），输出中原样报告，不影响其他问题
+    """
+    items = []
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        item: Dict = {"line": line_no}
+        try:
+            data = json.loads(line)
+            if isinstance(data, str):
+                data = {"query": data}
+            if not isinstance(data, dict) or not isinstance(data.get("query"), str) or not data["query"].strip():
+                raise ValueError("缺少query字段")
+            top_k = int(data.get("top_k", 2))
+            if not 1 <= top_k <= BATCH_MAX_TOP_K:
+                raise ValueError(f"top_k应在1到{BATCH_MAX_TOP_K}之间")
+            item.update(id=data.get("id", line_no), query=data["query"], top_k=top_k,
+                        filters=parse_filters(data["filters"]) if data.get("filters") else {})
+        except (ValueError, TypeError) as e:
+            item.update(id=line_no, error=f"第{line_no}行格式错误: {e}")
+        items.append(item)
+    return items
+
+
+# -------------------------- 批量检索 --------------------------
+def retrieve_batch(index: ChunkIndex, items: List[Dict], synonyms: Optional[SynonymTable] = None,
+                   folder_path: Optional[str] = None) -> List[List[Dict]]:
+    """
+    对整批问题在同一份索引上检索，每个问题的检索计划与单条查询相同（见 query_plan.plan_query）
+    需要直接定位、过滤或加权的问题单独检索，其余只按查询词打分的问题按top_k分组后批量打分
+    folder_path: 索引所属的集合（表格主键、日志时段的定位按集合登记）
+    """
+    results: List[List[Dict]] = [[] for _ in items]
+    grouped: Dict[int, List[int]] = {}
+    plans = {}
+    # 计划中的片段编号只在同一次加锁内有效
+    with index.lock:
+        for item_no, item in enumerate(items):
+            plan = plan_query(index, item["query"], item["top_k"], synonyms, folder_path, item.get("filters"))
+            if plan is None:
+                continue
+            plans[item_no] = plan
+            if plan.is_plain:
+                grouped.setdefault(item["top_k"], []).append(item_no)
+            else:
+                results[item_no] = plan.search(index, item["top_k"])
+
+        for top_k, item_nos in grouped.items():
+            batch = index.search_batch([plans[item_no].terms for item_no in item_nos], top_k)
+            for item_no, relevant_chunks in zip(item_nos, batch):
+                results[item_no] = relevant_chunks
+    return results
+
+
+# -------------------------- 批量问答 --------------------------
+async def run_batch(items: List[Dict], index: ChunkIndex, api_key: str,
+                    build_prompt: Callable[[str, List[Dict]], str], follow_up_query: str,
+                    synonyms: Optional[SynonymTable] = None, concurrency: int = BATCH_LLM_CONCURRENCY,
+                    retrieve_only: bool = False,
+                    rate_limiter: Optional[admission.RateLimiter] = None,
+                    folder_path: Optional[str] = None) -> AsyncIterator[Dict]:
+    """
+    先对所有问题批量检索，再以有限并发调用LLM，按完成顺序逐条产出结果
+    folder_path: 索引所属的集合，见retrieve_batch
+    retrieve_only: 只做检索（用于评估检索效果），不调用LLM
+    rate_limiter: 每个问题的LLM调用从api_key的令牌桶中扣一个令牌（接口传入；命令行批量评估不限速）
+    """
+    valid = [item for item in items if "error" not in item]
+    for item in items:
+        if "error" in item:
+            yield {"id": item["id"], "line": item["line"], "error": item["error"]}
+
+    # 批量任务共用检索、LLM阶段的并发名额，但只排队等待、不会被拒绝
+    async with admission.retrieval.slot(shed=False):
+        retrieved = await asyncio.to_thread(retrieve_batch, index, valid, synonyms, folder_path)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer(item: Dict, relevant_content: List[Dict]) -> Dict:
+        result = {
+            "id": item["id"],
+            "line": item["line"],
+            "query": item["query"],
+            "sources": [{"filename": chunk["filename"], "chunk_id": chunk["chunk_id"], "score": chunk["score"]}
+                        for chunk in relevant_content],
+        }
+        # 任务一开始就全部创建，提示词要在拿到并发名额后再构建（在线程中，片段摘录等不阻塞事件循环）
+        async with semaphore:
+            prompt = await asyncio.to_thread(build_prompt, item["query"], relevant_content)
+            # 记录提示词大小，便于在评估集上比较不同提示词构建方式的输入长度
+            result["prompt_chars"] = len(prompt)
+            if retrieve_only:
+                return result
+            # 每个问题的LLM调用各扣一个令牌（与单条查询相同），令牌不足时按api_key的速率等待
+            if rate_limiter is not None:
+                await rate_limiter.wait(api_key)
+            async with admission.llm.slot(shed=False):
+                try:
+                    result.update(await llm_client.run_rag_conversation(api_key, prompt, follow_up_query))
+                except LLMError as e:
+                    result.update(error=str(e), status_code=e.status_code)
+        return result
+
+    tasks = [asyncio.ensure_future(answer(item, relevant_content))
+             for item, relevant_content in zip(valid, retrieved)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        # 客户端断开或调用方提前结束时取消剩余的调用
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,106 @@
+import hashlib
+import random
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from settings import DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_MIN_TOKENS
+
+# MinHash签名长度 = 分段数 × 每段行数
+LSH_BANDS = 8
+LSH_ROWS = 4
+NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+# 词项shingle长度
+SHINGLE_SIZE = 3
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # 固定种子，保证每次运行得到相同的签名
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def _shingles(tokens: Sequence[str]) -> set:
+    if len(tokens) < SHINGLE_SIZE:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(tokens: Sequence[str]) -> Tuple[int, ...]:
+    """计算词项序列的MinHash签名"""
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in _shingles(tokens)]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def estimated_similarity(sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> float:
+    """两个签名相同位置取值相等的比例，即Jaccard相似度的估计"""
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+# -------------------------- 去重器 --------------------------
+class NearDuplicateDetector:
+    """
+    基于MinHash + LSH分段的近似重复检测
+    - 完全相同（规范化后）的文本通过内容哈希直接命中
+    - 其余通过LSH分段找候选，再用签名估计相似度确认
+    每个重复簇保留第一个出现的片段作为代表
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, min_tokens: int = DEDUP_MIN_TOKENS):
+        self.threshold = threshold
+        self.min_tokens = min_tokens
+        self._exact: Dict[str, int] = {}
+        self._digests: Dict[int, str] = {}  # 代表片段 -> 内容哈希，删除时直接定位
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        self._signatures: Dict[int, Tuple[int, ...]] = {}
+        self.checked = 0
+        self.duplicates = 0
+
+    def find_or_add(self, chunk_no: int, text: str, tokens: Sequence[str]) -> Optional[int]:
+        """
+        检查片段是否与已有代表片段重复：重复时返回代表片段序号，否则登记为新代表并返回None
+        """
+        if len(tokens) < self.min_tokens:
+            return None
+        self.checked += 1
+
+        digest = hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+        representative = self._exact.get(digest)
+        if representative is not None:
+            self.duplicates += 1
+            return representative
+
+        signature = minhash_signature(tokens)
+        bands = [(band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]) for band in range(LSH_BANDS)]
+        candidates = []
+        for key in bands:
+            for candidate in self._buckets.get(key, ()):
+                if candidate not in candidates:
+                    candidates.append(candidate)
+        for candidate in candidates:
+            if estimated_similarity(signature, self._signatures[candidate]) >= self.threshold:
+                self.duplicates += 1
+                return candidate
+
+        self._exact[digest] = chunk_no
+        self._digests[chunk_no] = digest
+        self._signatures[chunk_no] = signature
+        for key in bands:
+            self._buckets.setdefault(key, []).append(chunk_no)
+        return None
+
+    def discard(self, chunk_no: int):
+        """代表片段被删除时移除其登记信息"""
+        signature = self._signatures.pop(chunk_no, None)
+        if signature is None:
+            return
+        for band in range(LSH_BANDS):
+            key = (band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+            bucket = self._buckets.get(key)
+            if bucket and chunk_no in bucket:
+                bucket.remove(chunk_no)
+                if not bucket:
+                    del self._buckets[key]
+        digest = self._digests.pop(chunk_no)
+        if self._exact.get(digest) == chunk_no:
+            del self._exact[digest]
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"checked": self.checked, "duplicates": self.duplicates, "representatives": len(self._signatures)}
@@ -0,0 +1,107 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from settings import FILE_IO_THREADS, FILE_LIST_TTL
+
+_executor = ThreadPoolExecutor(max_workers=FILE_IO_THREADS, thread_name_prefix="file-io")
+
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """在文件I/O线程池中执行阻塞的文件操作"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def read_text(path: str, encoding: str = "utf-8") -> str:
+    with open(path, "r", encoding=encoding) as f:
+        return f.read()
+
+
+def write_bytes(path: str, data: bytes):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    directory, name = os.path.split(path)
+    # 临时文件以"."开头，加载和文件监听都会忽略
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def stat_file(path: str) -> Optional[os.stat_result]:
+    """文件不存在或不是普通文件时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat if os.path.isfile(path) else None
+
+
+# -------------------------- 目录列表缓存 --------------------------
+class DirectoryListing:
+    """
+    缓存单个目录下的文件列表（名称、大小、修改时间），用于分页返回
+    目录修改时间变化（文件增删、改名）或超过FILE_LIST_TTL时重新读取；
+    也可以主动调用invalidate（上传、删除后）
+    """
+
+    def __init__(self, folder_path: str, ttl: float = FILE_LIST_TTL):
+        self.folder_path = folder_path
+        self.ttl = ttl
+        self._entries: Optional[List[Dict]] = None
+        self._dir_mtime: Optional[int] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self.scans = 0
+
+    def invalidate(self):
+        self._entries = None
+
+    def _scan(self) -> Tuple[Optional[int], List[Dict]]:
+        try:
+            dir_mtime = os.stat(self.folder_path).st_mtime_ns
+        except OSError:
+            return None, []
+        entries = []
+        with os.scandir(self.folder_path) as it:
+            for entry in it:
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append({"name": entry.name, "size": stat.st_size, "modified": stat.st_mtime})
+        entries.sort(key=lambda item: item["name"])
+        return dir_mtime, entries
+
+    def _dir_mtime_now(self) -> Optional[int]:
+        try:
+            return os.stat(self.folder_path).st_mtime_ns
+        except OSError:
+            return None
+
+    async def entries(self) -> List[Dict]:
+        async with self._lock:
+            if self._entries is not None and time.monotonic() - self._loaded_at < self.ttl:
+                if await run_io(self._dir_mtime_now) == self._dir_mtime:
+                    return self._entries
+            self._dir_mtime, self._entries = await run_io(self._scan)
+            self._loaded_at = time.monotonic()
+            self.scans += 1
+            return self._entries
+
+    async def page(self, offset: int, limit: int, sort: str = "name", descending: bool = False) -> Dict:
+        entries = await self.entries()
+        if sort != "name" or descending:
+            entries = sorted(entries, key=lambda item: item[sort], reverse=descending)
+        return {
+            "files": entries[offset:offset + limit],
+            "total": len(entries),
+            "offset": offset,
+            "limit": limit,
+        }
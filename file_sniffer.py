@@ -0,0 +1,134 @@
+import codecs
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from settings import SNIFF_BYTES, MAX_FILE_BYTES
+
+# UTF-8解码失败字符占比上限
+MAX_INVALID_RATIO = 0.01
+# 平均行长超过该值，或存在超长行，视为压缩/生成的文件
+MAX_AVG_LINE_LENGTH = 300
+MAX_LINE_LENGTH = 5000
+
+# 文档类扩展名（不按平均行长判断是否压缩）
+PROSE_EXTENSIONS = {".txt", ".md", ".markdown", ".rst", ".org"}
+
+# 常见的生成文件、锁文件
+GENERATED_FILENAMES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "pipfile.lock",
+    "cargo.lock", "composer.lock", "gemfile.lock", "go.sum", "npm-shrinkwrap.json",
+}
+GENERATED_PATTERN = re.compile(
+    r"(\.min\.(js|css)|\.bundle\.js|\.chunk\.js|\.map|_pb2\.py|\.pb\.go|\.generated\.\w+|\.designer\.cs)$",
+    re.IGNORECASE
+)
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+# -------------------------- 统计信息 --------------------------
+class LoaderStats:
+    """记录加载过程中读取的字节数和各类跳过原因"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+
+    def add(self, key: str, amount: int = 1):
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self.counters)
+
+
+stats = LoaderStats()
+
+
+# -------------------------- 判断函数 --------------------------
+def is_generated_name(filename: str) -> bool:
+    """根据文件名判断是否为锁文件、压缩文件等生成文件"""
+    return filename.lower() in GENERATED_FILENAMES or bool(GENERATED_PATTERN.search(filename))
+
+
+def detect_encoding(prefix: bytes) -> Optional[str]:
+    """
+    根据文件开头判断编码，返回None表示二进制文件
+    依次检查BOM、NUL字节、UTF-8有效比例，最后尝试GB18030
+    """
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    if b"\x00" in prefix:
+        return None
+    if not prefix:
+        return "utf-8"
+
+    # 截断处可能落在多字节字符中间，使用增量解码器忽略结尾不完整的部分
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = decoder.decode(prefix, final=False)
+    if text.count("�") <= max(1, len(text)) * MAX_INVALID_RATIO:
+        return "utf-8"
+    try:
+        codecs.getincrementaldecoder("gb18030")(errors="strict").decode(prefix, final=False)
+        return "gb18030"
+    except UnicodeDecodeError:
+        return None
+
+
+def looks_minified(prefix_text: str, prose: bool = False) -> bool:
+    """
+    存在超长行，或（非文档类文件）平均行长过长，视为压缩过的代码或生成的数据
+    prose: 是否为 .md/.txt 等文档，文档的段落可能整段写在一行里，不检查平均行长
+    """
+    lines = prefix_text.splitlines() or [prefix_text]
+    longest = max(len(line) for line in lines)
+    if longest > MAX_LINE_LENGTH:
+        return True
+    average = sum(len(line) for line in lines) / len(lines)
+    return not prose and average > MAX_AVG_LINE_LENGTH
+
+
+def sniff_file(file_path: str, max_bytes: int = MAX_FILE_BYTES) -> Tuple[Optional[str], str]:
+    """
+    只读取文件开头判断是否应当作为文本加载
+    返回：(编码, 原因)；编码为None时表示跳过，原因为 too_large / binary / generated / error
+    """
+    filename = os.path.basename(file_path)
+    if is_generated_name(filename):
+        return None, "generated"
+    try:
+        size = os.path.getsize(file_path)
+        if max_bytes and size > max_bytes:
+            return None, "too_large"
+        with open(file_path, "rb") as f:
+            prefix = f.read(SNIFF_BYTES)
+    except OSError:
+        return None, "error"
+
+    stats.add("bytes_sniffed", len(prefix))
+    encoding = detect_encoding(prefix)
+    if encoding is None:
+        return None, "binary"
+    prose = os.path.splitext(filename)[1].lower() in PROSE_EXTENSIONS
+    if looks_minified(prefix.decode(encoding, errors="ignore"), prose):
+        return None, "generated"
+    return encoding, "text"
+
+
+def read_text_file(file_path: str, max_bytes: int = MAX_FILE_BYTES) -> Optional[str]:
+    """判断通过后按检测到的编码读取全文，否则返回None（并记录跳过原因）"""
+    encoding, reason = sniff_file(file_path, max_bytes)
+    if encoding is None:
+        stats.add(f"skipped_{reason}")
+        return None
+    with open(file_path, "r", encoding=encoding, errors="replace") as f:
+        content = f.read()
+    stats.add("files_loaded")
+    stats.add("chars_loaded", len(content))
+    return content
@@ -0,0 +1,320 @@
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from settings import WATCHER_ENABLED, WATCHER_BACKEND, WATCHER_DEBOUNCE, WATCHER_MAX_DELAY, WATCHER_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# inotify事件掩码
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _walk_dirs(root: str, skip_dirs: Set[str]) -> Iterable[str]:
+    for current, dirs, _ in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in skip_dirs]
+        yield current
+
+
+# -------------------------- inotify后端 --------------------------
+def _load_libc():
+    """创建inotify后端时才导入ctypes并加载libc（导入约25毫秒，关闭监听或使用轮询时不需要）"""
+    import ctypes
+    import ctypes.util
+    libc_name = ctypes.util.find_library("c") or "libc.so.6"
+    return ctypes, ctypes.CDLL(libc_name, use_errno=True)
+
+
+class InotifyBackend:
+    """通过ctypes调用Linux inotify，每个目录一个watch"""
+
+    def __init__(self, skip_dirs: Set[str]):
+        ctypes, self._libc = _load_libc()
+        self._get_errno = ctypes.get_errno
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("当前系统不支持inotify")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(self._get_errno(), "inotify_init1失败")
+        self._skip_dirs = skip_dirs
+        self._watches: Dict[int, str] = {}
+
+    def add_tree(self, root: str) -> List[str]:
+        """递归监听目录，返回新监听的目录列表"""
+        added = []
+        for directory in _walk_dirs(root, self._skip_dirs):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                raise OSError(self._get_errno(), f"无法监听目录 {directory}")
+            self._watches[wd] = directory
+            added.append(directory)
+        return added
+
+    def read(self, timeout: float) -> Tuple[Set[str], bool]:
+        """读取事件，返回 (变化的路径, 是否发生队列溢出)"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set(), False
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set(), False
+
+        changed: Set[str] = set()
+        overflow = False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            name = os.fsdecode(buffer[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0"))
+            offset += _EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.add(directory)
+                continue
+            if name and name.startswith(".") or name in self._skip_dirs:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            changed.add(path)
+            # 新建或移入的目录需要补充监听
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.add_tree(path)
+                except OSError as e:
+                    logger.warning("监听新目录失败: %s", e)
+        return changed, overflow
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+# -------------------------- 轮询后端 --------------------------
+class PollingBackend:
+    """定期遍历目录比较文件大小和修改时间（在后台线程中执行，不在查询路径上）"""
+
+    def __init__(self, skip_dirs: Set[str], interval: float):
+        self._skip_dirs = skip_dirs
+        self._interval = interval
+        self._roots: List[str] = []
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        self._next_scan = 0.0
+
+    def add_tree(self, root: str) -> List[str]:
+        self._roots.append(root)
+        self._snapshot.update(self._scan_root(root))
+        return [root]
+
+    def _scan_root(self, root: str) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for current, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in self._skip_dirs]
+            for filename in files:
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(current, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout: float) -> Tuple[Set[str], bool]:
+        now = time.monotonic()
+        if now < self._next_scan:
+            time.sleep(min(timeout, self._next_scan - now))
+            return set(), False
+        self._next_scan = now + self._interval
+
+        current: Dict[str, Tuple[int, int]] = {}
+        for root in self._roots:
+            current.update(self._scan_root(root))
+        changed = {path for path, meta in current.items() if self._snapshot.get(path) != meta}
+        changed |= set(self._snapshot) - set(current)
+        self._snapshot = current
+        return changed, False
+
+    def close(self):
+        pass
+
+
+# -------------------------- 监听器 --------------------------
+class DirectoryWatcher:
+    """
+    监听若干根目录，变化事件经过防抖后批量交给on_change回调（在后台线程中调用）
+    on_change(changed_paths, overflow)：overflow为True时表示事件丢失，调用方应全量重新扫描
+    调用方自己已经处理过的变化（如上传接口）用mark_applied登记，之后的事件中文件状态未再变化时不再回调
+    """
+
+    def __init__(self, roots: List[str], on_change: Callable[[Set[str], bool], None],
+                 skip_dirs: Iterable[str] = (), backend: str = WATCHER_BACKEND,
+                 debounce: float = WATCHER_DEBOUNCE, max_delay: float = WATCHER_MAX_DELAY,
+                 poll_interval: float = WATCHER_POLL_INTERVAL):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.on_change = on_change
+        self.skip_dirs = set(skip_dirs)
+        self.requested_backend = backend
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.backend_name: Optional[str] = None
+        self._backend = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.healthy = False
+        self.counters = {"events": 0, "batches": 0, "overflows": 0, "errors": 0, "skipped": 0}
+        # 已处理的路径 -> (处理时的文件状态, 过期时间)
+        self._applied: Dict[str, Tuple[Optional[Tuple[int, int]], float]] = {}
+        self._applied_lock = threading.Lock()
+
+    def _create_backend(self):
+        if self.requested_backend in ("auto", "inotify"):
+            backend = None
+            try:
+                backend = InotifyBackend(self.skip_dirs)
+                for root in self.roots:
+                    os.makedirs(root, exist_ok=True)
+                    backend.add_tree(root)
+                return "inotify", backend
+            except (OSError, AttributeError) as e:
+                # 例如监听数达到上限（ENOSPC）：关闭inotify描述符，已添加的监听随之释放
+                if backend is not None:
+                    backend.close()
+                if self.requested_backend == "inotify":
+                    raise
+                logger.warning("inotify不可用，改用轮询: %s", e)
+        backend = PollingBackend(self.skip_dirs, self.poll_interval)
+        for root in self.roots:
+            os.makedirs(root, exist_ok=True)
+            backend.add_tree(root)
+        return "polling", backend
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.backend_name, self._backend = self._create_backend()
+        self._stop.clear()
+        self.healthy = True
+        self._thread = threading.Thread(target=self._run, name="fs-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+        self.healthy = False
+
+    def is_watching(self, path: str) -> bool:
+        """path是否在某个被监听的根目录下（监听器异常时返回False）"""
+        if not self.healthy:
+            return False
+        path = os.path.abspath(path)
+        return any(path == root or path.startswith(root + os.sep) for root in self.roots)
+
+    @staticmethod
+    def _file_state(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def mark_applied(self, path: str):
+        """
+        登记调用方已经处理过path的当前状态（写入或删除之后调用）
+        登记的有效期覆盖防抖和轮询的延迟；期间的事件如果文件状态仍与登记时相同，则不再交给on_change
+        """
+        path = os.path.abspath(path)
+        expires = time.monotonic() + self.debounce + self.max_delay + self.poll_interval
+        state = self._file_state(path)
+        with self._applied_lock:
+            self._applied[path] = (state, expires)
+
+    def _unapplied(self, paths: Set[str], now: float) -> Set[str]:
+        """去掉已登记且之后没有再变化的路径"""
+        with self._applied_lock:
+            for path in [path for path, (_, expires) in self._applied.items() if expires <= now]:
+                del self._applied[path]
+            applied = {path: self._applied[path][0] for path in paths if path in self._applied}
+        if not applied:
+            return paths
+        remaining = {path for path in paths if path not in applied or self._file_state(path) != applied[path]}
+        self.counters["skipped"] += len(paths) - len(remaining)
+        return remaining
+
+    def _run(self):
+        pending: Set[str] = set()
+        overflow = False
+        first_event = last_event = 0.0
+        while not self._stop.is_set():
+            try:
+                changed, lost = self._backend.read(min(0.2, self.debounce))
+            except OSError as e:
+                self.counters["errors"] += 1
+                self.healthy = False
+                logger.error("文件监听出错，已停止: %s", e)
+                return
+            now = time.monotonic()
+            if changed or lost:
+                if not pending and not overflow:
+                    first_event = now
+                last_event = now
+                pending |= changed
+                overflow = overflow or lost
+                self.counters["events"] += len(changed)
+                self.counters["overflows"] += int(lost)
+
+            if (pending or overflow) and (now - last_event >= self.debounce or now - first_event >= self.max_delay):
+                batch, batch_overflow = self._unapplied(pending, now), overflow
+                pending, overflow = set(), False
+                if not batch and not batch_overflow:
+                    continue
+                self.counters["batches"] += 1
+                try:
+                    self.on_change(batch, batch_overflow)
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    logger.exception("处理文件变化失败: %s", e)
+
+    def snapshot(self) -> Dict:
+        return {
+            "backend": self.backend_name,
+            "healthy": self.healthy,
+            "roots": self.roots,
+            **self.counters,
+        }
@@ -0,0 +1,316 @@
+import json
+import os
+import re
+import subprocess
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from settings import GIT_HISTORY_ENABLED, GIT_HISTORY_MAX_COMMITS, GIT_HISTORY_SHARD_COMMITS, GIT_HISTORY_DIFF_CHARS
+
+# 每个提交收录的提交说明字符数和文件数
+GIT_HISTORY_MESSAGE_CHARS = 2000
+GIT_HISTORY_MAX_PATHS = 50
+
+# 分片保存在仓库的 .git 目录中：不会被提交，也不会被目录遍历和文件监听当作普通文件
+HISTORY_DIR = os.path.join(".git", "rag-history")
+HISTORY_EXTENSION = ".gitlog"
+_STATE_FILE = "state.json"
+
+# git log 输出格式：记录以 \x1e 开头，字段以 \x1f 分隔，提交说明以 \x1d 结束
+_FORMAT = "%x1e%H%x1f%aI%x1f%an%x1f%ae%x1f%B%x1d"
+_NUMSTAT = re.compile(r"^(\d+|-)\t(\d+|-)\t(.+)$")
+_HEADER = re.compile(r"^## 提交 ([0-9a-f]+) \| (\S+) \| (.+)$")
+_PATH_LINE = re.compile(r"^  (?:\+\d+ -\d+|binary) (.+)$")
+_SKIPPED_DIFF_LINES = ("+++", "---", "index ", "new file", "deleted file", "old mode", "new mode",
+                       "similarity", "Binary files")
+
+
+class GitHistoryError(Exception):
+    """git log 执行失败"""
+
+
+# -------------------------- 提交 --------------------------
+class Commit:
+    """一次提交的收录内容：提交说明、修改的文件和diff都有字符数上限"""
+    __slots__ = ("sha", "date", "author", "email", "message", "message_chars", "paths", "extra_paths",
+                 "diff", "diff_chars", "diff_truncated")
+
+    def __init__(self, sha: str, date: str, author: str, email: str):
+        self.sha = sha
+        self.date = date
+        self.author = author
+        self.email = email
+        self.message: List[str] = []
+        self.message_chars = 0
+        self.paths: List[Tuple[str, str, str]] = []  # (新增行数, 删除行数, 路径)，二进制文件行数为 "-"
+        self.extra_paths = 0
+        self.diff: List[str] = []
+        self.diff_chars = 0
+        self.diff_truncated = False
+
+    def add_message(self, line: str):
+        line = line.rstrip()
+        if line and self.message_chars < GIT_HISTORY_MESSAGE_CHARS:
+            # 以#开头的行会被当作Markdown标题，影响之后片段的标题路径
+            self.message.append("\\" + line if line.startswith("#") else line)
+            self.message_chars += len(line)
+
+    def add_path(self, added: str, deleted: str, path: str):
+        if len(self.paths) < GIT_HISTORY_MAX_PATHS:
+            self.paths.append((added, deleted, path))
+        else:
+            self.extra_paths += 1
+
+    def add_diff(self, line: str):
+        line = line.rstrip()
+        if not line.strip():
+            return
+        if self.diff_chars + len(line) > GIT_HISTORY_DIFF_CHARS:
+            self.diff_truncated = True
+            return
+        self.diff.append(line)
+        self.diff_chars += len(line) + 1
+
+    def render(self) -> str:
+        """渲染成一个段落（不含空行，每个提交恰好是一个片段）"""
+        lines = [f"## 提交 {self.sha[:12]} | {self.date} | {self.author} <{self.email}>"]
+        lines.extend(self.message)
+        if self.paths:
+            lines.append("修改的文件:")
+            lines.extend(f"  binary {path}" if added == "-" else f"  +{added} -{deleted} {path}"
+                         for added, deleted, path in self.paths)
+            if self.extra_paths:
+                lines.append(f"  …另外 {self.extra_paths} 个文件")
+        if self.diff:
+            lines.append("变更内容:")
+            lines.extend(self.diff)
+            if self.diff_truncated:
+                lines.append("…（已截断）")
+        return "\n".join(lines)
+
+
+def parse_commit_chunk(content: str) -> Optional[Tuple[str, float, List[str]]]:
+    """从提交片段中取出 (作者, 提交时间戳, 修改的文件)，供元数据过滤使用；不是提交片段时返回None"""
+    lines = content.split("\n")
+    match = _HEADER.match(lines[0])
+    if match is None:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(match.group(2)).timestamp()
+    except ValueError:
+        return None
+    paths = []
+    for line in lines[1:]:
+        path = _PATH_LINE.match(line)
+        if path is not None:
+            paths.append(path.group(1))
+        elif paths:
+            break
+    return match.group(3), timestamp, paths
+
+
+def is_history_file(relative_path: str) -> bool:
+    return relative_path.startswith(HISTORY_DIR + os.sep) and relative_path.endswith(HISTORY_EXTENSION)
+
+
+# -------------------------- 流式读取 git log --------------------------
+def _run_git(repo_path: str, *args: str) -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "-C", repo_path, *args], check=True, capture_output=True, text=True)
+        return result.stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def stream_commits(repo_path: str, revisions: List[str]) -> Iterator[Commit]:
+    """
+    按时间从旧到新逐个产出提交，逐行读取 git log 的输出，任何时候只在内存中保留一个提交
+    （提交说明和diff在读取时就按上限截断，超大的提交也不会占用更多内存）
+    """
+    command = ["git", "-C", repo_path, "-c", "core.quotePath=false", "log", "--reverse", "--no-renames",
+               "--no-color", "--no-ext-diff", "--numstat", "-p", f"--format={_FORMAT}", *revisions, "--"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        commit: Optional[Commit] = None
+        in_message = in_diff = False
+        for raw in process.stdout:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            if line.startswith("\x1e"):
+                if commit is not None:
+                    yield commit
+                fields = line[1:].split("\x1f", 4)
+                if len(fields) < 5:
+                    commit = None
+                    continue
+                commit = Commit(*fields[:4])
+                line, in_message, in_diff = fields[4], True, False
+            if commit is None:
+                continue
+            if in_message:
+                end = line.find("\x1d")
+                if end >= 0:
+                    line, in_message = line[:end], False
+                commit.add_message(line)
+                continue
+            numstat = _NUMSTAT.match(line) if not in_diff else None
+            if numstat is not None:
+                commit.add_path(*numstat.groups())
+            elif line.startswith("diff --git "):
+                in_diff = True
+                commit.add_diff("文件 " + line.rsplit(" b/", 1)[-1])
+            elif line.startswith(("@@", "+", "-")) and not line.startswith(_SKIPPED_DIFF_LINES):
+                commit.add_diff(line)
+        if commit is not None:
+            yield commit
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        returncode = process.wait()
+    if returncode != 0:
+        raise GitHistoryError(f"git log 失败（退出码 {returncode}）")
+
+
+# -------------------------- 提交历史分片 --------------------------
+class CommitHistory:
+    """
+    各仓库的提交历史分片：按时间从旧到新写入 .git/rag-history/NNNNN.gitlog，每个提交一个段落
+    state.json 记录上次导入时的HEAD和各分片的提交数、字节数；再次导入时只读取该HEAD之后的新提交，
+    追加到最后一个分片（索引只重新处理变化的片段），历史被改写（强推）时重新导入
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.runs = 0
+        self.commits_ingested = 0
+        self.failures = 0
+
+    def _lock_for(self, repo_path: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(os.path.abspath(repo_path), threading.Lock())
+
+    @staticmethod
+    def _load_state(repo_path: str) -> Dict:
+        try:
+            with open(os.path.join(repo_path, HISTORY_DIR, _STATE_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"head": None, "shards": [], "next_shard": 1}
+
+    @staticmethod
+    def _save_state(repo_path: str, state: Dict):
+        path = os.path.join(repo_path, HISTORY_DIR, _STATE_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _relative(shard: Dict) -> str:
+        return os.path.join(HISTORY_DIR, shard["name"])
+
+    def ingest(self, repo_path: str) -> List[str]:
+        """
+        导入上次记录的HEAD之后的新提交，返回内容变化的分片（相对仓库目录的路径），供增量索引使用
+        git log 中途失败时不更新记录，下次从同一位置重新导入（未记录的追加内容会被截掉）
+        """
+        with self._lock_for(repo_path):
+            head = _run_git(repo_path, "rev-parse", "HEAD")
+            state = self._load_state(repo_path)
+            if head is None or state["head"] == head:
+                return []
+            os.makedirs(os.path.join(repo_path, HISTORY_DIR), exist_ok=True)
+            self.runs += 1
+            changed = set()
+            revisions = ["-n", str(GIT_HISTORY_MAX_COMMITS)]
+            if state["head"] and _run_git(repo_path, "merge-base", "--is-ancestor", state["head"], head) is not None:
+                revisions.append(f"{state['head']}..{head}")
+            else:
+                # 首次导入，或记录的HEAD已不在当前历史中：丢弃已有分片重新导入
+                for shard in state["shards"]:
+                    self._remove_shard(repo_path, shard)
+                    changed.add(self._relative(shard))
+                state["shards"] = []
+                revisions.append(head)
+
+            shards = [dict(shard) for shard in state["shards"]]
+            shard: Optional[Dict] = shards[-1] if shards else None
+            next_shard = state["next_shard"]
+            f = None
+            try:
+                if shard is not None:
+                    # 截掉上次失败时追加、但没有记录的内容
+                    with open(os.path.join(repo_path, self._relative(shard)), "r+b") as previous:
+                        previous.truncate(shard["bytes"])
+                count = 0
+                for commit in stream_commits(repo_path, revisions):
+                    if shard is None or shard["commits"] >= GIT_HISTORY_SHARD_COMMITS:
+                        if f is not None:
+                            f.close()
+                        shard = {"name": f"{next_shard:05d}{HISTORY_EXTENSION}", "commits": 0, "bytes": 0}
+                        next_shard += 1
+                        shards.append(shard)
+                        f = open(os.path.join(repo_path, self._relative(shard)), "wb")
+                    elif f is None:
+                        f = open(os.path.join(repo_path, self._relative(shard)), "ab")
+                    data = (("\n\n" if shard["commits"] else "") + commit.render()).encode("utf-8")
+                    f.write(data)
+                    shard["commits"] += 1
+                    shard["bytes"] += len(data)
+                    changed.add(self._relative(shard))
+                    count += 1
+            except (GitHistoryError, OSError):
+                self.failures += 1
+                return sorted(changed - {self._relative(shard) for shard in shards})
+            finally:
+                if f is not None:
+                    f.close()
+
+            # 只保留最近的GIT_HISTORY_MAX_COMMITS个提交：整片丢弃最旧的分片
+            total = sum(shard["commits"] for shard in shards)
+            while len(shards) > 1 and total - shards[0]["commits"] >= GIT_HISTORY_MAX_COMMITS:
+                oldest = shards.pop(0)
+                total -= oldest["commits"]
+                self._remove_shard(repo_path, oldest)
+                changed.add(self._relative(oldest))
+            self._save_state(repo_path, {"head": head, "shards": shards, "next_shard": next_shard})
+            self.commits_ingested += count
+            return sorted(changed)
+
+    def _remove_shard(self, repo_path: str, shard: Dict):
+        try:
+            os.remove(os.path.join(repo_path, self._relative(shard)))
+        except OSError:
+            pass
+
+    def documents(self, repo_path: str) -> Dict[str, str]:
+        """仓库已导入的全部分片：相对路径 -> 内容"""
+        documents = {}
+        for shard in self._load_state(repo_path)["shards"]:
+            content = self.read(repo_path, self._relative(shard))
+            if content is not None:
+                documents[self._relative(shard)] = content
+        return documents
+
+    def read(self, repo_path: str, relative_path: str) -> Optional[str]:
+        """读取分片中已记录的部分（正在追加、尚未记录的内容不读取）"""
+        for shard in self._load_state(repo_path)["shards"]:
+            if self._relative(shard) == relative_path:
+                try:
+                    with open(os.path.join(repo_path, relative_path), "rb") as f:
+                        return f.read(shard["bytes"]).decode("utf-8", errors="replace")
+                except OSError:
+                    return None
+        return None
+
+    def snapshot(self) -> Dict:
+        return {
+            "enabled": GIT_HISTORY_ENABLED,
+            "runs": self.runs,
+            "commits_ingested": self.commits_ingested,
+            "failures": self.failures,
+        }
+
+
+history = CommitHistory()
@@ -0,0 +1,274 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+import file_io
+from settings import (HTTP_COMPRESS_MIN_BYTES, HTTP_GZIP_LEVEL, HTTP_BROTLI_QUALITY, HTTP_COMPRESS_CACHE_ENTRIES,
+                      HTTP_COMPRESS_THREAD_BYTES, HTTP_STATIC_MAX_AGE)
+
+try:
+    import brotli  # 可选依赖，未安装时只协商gzip
+except ImportError:
+    brotli = None
+
+# 缓存策略
+NO_CACHE = "no-cache"  # 可以缓存，但每次使用前要用ETag重新验证（内容不变时返回304）
+NO_STORE = "no-store"  # 每次请求的结果都不同（查询、会话、统计等），不缓存
+
+_ENCODING_SUFFIX = {"gzip": "-gz", "br": "-br"}
+
+
+# -------------------------- 协商与验证 --------------------------
+def supported_encodings() -> List[str]:
+    """按优先顺序返回服务端支持的压缩编码"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    根据 Accept-Encoding 选择压缩编码，都不接受时返回None（不压缩）
+    q值相同时按服务端的优先顺序（br优先于gzip）
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def make_etag(data: bytes) -> str:
+    """由内容计算的强ETag"""
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+
+def _variant_etag(etag: str, encoding: Optional[str]) -> str:
+    """不同压缩编码是不同的表示，强ETag也要不同"""
+    if encoding is None:
+        return etag
+    return etag[:-1] + _ENCODING_SUFFIX[encoding] + '"'
+
+
+def _base_etag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in _ENCODING_SUFFIX.values():
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match 是否命中（弱比较）
+    客户端缓存的是某个压缩编码的表示，内容相同即命中，与这次协商出的编码无关
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_base_etag(tag) == etag for tag in if_none_match.split(","))
+
+
+# -------------------------- 压缩缓存 --------------------------
+class CompressionCache:
+    """按(ETag, 编码)缓存压缩结果，LRU淘汰"""
+
+    def __init__(self, max_entries: int = HTTP_COMPRESS_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag: str, encoding: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get((etag, encoding))
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((etag, encoding))
+            self.hits += 1
+            return body
+
+    def put(self, etag: str, encoding: str, body: bytes):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(etag, encoding)] = body
+            self._entries.move_to_end((etag, encoding))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(len(body) for body in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "encodings": supported_encodings(),
+            }
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=HTTP_BROTLI_QUALITY)
+    # mtime固定为0，相同内容的压缩结果相同
+    return gzip.compress(data, compresslevel=HTTP_GZIP_LEVEL, mtime=0)
+
+
+async def _encoded_body(data: bytes, etag: str, encoding: str) -> bytes:
+    body = compressed.get(etag, encoding)
+    if body is None:
+        if len(data) > HTTP_COMPRESS_THREAD_BYTES:
+            body = await asyncio.to_thread(compress, data, encoding)
+        else:
+            body = compress(data, encoding)
+        compressed.put(etag, encoding, body)
+    return body
+
+
+# -------------------------- 响应 --------------------------
+async def respond(request: Request, data: bytes, media_type: str, cache_control: str = NO_CACHE,
+                  etag: Optional[str] = None) -> Response:
+    """
+    返回带强ETag和Cache-Control的响应：
+    If-None-Match 命中时返回304（不带响应体，也不用压缩）；否则按 Accept-Encoding 压缩
+    """
+    etag = etag or make_etag(data)
+    encoding = None
+    if len(data) >= HTTP_COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": _variant_etag(etag, encoding),
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding is not None:
+        data = await _encoded_body(data, etag, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=data, media_type=media_type, headers=headers)
+
+
+def render_json(payload: Any) -> bytes:
+    """与FastAPI默认的JSONResponse相同的序列化方式"""
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+async def json_response(request: Request, payload: Any, cache_control: str = NO_CACHE) -> Response:
+    return await respond(request, render_json(payload), "application/json", cache_control)
+
+
+class StaticDocument:
+    """
+    单个静态文件（首页）：按文件的修改时间和大小缓存内容与ETag，
+    文件不变时每次请求只需一次stat
+    """
+
+    def __init__(self, path: str, media_type: str):
+        self.path = path
+        self.media_type = media_type
+        self._key: Optional[Tuple[int, int]] = None
+        self._data = b""
+        self._etag = ""
+        self._lock = asyncio.Lock()
+
+    def _read(self) -> Optional[Tuple[Tuple[int, int], bytes]]:
+        stat = file_io.stat_file(self.path)
+        if stat is None:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == self._key:
+            return key, self._data
+        with open(self.path, "rb") as f:
+            return key, f.read()
+
+    async def response(self, request: Request, cache_control: str = NO_CACHE) -> Optional[Response]:
+        """文件不存在时返回None"""
+        async with self._lock:
+            loaded = await file_io.run_io(self._read)
+            if loaded is None:
+                self._key = None
+                return None
+            key, data = loaded
+            if key != self._key:
+                self._key, self._data, self._etag = key, data, make_etag(data)
+            data, etag = self._data, self._etag
+        return await respond(request, data, self.media_type, cache_control, etag=etag)
+
+
+# -------------------------- 默认缓存策略 --------------------------
+class CacheControlMiddleware:
+    """
+    为没有设置 Cache-Control 的响应补上默认策略（纯ASGI中间件，不缓冲流式响应）：
+    /static 下的文件按 HTTP_STATIC_MAX_AGE；带 ETag/Last-Modified 的响应可缓存但需重新验证；
+    其余（查询、会话、统计等）不缓存
+    """
+
+    def __init__(self, app, static_prefix: str = "/static/"):
+        self.app = app
+        self.static_prefix = static_prefix
+        self.static_policy = f"public, max-age={HTTP_STATIC_MAX_AGE}" if HTTP_STATIC_MAX_AGE > 0 else NO_CACHE
+
+    def _policy(self, path: str, headers: List[Tuple[bytes, bytes]]) -> Optional[str]:
+        names = {name.lower() for name, _ in headers}
+        if b"cache-control" in names:
+            return None
+        if path.startswith(self.static_prefix):
+            return self.static_policy
+        if b"etag" in names or b"last-modified" in names:
+            return NO_CACHE
+        return NO_STORE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+
+        async def send_with_policy(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                policy = self._policy(path, headers)
+                if policy is not None:
+                    headers.append((b"cache-control", policy.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_policy)
+
+
+# 全局压缩结果缓存
+compressed = CompressionCache()
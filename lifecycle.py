@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from settings import INDEX_WARMUP
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age() -> float:
+    """进程已运行的秒数（Linux下从/proc读取，包含解释器启动和导入耗时；其他系统返回0）"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+# 进程启动的时间点（单调时钟），用于统计冷启动耗时
+PROCESS_STARTED = time.monotonic() - _process_age()
+
+
+class Lifecycle:
+    """
+    记录各组件的初始化状态：pending / starting / ready / failed / disabled
+    required=True 的组件全部就绪后实例才算可以接收查询（readiness）
+    """
+
+    def __init__(self):
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self.import_seconds: Optional[float] = None
+        self.startup_began: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.shutting_down = False
+
+    def register(self, name: str, required: bool = True, enabled: bool = True):
+        self.components[name] = {
+            "status": "pending" if enabled else "disabled",
+            "required": required,
+            "seconds": None,
+            "error": None,
+        }
+
+    def mark_imported(self):
+        self.import_seconds = time.monotonic() - PROCESS_STARTED
+
+    async def run(self, name: str, func: Callable[[], Any], background: bool = True):
+        """在线程中执行组件初始化并记录耗时和结果（异常不会向外抛出）"""
+        component = self.components[name]
+        if component["status"] == "disabled":
+            return
+        component["status"] = "starting"
+        started = time.monotonic()
+        try:
+            if background:
+                await asyncio.to_thread(func)
+            else:
+                func()
+            component["status"] = "ready"
+        except Exception as e:
+            component["status"] = "failed"
+            component["error"] = str(e)
+            logger.exception("组件 %s 初始化失败: %s", name, e)
+        finally:
+            component["seconds"] = round(time.monotonic() - started, 4)
+            self._check_ready()
+
+    def _check_ready(self):
+        if self.ready_at is None and self.is_ready():
+            self.ready_at = time.monotonic()
+            logger.info("实例已就绪，冷启动耗时 %.3f 秒", self.ready_at - PROCESS_STARTED)
+
+    def is_ready(self) -> bool:
+        if self.startup_began is None or self.shutting_down:
+            return False
+        return all(c["status"] in ("ready", "disabled") for c in self.components.values() if c["required"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready(),
+            "import_seconds": round(self.import_seconds, 4) if self.import_seconds is not None else None,
+            "cold_start_seconds": round(self.ready_at - PROCESS_STARTED, 4) if self.ready_at is not None else None,
+            "uptime_seconds": round(time.monotonic() - PROCESS_STARTED, 3),
+            "components": self.components,
+        }
+
+
+lifecycle = Lifecycle()
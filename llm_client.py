@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from llm_transport import Deadline, LLMError, LLMTransport
+from settings import (API_URL, MODEL_NAME, LLM_DEADLINE, LLM_COALESCE_SCOPE, LLM_BATCH_WINDOW_MS, LLM_BATCH_MAX_SIZE,
+                      LLM_BATCH_API_URL)
+
+# -------------------------- 统计信息 --------------------------
+class LLMStats:
+    """记录调用方请求数、合并次数和微批情况（上游调用和延迟见传输层）"""
+
+    def __init__(self):
+        self.requests = 0          # 调用方发起的请求数
+        self.coalesced = 0         # 被合并（共享结果）的请求数
+        self.batches = 0           # 微批次数量
+        self.batched_requests = 0  # 通过微批发送的请求数
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "batched_requests": self.batched_requests,
+            "transport": transport.snapshot(),
+        }
+
+
+stats = LLMStats()
+transport = LLMTransport()
+
+
+# -------------------------- 单飞合并 --------------------------
+class _Flight:
+    """一次共享的调用：执行调用的任务和当前的等待方数"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    相同key的并发调用只执行一次，其余调用方等待并共享同一个结果（包括异常）
+    调用在独立的任务中执行：某个调用方被取消（如客户端断开）不影响其他调用方，
+    所有调用方都离开后才取消该任务
+    调用结束后立即移除，之后的调用会重新执行（不做结果缓存）
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, _Flight] = {}
+
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+
+    def _finished(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight.task.cancelled():
+            # 标记异常已被读取，避免没有等待方时asyncio打印警告
+            flight.task.exception()
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _, flight=flight: self._finished(key, flight))
+        else:
+            stats.coalesced += 1
+        flight.waiters += 1
+        try:
+            # shield: 调用方被取消时只是不再等待，共享的调用继续执行
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+
+
+_flight = SingleFlight()
+
+
+def _request_key(api_key: str, *parts: Any) -> str:
+    """根据请求内容生成合并key（按配置决定是否区分api_key）"""
+    scope = api_key if LLM_COALESCE_SCOPE != "global" else ""
+    raw = json.dumps([scope, MODEL_NAME, *parts], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# -------------------------- 上游请求 --------------------------
+def _build_payload(messages: List[Dict]) -> Dict:
+    return {
+        "model": MODEL_NAME,
+        "messages": messages,
+        "extra_body": {"reasoning": {"enabled": True}}
+    }
+
+
+def _first_message(response_json: Dict) -> Dict:
+    """取出第一个候选回答，格式不符时抛出LLMError"""
+    choices = response_json.get("choices") if isinstance(response_json, dict) else None
+    if not choices or not isinstance(choices[0], dict) or "message" not in choices[0]:
+        raise LLMError(f"上游返回格式错误：{str(response_json)[:200]}")
+    return choices[0]["message"]
+
+
+# -------------------------- 微批处理 --------------------------
+class MicroBatcher:
+    """
+    在时间窗口内收集请求，按api_key分组后一次性发往批量接口
+    窗口到期或达到最大批量时发送
+    """
+
+    def __init__(self, url: str, window_ms: float, max_size: int):
+        self.url = url
+        self.window = window_ms / 1000.0
+        self.max_size = max(1, max_size)
+        self._pending: Dict[str, List[Tuple[Dict, asyncio.Future, Deadline]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    async def submit(self, api_key: str, payload: Dict, deadline: Deadline) -> Dict:
+        future = asyncio.get_running_loop().create_future()
+        queue = self._pending.setdefault(api_key, [])
+        queue.append((payload, future, deadline))
+        if len(queue) >= self.max_size:
+            self._flush(api_key)
+        elif api_key not in self._timers:
+            self._timers[api_key] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, api_key
+            )
+        return await future
+
+    def _flush(self, api_key: str):
+        timer = self._timers.pop(api_key, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(api_key, [])
+        if items:
+            asyncio.ensure_future(self._send(api_key, items))
+
+    async def _send(self, api_key: str, items: List[Tuple[Dict, asyncio.Future, Deadline]]):
+        stats.batches += 1
+        stats.batched_requests += len(items)
+        body = {"model": MODEL_NAME, "requests": [payload for payload, _, _ in items]}
+        # 整批使用其中最宽松的预算
+        deadline = max((d for _, _, d in items), key=lambda d: d.expires_at)
+        try:
+            result = await transport.post_json(self.url, api_key, body, deadline)
+            responses = result.get("responses", [])
+            if len(responses) != len(items):
+                raise LLMError(f"批量接口返回数量不匹配：期望 {len(items)}，实际 {len(responses)}")
+        except Exception as e:
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), response in zip(items, responses):
+            if not future.done():
+                future.set_result(response)
+
+
+_batcher: Optional[MicroBatcher] = None
+if LLM_BATCH_WINDOW_MS > 0 and LLM_BATCH_API_URL:
+    _batcher = MicroBatcher(LLM_BATCH_API_URL, LLM_BATCH_WINDOW_MS, LLM_BATCH_MAX_SIZE)
+
+
+# -------------------------- 对外接口 --------------------------
+async def chat_completion(api_key: str, messages: List[Dict], deadline: Optional[Deadline] = None) -> Dict:
+    """
+    发送一次聊天补全请求，返回上游响应JSON
+    相同内容的并发请求合并为一次上游调用；失败时抛出LLMError
+    """
+    stats.requests += 1
+    payload = _build_payload(messages)
+    if deadline is None:
+        deadline = Deadline(LLM_DEADLINE)
+
+    async def call():
+        if _batcher is not None:
+            return await _batcher.submit(api_key, payload, deadline)
+        return await transport.post_json(API_URL, api_key, payload, deadline)
+
+    return await _flight.do(_request_key(api_key, "chat", messages), call)
+
+
+async def chat_message(api_key: str, messages: List[Dict], deadline: Optional[Deadline] = None) -> Dict:
+    """发送一次聊天补全请求，返回第一个候选回答的message（content、reasoning_details）"""
+    return _first_message(await chat_completion(api_key, messages, deadline))
+
+
+async def run_rag_conversation(api_key: str, rag_prompt: str, follow_up_query: str) -> Dict[str, str]:
+    """
+    执行带RAG提示词的两轮对话（首次回答 + 追问）
+    整个两轮对话按 (提示词, 追问) 合并，相同问题同时到达时只调用上游两次
+    两轮调用共享 LLM_DEADLINE 的总耗时预算
+    """
+
+    async def converse():
+        deadline = Deadline(LLM_DEADLINE)
+        response1_json = await chat_completion(api_key, [{"role": "user", "content": rag_prompt}], deadline)
+        message1 = _first_message(response1_json)
+        assistant_content1 = message1.get('content', '')
+
+        # 保存对话历史并进行第二次调用
+        messages = [
+            {"role": "user", "content": rag_prompt},
+            {
+                "role": "assistant",
+                "content": assistant_content1,
+                "reasoning_details": message1.get('reasoning_details')
+            },
+            {"role": "user", "content": follow_up_query}
+        ]
+        response2_json = await chat_completion(api_key, messages, deadline)
+        assistant_content2 = _first_message(response2_json).get('content', '')
+
+        return {
+            "first_response": assistant_content1,
+            "second_response": assistant_content2
+        }
+
+    return await _flight.do(_request_key(api_key, "conversation", rag_prompt, follow_up_query), converse)
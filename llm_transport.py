@@ -0,0 +1,324 @@
+import asyncio
+import json
+import random
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from settings import (LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_HEDGE_ENABLED,
+                      LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_MIN_DELAY, LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET)
+
+if TYPE_CHECKING:
+    import httpx
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+# -------------------------- 异常定义 --------------------------
+class LLMError(Exception):
+    """LLM调用失败；status_code为建议返回给客户端的HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 502, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(LLMError):
+    """熔断器打开，快速失败"""
+
+    def __init__(self, url: str, retry_after: float):
+        super().__init__(f"上游服务暂不可用（熔断中）：{url}", status_code=503, retry_after=retry_after)
+
+
+class DeadlineExceeded(LLMError):
+    """总耗时预算已用完"""
+
+    def __init__(self, message: str = "LLM调用超出总耗时预算"):
+        super().__init__(message, status_code=504)
+
+
+class _AttemptError(Exception):
+    """单次请求失败（内部使用），retryable表示是否值得重试"""
+
+    def __init__(self, message: str, status_code: Optional[int], retryable: bool,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+# -------------------------- 耗时预算 --------------------------
+class Deadline:
+    """一次对话的总耗时预算，两轮调用共享"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+# -------------------------- 熔断器 --------------------------
+class CircuitBreaker:
+    """
+    连续失败达到阈值后打开，期间直接拒绝请求
+    超过重置时间后进入半开状态，放行一个探测请求：成功则关闭，失败则重新打开
+    不反映上游是否故障的结果（4xx）既不算成功也不算失败，只释放探测名额
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_inflight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_inflight:
+            self._probe_inflight = True
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def release_probe(self):
+        """探测请求没有得出结果（超出耗时预算、被取消等）时释放名额，下一个请求重新探测"""
+        self._probe_inflight = False
+
+    def record_neutral(self):
+        """请求有结果，但不说明上游是否恢复（如参数错误的4xx）：不改变计数和状态，半开时释放探测名额"""
+        self._probe_inflight = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_inflight = False
+
+    def record_failure(self):
+        self._probe_inflight = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "times_opened": self.times_opened}
+
+
+# -------------------------- 延迟统计 --------------------------
+class LatencyWindow:
+    """保留最近N次成功请求的延迟，用于计算对冲延迟和输出统计"""
+
+    def __init__(self, max_samples: int = 1000):
+        self._samples: List[float] = []
+        self._max_samples = max_samples
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        if len(self._samples) > self._max_samples:
+            del self._samples[: len(self._samples) - self._max_samples]
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+# -------------------------- 传输层 --------------------------
+class LLMTransport:
+    """
+    带重试、对冲和熔断的上游HTTP传输层
+    - 可重试状态码和网络错误按带抖动的指数退避重试，优先遵循Retry-After
+    - 每个URL一个熔断器
+    - 所有等待和单次超时都受Deadline约束
+    """
+
+    def __init__(self, timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE, backoff_max: float = LLM_BACKOFF_MAX,
+                 hedge_enabled: bool = LLM_HEDGE_ENABLED):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_enabled = hedge_enabled
+        self.latency = LatencyWindow()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._client: Optional["httpx.AsyncClient"] = None
+        self.counters = {"upstream_calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                         "failures": 0, "circuit_rejections": 0}
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            # 首次调用上游时才导入httpx（导入约40毫秒，不计入服务启动时间）
+            import httpx
+            self._client = httpx.AsyncClient()
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        if url not in self._breakers:
+            self._breakers[url] = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET)
+        return self._breakers[url]
+
+    def hedge_delay(self) -> Optional[float]:
+        """对冲延迟：近期p95延迟（样本不足时不对冲）"""
+        if not self.hedge_enabled or len(self.latency) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY, self.latency.percentile(95))
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter指数退避"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _attempt(self, url: str, headers: Dict[str, str], body: bytes, deadline: Deadline) -> Dict:
+        """发送单次请求，返回解析后的JSON"""
+        timeout = min(self.timeout, deadline.remaining())
+        if timeout <= 0:
+            raise DeadlineExceeded()
+        import httpx
+        self.counters["upstream_calls"] += 1
+        start = time.monotonic()
+        try:
+            response = await self._get_client().post(url, headers=headers, content=body, timeout=timeout)
+        except httpx.TimeoutException:
+            raise _AttemptError(f"上游请求超时（{timeout:.1f}秒）", None, True)
+        except httpx.TransportError as e:
+            raise _AttemptError(f"上游连接失败：{str(e)}", None, True)
+
+        if response.status_code >= 400:
+            raise _AttemptError(
+                f"上游返回错误状态码 {response.status_code}：{response.text[:200]}",
+                response.status_code,
+                response.status_code in RETRYABLE_STATUS,
+                _parse_retry_after(response.headers.get("Retry-After"))
+            )
+        try:
+            data = response.json()
+        except ValueError:
+            raise _AttemptError("上游返回的不是合法JSON", response.status_code, True)
+        self.latency.add(time.monotonic() - start)
+        return data
+
+    async def _hedged_attempt(self, url: str, headers: Dict[str, str], body: bytes, deadline: Deadline) -> Dict:
+        """首个请求在对冲延迟内未返回时，并发再发一个，取先成功者"""
+        delay = self.hedge_delay()
+        if delay is None or delay >= deadline.remaining():
+            return await self._attempt(url, headers, body, deadline)
+
+        primary = asyncio.ensure_future(self._attempt(url, headers, body, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self.counters["hedges"] += 1
+        hedge = asyncio.ensure_future(self._attempt(url, headers, body, deadline))
+        pending = {primary, hedge}
+        first_error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    if first_error is None:
+                        first_error = task.exception()
+            raise first_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def post_json(self, url: str, api_key: str, payload: Dict, deadline: Optional[Deadline] = None) -> Dict:
+        """发送JSON请求，按策略重试，失败时抛出LLMError"""
+        if deadline is None:
+            deadline = Deadline(self.timeout * (self.max_retries + 1))
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        body = json.dumps(payload).encode("utf-8")
+        breaker = self.breaker(url)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.counters["circuit_rejections"] += 1
+                raise CircuitOpenError(url, breaker.retry_after())
+            probing = breaker.state == "half_open"
+            try:
+                data = await self._hedged_attempt(url, headers, body, deadline)
+            except _AttemptError as e:
+                error = e
+            except BaseException as e:
+                # 探测请求没有记录成功或失败就结束时必须释放名额，否则熔断器一直停在半开状态、拒绝所有请求
+                if probing:
+                    breaker.release_probe()
+                if isinstance(e, DeadlineExceeded):
+                    self.counters["failures"] += 1
+                raise
+            else:
+                breaker.record_success()
+                return data
+
+            # 可重试错误视为上游故障；429属于限流，关闭状态下不计入熔断，
+            # 但半开时的探测收到429说明上游仍然饱和，重新打开而不是放回全部流量；其他4xx与上游状态无关
+            if error.retryable and (error.status_code != 429 or probing):
+                breaker.record_failure()
+            else:
+                breaker.record_neutral()
+
+            if not error.retryable or attempt >= self.max_retries:
+                self.counters["failures"] += 1
+                status = error.status_code if error.status_code and 400 <= error.status_code < 500 else 502
+                raise LLMError(str(error), status_code=status, retry_after=error.retry_after)
+
+            wait = error.retry_after if error.retry_after is not None else self._backoff(attempt)
+            if wait >= deadline.remaining():
+                self.counters["failures"] += 1
+                raise DeadlineExceeded(f"LLM调用超出总耗时预算，最后一次错误：{str(error)}")
+            self.counters["retries"] += 1
+            attempt += 1
+            await asyncio.sleep(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "latency_p50": self.latency.percentile(50),
+            "latency_p95": self.latency.percentile(95),
+            "latency_p99": self.latency.percentile(99),
+            "hedge_delay": self.hedge_delay(),
+            "circuit_breakers": {url: b.snapshot() for url, b in self._breakers.items()},
+        }
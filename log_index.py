@@ -0,0 +1,399 @@
+import calendar
+import copy
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+import file_sniffer
+from settings import (LOG_MAX_FILE_BYTES, LOG_SEGMENT_SECONDS, LOG_SEGMENT_BYTES, LOG_QUERY_WINDOW_SECONDS,
+                      LOG_WINDOW_BOOST)
+
+# 多行条目（如异常堆栈）过长时，超过段字节上限的该倍数后在行边界强制切分
+_HARD_CUT_FACTOR = 4
+# 日志行在片段中显示的最大字符数
+LOG_MAX_LINE_CHARS = 1000
+# 只在行首这些字节内查找时间戳
+_TIMESTAMP_SCAN_BYTES = 64
+# 判断文件是否被轮转/截断：比较开头这些字节
+_HEAD_BYTES = 256
+
+LOG_EXTENSIONS = {".log"}
+
+_MONTHS = {name: number for number, name in enumerate(calendar.month_abbr) if name}
+_MONTH_NAMES = "|".join(_MONTHS)
+
+# 行内时间戳（按字节匹配，不需要先解码）：ISO/常见格式、Apache/Nginx访问日志、syslog（无年份）
+_LINE_TIMESTAMP = re.compile(
+    rb"(?P<y>\d{4})[-/](?P<m>\d{1,2})[-/](?P<d>\d{1,2})[T ]+(?P<H>\d{1,2}):(?P<M>\d{2}):(?P<S>\d{2})"
+    rb"|(?P<d2>\d{1,2})/(?P<b2>" + _MONTH_NAMES.encode() + rb")/(?P<y2>\d{4}):(?P<H2>\d{2}):(?P<M2>\d{2}):(?P<S2>\d{2})"
+    rb"|(?P<b3>" + _MONTH_NAMES.encode() + rb") +(?P<d3>\d{1,2}) (?P<H3>\d{2}):(?P<M3>\d{2}):(?P<S3>\d{2})"
+)
+
+# 查询中的时间：日期、时刻，或日期+时刻；两个时间之间用 - ~ 到 至 to and 连接时表示时间范围
+_QUERY_POINT = re.compile(r"(?<![\d:])(?:(\d{4})[-/.](\d{1,2})[-/.](\d{1,2}))?(?:[ T]*(?<![\d:])(\d{1,2}):(\d{2})(?::(\d{2}))?)?(?![\d:])")
+# 表示查询针对日志的词
+_LOG_QUERY_WORDS = re.compile(r"日志|报错|错误|异常|告警|\b(?:logs?|errors?|exceptions?|warn(?:ing)?s?|stack ?traces?)\b",
+                              re.IGNORECASE)
+_RANGE_JOINER = re.compile(r"\s*(?:-|~|～|—|到|至|to|until|and)\s*", re.IGNORECASE)
+
+_DAY = 86400
+
+# 时间范围：(起始, 结束, 是否带日期)；不带日期时为一天内的秒数，在每个日志文件的时间范围内确定日期
+TimeRange = Tuple[float, float, bool]
+
+
+def _format_time(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(timestamp))
+
+
+def parse_line_timestamp(line: bytes, default_year: int) -> Optional[int]:
+    """日志行开头的时间戳（按日志中的本地时间计，不做时区换算），没有时返回None"""
+    match = _LINE_TIMESTAMP.search(line, 0, _TIMESTAMP_SCAN_BYTES)
+    if match is None:
+        return None
+    groups = match.groupdict()
+    try:
+        if groups["y"] is not None:
+            fields = (int(groups["y"]), int(groups["m"]), int(groups["d"]),
+                      int(groups["H"]), int(groups["M"]), int(groups["S"]))
+        elif groups["y2"] is not None:
+            fields = (int(groups["y2"]), _MONTHS[groups["b2"].decode()], int(groups["d2"]),
+                      int(groups["H2"]), int(groups["M2"]), int(groups["S2"]))
+        else:
+            fields = (default_year, _MONTHS[groups["b3"].decode()], int(groups["d3"]),
+                      int(groups["H3"]), int(groups["M3"]), int(groups["S3"]))
+    except (KeyError, ValueError):
+        return None
+    year, month, day, hour, minute, second = fields
+    if not (1 <= month <= 12 and 1 <= day <= 31 and hour < 24 and minute < 60 and second < 61):
+        return None
+    return calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0))
+
+
+def parse_time_ranges(query: str) -> List[TimeRange]:
+    """
+    查询中提到的时间范围："2024-01-02"（整天）、"14:05"（前后扩展LOG_QUERY_WINDOW_SECONDS）、
+    "14:05-14:20"、"2024-01-02 14:05 到 14:20"（后一个时间沿用前一个的日期）
+    """
+    points = []
+    for match in _QUERY_POINT.finditer(query):
+        year, month, day, hour, minute, second = match.groups()
+        if year is None and hour is None:
+            continue
+        try:
+            date = calendar.timegm((int(year), int(month), int(day), 0, 0, 0, 0, 0, 0)) if year else None
+        except ValueError:
+            continue
+        if hour is not None and (int(hour) >= 24 or int(minute) >= 60):
+            continue
+        if hour is None:
+            start, end = 0, _DAY
+        else:
+            start = int(hour) * 3600 + int(minute) * 60 + int(second or 0)
+            end = start + (1 if second else 60)
+        points.append((match.start(), match.end(), date, start, end, hour is not None))
+
+    ranges: List[TimeRange] = []
+    position = 0
+    while position < len(points):
+        _, end_pos, date, start, end, timed = points[position]
+        following = points[position + 1] if position + 1 < len(points) else None
+        if following and following[5] and _RANGE_JOINER.fullmatch(query[end_pos:following[0]]):
+            # 时间范围：结束时间缺少日期时沿用开始时间的日期，跨午夜时顺延一天
+            end_date = following[2] if following[2] is not None else date
+            end = following[4] + (end_date - date if date is not None and end_date is not None else 0)
+            if end <= start:
+                end += _DAY
+            position += 2
+        else:
+            if timed:
+                start, end = start - LOG_QUERY_WINDOW_SECONDS, end + LOG_QUERY_WINDOW_SECONDS
+            position += 1
+        if date is not None:
+            ranges.append((date + start, date + end, True))
+        else:
+            ranges.append((start, end, False))
+    return ranges
+
+
+# -------------------------- 时间分段 --------------------------
+class LogSegment:
+    """日志中连续的一段行：在文件中的字节范围和行号范围，以及其中时间戳的最小/最大值"""
+    __slots__ = ("start_offset", "end_offset", "first_line", "last_line", "min_time", "max_time", "bucket")
+
+    def __init__(self, start_offset: int, first_line: int, timestamp: Optional[int]):
+        self.start_offset = self.end_offset = start_offset
+        self.first_line = self.last_line = first_line
+        self.min_time = self.max_time = timestamp
+        self.bucket = timestamp // LOG_SEGMENT_SECONDS if timestamp is not None else None
+
+    def header(self) -> str:
+        lines = f"第{self.first_line}-{self.last_line}行"
+        if self.min_time is None:
+            return f"## {lines}"
+        return f"## {_format_time(self.min_time)} ~ {_format_time(self.max_time)} | {lines}"
+
+
+class LogFile:
+    """
+    一个日志文件的稀疏时间索引：按文件顺序排列的时间分段，查询时二分定位时间范围内的分段
+    支持跟随追加：记录已解析到的字节位置，文件变长时只解析新增的行
+    """
+
+    def __init__(self, filename: str, encoding: str, default_year: int):
+        self.filename = filename
+        self.encoding = encoding
+        self.default_year = default_year
+        self.segments: List[LogSegment] = []
+        self.head = b""
+        self.parsed_bytes = 0  # 已解析的完整行结束位置
+        self.line_count = 0
+        self.timestamped = 0  # 带时间戳的行数
+        self.ordered = True  # 分段的起始时间是否按文件顺序不减（可以二分查找）
+        self._floor: Optional[int] = None  # 之前各段起始时间的最大值
+        # 最后一行没有换行符（可能还在写入）时，解析它之前的状态，下次从这里继续
+        self._checkpoint: Optional[Tuple] = None
+        # 渲染时生成的稀疏时间索引：带时间的分段序号、起始时间、结束时间的前缀最大值；分段序号 -> 片段ID
+        self.timed: List[int] = []
+        self.starts: List[int] = []
+        self.max_ends: List[int] = []
+        self.chunk_ids: List[Optional[int]] = []
+        # 渲染好的段落（空分段没有段落）；上次渲染后可能变化的第一个分段，追加后只重新渲染从这里开始的分段
+        self.paragraphs: List[str] = []
+        self._stale_from = 0
+
+    def copy(self) -> "LogFile":
+        """供增量解析使用的副本：分段列表和最后一段是新对象，查询可以继续读取原对象"""
+        clone = copy.copy(self)
+        clone.segments = self.segments[:-1] + [copy.copy(segment) for segment in self.segments[-1:]]
+        return clone
+
+    def _check_order(self, timestamp: int):
+        if self._floor is not None and timestamp < self._floor:
+            self.ordered = False
+
+    def _add_line(self, line: bytes, offset: int):
+        self.line_count += 1
+        timestamp = parse_line_timestamp(line, self.default_year) if line.strip() else None
+        segment = self.segments[-1] if self.segments else None
+        size = segment.end_offset - segment.start_offset if segment is not None else 0
+        hard_cut = size >= LOG_SEGMENT_BYTES * _HARD_CUT_FACTOR and bool(line.strip())
+        if segment is None or hard_cut or (timestamp is not None and (
+                segment.bucket != timestamp // LOG_SEGMENT_SECONDS or size >= LOG_SEGMENT_BYTES)):
+            if segment is not None and segment.min_time is not None:
+                self._floor = max(self._floor or segment.min_time, segment.min_time)
+            # 多行条目被强制切开时，后一段沿用该条目的时间
+            start_time = timestamp if timestamp is not None or segment is None else segment.max_time
+            segment = LogSegment(offset, self.line_count, start_time)
+            self.segments.append(segment)
+            if start_time is not None:
+                self._check_order(start_time)
+        segment.end_offset = offset + len(line)
+        segment.last_line = self.line_count
+        if timestamp is not None:
+            self.timestamped += 1
+            if timestamp < segment.min_time:
+                segment.min_time = timestamp
+                self._check_order(timestamp)
+            segment.max_time = max(segment.max_time, timestamp)
+
+    def _save_checkpoint(self):
+        self._checkpoint = (len(self.segments), copy.copy(self.segments[-1]) if self.segments else None,
+                            self.line_count, self.timestamped, self.ordered, self._floor)
+
+    def _restore_checkpoint(self):
+        count, last, self.line_count, self.timestamped, self.ordered, self._floor = self._checkpoint
+        del self.segments[count:]
+        if last is not None:
+            self.segments[-1] = copy.copy(last)
+        self._checkpoint = None
+
+    def parse(self, f, size: int):
+        """从已解析的位置继续按行解析到文件末尾"""
+        if self._checkpoint is not None:
+            self._restore_checkpoint()
+        # 最后一段可能继续变长，之后的分段都是新增的
+        self._stale_from = min(self._stale_from, max(0, len(self.segments) - 1))
+        if not self.parsed_bytes:
+            self.head = f.read(_HEAD_BYTES)
+        f.seek(self.parsed_bytes)
+        offset = self.parsed_bytes
+        for line in f:
+            if offset + len(line) > size:
+                break
+            if not line.endswith(b"\n"):
+                self._save_checkpoint()
+                self._add_line(line, offset)
+                break
+            self._add_line(line, offset)
+            offset += len(line)
+            self.parsed_bytes = offset
+
+    def render(self, f) -> str:
+        """
+        渲染成文档：每个时间分段一段，段首标题注明时间范围和原文件行号，段内去掉空行
+        跟随追加时之前的段落直接复用，只从文件中读取并渲染上次的最后一段及新增的分段
+        同时生成查询用的稀疏时间索引（只读取分段的元数据，不读取内容）
+        """
+        stale = min(self._stale_from, len(self.segments))
+        chunk_ids = self.chunk_ids[:stale]
+        paragraphs = self.paragraphs[:sum(1 for chunk_id in chunk_ids if chunk_id is not None)]
+        base = self.segments[stale].start_offset if stale < len(self.segments) else 0
+        f.seek(base)
+        data = f.read(self.segments[-1].end_offset - base) if stale < len(self.segments) else b""
+        for segment in self.segments[stale:]:
+            chunk_ids.append(None)
+            text = data[segment.start_offset - base:segment.end_offset - base].decode(self.encoding, errors="replace")
+            lines = []
+            for line in text.split("\n"):
+                line = line.rstrip()
+                if line:
+                    lines.append(line if len(line) <= LOG_MAX_LINE_CHARS else line[:LOG_MAX_LINE_CHARS] + "…")
+            if lines:
+                chunk_ids[-1] = len(paragraphs)
+                paragraphs.append(segment.header() + "\n" + "\n".join(lines))
+        # 重新赋值而不是原地修改：增量解析用的是副本，查询可能还在读取原对象的列表
+        self.chunk_ids, self.paragraphs, self._stale_from = chunk_ids, paragraphs, len(self.segments)
+        self.timed = [segment_no for segment_no, segment in enumerate(self.segments)
+                      if segment.min_time is not None and self.chunk_ids[segment_no] is not None]
+        self.starts = [self.segments[segment_no].min_time for segment_no in self.timed]
+        self.max_ends = list(accumulate((self.segments[segment_no].max_time for segment_no in self.timed), max))
+        return "\n\n".join(paragraphs)
+
+    def _absolute(self, time_range: TimeRange) -> Optional[Tuple[float, float]]:
+        """不带日期的时间范围落到本文件时间范围内最后一天（没有重叠时返回None）"""
+        start, end, dated = time_range
+        if dated:
+            return start, end
+        if not self.max_ends:
+            return None
+        last = self.max_ends[-1]
+        day = last - last % _DAY
+        if day + start > last:
+            day -= _DAY
+        return day + start, day + end
+
+    def find(self, time_range: TimeRange) -> List[int]:
+        """与时间范围重叠的分段对应的片段ID，按文件顺序"""
+        window = self._absolute(time_range)
+        if window is None:
+            return []
+        low, high = window
+        # 结束时间的前缀最大值不减：之前的分段都在范围开始前结束；起始时间有序时再二分出范围结束后的分段
+        first = bisect_left(self.max_ends, low)
+        last = bisect_right(self.starts, high) if self.ordered else len(self.timed)
+        segments = self.segments
+        return [self.chunk_ids[segment_no] for segment_no in self.timed[first:last]
+                if segments[segment_no].min_time <= high and segments[segment_no].max_time >= low]
+
+    def describe(self) -> Dict:
+        return {
+            "lines": self.line_count,
+            "timestamped_lines": self.timestamped,
+            "segments": len(self.segments),
+            "ordered": self.ordered,
+            "parsed_bytes": self.parsed_bytes,
+            "from": _format_time(min(self.starts)) if self.starts else None,
+            "to": _format_time(self.max_ends[-1]) if self.max_ends else None,
+        }
+
+
+# -------------------------- 日志注册表 --------------------------
+class LogStore:
+    """各文档集合中已解析的日志：(集合目录, 相对路径) -> LogFile，用于跟随追加和按时间定位片段"""
+
+    def __init__(self):
+        self._logs: Dict[str, Dict[str, LogFile]] = {}
+        self._lock = threading.Lock()
+        self.incremental_loads = 0
+        self.full_loads = 0
+
+    def load(self, folder_path: str, relative_path: str) -> Optional[str]:
+        """
+        解析（或从上次的位置继续解析）日志并登记，返回渲染后的文档
+        文件变短或开头变化（被轮转、截断）时重新解析；二进制或超出大小上限时返回None
+        """
+        file_path = os.path.join(folder_path, relative_path)
+        folder = os.path.abspath(folder_path)
+        try:
+            stat = os.stat(file_path)
+            if stat.st_size > LOG_MAX_FILE_BYTES:
+                file_sniffer.stats.add("skipped_too_large")
+                self.remove(folder_path, relative_path)
+                return None
+            with open(file_path, "rb") as f:
+                head = f.read(max(_HEAD_BYTES, file_sniffer.SNIFF_BYTES))
+                previous = self._logs.get(folder, {}).get(relative_path)
+                if previous is not None and previous.parsed_bytes <= stat.st_size and \
+                        head[:len(previous.head)] == previous.head:
+                    log = previous.copy()
+                    self.incremental_loads += 1
+                else:
+                    encoding = file_sniffer.detect_encoding(head[:file_sniffer.SNIFF_BYTES])
+                    if encoding is None or encoding.startswith("utf-16"):
+                        file_sniffer.stats.add("skipped_binary")
+                        self.remove(folder_path, relative_path)
+                        return None
+                    log = LogFile(relative_path, encoding, time.localtime(stat.st_mtime).tm_year)
+                    self.full_loads += 1
+                f.seek(0)
+                log.parse(f, stat.st_size)
+                content = log.render(f)
+        except OSError:
+            file_sniffer.stats.add("skipped_error")
+            return None
+        with self._lock:
+            self._logs.setdefault(folder, {})[relative_path] = log
+        file_sniffer.stats.add("logs_loaded")
+        return content
+
+    def remove(self, folder_path: str, relative_path: str):
+        with self._lock:
+            self._logs.get(os.path.abspath(folder_path), {}).pop(relative_path, None)
+
+    def clear(self, folder_path: str):
+        with self._lock:
+            self._logs.pop(os.path.abspath(folder_path), None)
+
+    def get(self, folder_path: str, relative_path: str) -> Optional[LogFile]:
+        return self._logs.get(os.path.abspath(folder_path), {}).get(relative_path)
+
+    def resolve_query(self, folder_path: str, query: str, mentioned_files: List[str]) -> List[Tuple[str, int]]:
+        """
+        查询中的时间范围在日志中对应的 (文件名, 片段ID)：查询提到了日志文件时只查这些文件，否则查集合中所有日志
+        """
+        logs = self._logs.get(os.path.abspath(folder_path))
+        if not logs:
+            return []
+        ranges = parse_time_ranges(query)
+        if not ranges:
+            return []
+        targets = [filename for filename in mentioned_files if filename in logs] or list(logs)
+        found: List[Tuple[str, int]] = []
+        for filename in targets:
+            log = logs[filename]
+            for time_range in ranges:
+                found.extend((filename, segment_no) for segment_no in log.find(time_range))
+        return list(dict.fromkeys(found))
+
+    @staticmethod
+    def is_log_query(query: str, mentioned_files: List[str]) -> bool:
+        """查询是否针对日志：提到了日志文件，或带有"日志""报错""error"等词"""
+        return any(os.path.splitext(filename)[1].lower() in LOG_EXTENSIONS for filename in mentioned_files) or \
+            _LOG_QUERY_WORDS.search(query) is not None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "incremental_loads": self.incremental_loads,
+                "full_loads": self.full_loads,
+                "files": {folder: {filename: log.describe() for filename, log in logs.items()}
+                          for folder, logs in self._logs.items()},
+            }
+
+
+logs = LogStore()
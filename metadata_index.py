@@ -0,0 +1,231 @@
+import os
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+# 位图按片段序号的高位分块（每块 2^16 个片段），每块是一个整数位集；只为出现过的块分配空间
+_CONTAINER_BITS = 16
+_CONTAINER_MASK = (1 << _CONTAINER_BITS) - 1
+
+
+# -------------------------- 分块位图 --------------------------
+class Bitmap:
+    """
+    片段序号集合（roaring风格的分块位图）：高位 -> 低16位组成的整数位集
+    稀疏集合只占用涉及到的块，交、并、差逐块进行（整数位运算在C层完成）
+    """
+
+    __slots__ = ("containers",)
+
+    def __init__(self, containers: Optional[Dict[int, int]] = None):
+        self.containers: Dict[int, int] = containers or {}
+
+    @classmethod
+    def from_chunks(cls, chunk_nos: Iterable[int]) -> "Bitmap":
+        bitmap = cls()
+        for chunk_no in chunk_nos:
+            bitmap.add(chunk_no)
+        return bitmap
+
+    def add(self, chunk_no: int):
+        key = chunk_no >> _CONTAINER_BITS
+        self.containers[key] = self.containers.get(key, 0) | (1 << (chunk_no & _CONTAINER_MASK))
+
+    def discard(self, chunk_no: int):
+        key = chunk_no >> _CONTAINER_BITS
+        remaining = self.containers.get(key, 0) & ~(1 << (chunk_no & _CONTAINER_MASK))
+        if remaining:
+            self.containers[key] = remaining
+        else:
+            self.containers.pop(key, None)
+
+    def __contains__(self, chunk_no: int) -> bool:
+        return bool(self.containers.get(chunk_no >> _CONTAINER_BITS, 0) >> (chunk_no & _CONTAINER_MASK) & 1)
+
+    def __len__(self) -> int:
+        return sum(bin(bits).count("1") for bits in self.containers.values())
+
+    def __iter__(self) -> Iterator[int]:
+        for key in sorted(self.containers):
+            bits, base = self.containers[key], key << _CONTAINER_BITS
+            while bits:
+                low = bits & -bits
+                yield base + low.bit_length() - 1
+                bits ^= low
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        small, large = sorted((self.containers, other.containers), key=len)
+        result = {}
+        for key, bits in small.items():
+            common = bits & large.get(key, 0)
+            if common:
+                result[key] = common
+        return Bitmap(result)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        result = dict(self.containers)
+        for key, bits in other.containers.items():
+            result[key] = result.get(key, 0) | bits
+        return Bitmap(result)
+
+    def __isub__(self, other: "Bitmap") -> "Bitmap":
+        for key, bits in other.containers.items():
+            if key in self.containers:
+                remaining = self.containers[key] & ~bits
+                if remaining:
+                    self.containers[key] = remaining
+                else:
+                    del self.containers[key]
+        return self
+
+    def __ior__(self, other: "Bitmap") -> "Bitmap":
+        for key, bits in other.containers.items():
+            self.containers[key] = self.containers.get(key, 0) | bits
+        return self
+
+    def nbytes(self) -> int:
+        return sum((bits.bit_length() + 7) // 8 for bits in self.containers.values())
+
+
+def union(bitmaps: Iterable[Bitmap]) -> Bitmap:
+    result = Bitmap()
+    for bitmap in bitmaps:
+        result |= bitmap
+    return result
+
+
+# -------------------------- 元数据索引 --------------------------
+class MetadataIndex:
+    """
+    按文件元数据预先建好的片段位图：扩展名 -> 位图，目录（每一级上级目录）-> 位图，
+    以及按修改时间排序的文件列表（时间范围查询时合并范围内文件的位图）
+    提交历史的片段（每个片段一次提交，见git_history.py）另按作者、修改过的文件及其目录建位图，
+    时间范围按提交时间而不是分片文件的修改时间计算
+    查询时各条件的位图求交，得到允许参与打分的片段集合
+    """
+
+    def __init__(self):
+        self.file_chunks: Dict[str, Bitmap] = {}
+        self.extensions: Dict[str, Bitmap] = {}
+        self.directories: Dict[str, Bitmap] = {}
+        self.mtimes: Dict[str, float] = {}
+        self._by_mtime: List[Tuple[float, str]] = []
+        self.authors: Dict[str, Bitmap] = {}
+        self.touched: Dict[str, Bitmap] = {}
+        self.file_commits: Dict[str, List[Tuple[int, str, float, List[str]]]] = {}
+        self._by_commit_time: List[Tuple[float, int]] = []
+
+    @staticmethod
+    def _directories(filename: str) -> List[str]:
+        parts = filename.replace(os.sep, "/").split("/")[:-1]
+        return ["/".join(parts[:depth]) for depth in range(1, len(parts) + 1)]
+
+    @staticmethod
+    def _extension(filename: str) -> str:
+        return os.path.splitext(filename)[1].lower()
+
+    def _keys(self, filename: str) -> List[Tuple[Dict[str, Bitmap], str]]:
+        """文件所属的扩展名位图和各级目录位图"""
+        return [(self.extensions, self._extension(filename))] + \
+            [(self.directories, directory) for directory in self._directories(filename)]
+
+    def _touched_keys(self, paths: List[str]) -> Set[str]:
+        """提交修改过的文件及其各级目录"""
+        keys = set(paths)
+        for path in paths:
+            keys.update(self._directories(path))
+        return keys
+
+    def add_file(self, filename: str, chunk_nos: Iterable[int], mtime: Optional[float] = None,
+                 commits: Sequence[Tuple[int, str, float, List[str]]] = ()):
+        """commits: 提交历史分片中的 (片段序号, 作者, 提交时间, 修改的文件)"""
+        chunks = Bitmap.from_chunks(chunk_nos)
+        self.file_chunks[filename] = chunks
+        for bitmaps, key in self._keys(filename):
+            bitmap = bitmaps.setdefault(key, Bitmap())
+            bitmap |= chunks
+        if mtime is not None:
+            self.mtimes[filename] = mtime
+            position = bisect_left(self._by_mtime, (mtime, filename))
+            self._by_mtime.insert(position, (mtime, filename))
+        if commits:
+            self.file_commits[filename] = list(commits)
+            for chunk_no, author, timestamp, paths in commits:
+                self.authors.setdefault(author.lower(), Bitmap()).add(chunk_no)
+                for key in self._touched_keys(paths):
+                    self.touched.setdefault(key, Bitmap()).add(chunk_no)
+                insort(self._by_commit_time, (timestamp, chunk_no))
+
+    def remove_file(self, filename: str):
+        chunks = self.file_chunks.pop(filename, None)
+        if chunks is None:
+            return
+        for bitmaps, key in self._keys(filename):
+            bitmap = bitmaps[key]
+            bitmap -= chunks
+            if not bitmap.containers:
+                del bitmaps[key]
+        mtime = self.mtimes.pop(filename, None)
+        if mtime is not None:
+            position = bisect_left(self._by_mtime, (mtime, filename))
+            del self._by_mtime[position]
+        for chunk_no, author, timestamp, paths in self.file_commits.pop(filename, []):
+            for bitmaps, key in [(self.authors, author.lower())] + \
+                    [(self.touched, key) for key in self._touched_keys(paths)]:
+                bitmap = bitmaps[key]
+                bitmap.discard(chunk_no)
+                if not bitmap.containers:
+                    del bitmaps[key]
+            del self._by_commit_time[bisect_left(self._by_commit_time, (timestamp, chunk_no))]
+
+    def select(self, path_prefix: Optional[str] = None, extensions: Optional[Sequence[str]] = None,
+               modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+               author: Optional[str] = None) -> Optional[Bitmap]:
+        """
+        求满足所有条件的片段位图；没有任何条件时返回None（不过滤）
+        path_prefix: 目录（含子目录）或单个文件的相对路径；也包括修改过其中文件的提交
+        extensions: 扩展名列表，满足其一即可（"java" 与 ".java" 等价）
+        modified_after / modified_before: 文件修改时间或提交时间范围（时间戳，含边界）
+        author: 提交作者的姓名或邮箱（不区分大小写，部分匹配即可）
+        """
+        selected: List[Bitmap] = []
+        if path_prefix:
+            prefix = path_prefix.replace("\\", "/").strip("/")
+            if prefix.startswith("./"):
+                prefix = prefix[2:]
+            native = prefix.replace("/", os.sep)
+            selected.append(union(bitmap for bitmap in (self.directories.get(prefix) or self.file_chunks.get(native),
+                                                        self.touched.get(prefix)) if bitmap is not None))
+        if extensions:
+            wanted = {("." + ext.lstrip(".")).lower() for ext in extensions}
+            selected.append(union(self.extensions[ext] for ext in wanted if ext in self.extensions))
+        if modified_after is not None or modified_before is not None:
+            low = bisect_left(self._by_mtime, (modified_after, "")) if modified_after is not None else 0
+            high = bisect_right(self._by_mtime, (modified_before, "\U0010ffff")) \
+                if modified_before is not None else len(self._by_mtime)
+            selected.append(union(self.file_chunks[filename] for _, filename in self._by_mtime[low:high]))
+            low = bisect_left(self._by_commit_time, (modified_after, -1)) if modified_after is not None else 0
+            high = bisect_right(self._by_commit_time, (modified_before, float("inf"))) \
+                if modified_before is not None else len(self._by_commit_time)
+            selected[-1] |= Bitmap.from_chunks(chunk_no for _, chunk_no in self._by_commit_time[low:high])
+        if author:
+            wanted = author.lower()
+            selected.append(union(bitmap for key, bitmap in self.authors.items() if wanted in key))
+        if not selected:
+            return None
+        # 从最小的位图开始求交
+        selected.sort(key=lambda bitmap: len(bitmap.containers))
+        result = selected[0]
+        for bitmap in selected[1:]:
+            result = result & bitmap
+        return result
+
+    def snapshot(self) -> Dict:
+        return {
+            "extensions": len(self.extensions),
+            "directories": len(self.directories),
+            "commits": len(self._by_commit_time),
+            "authors": len(self.authors),
+            "bitmap_bytes": sum(bitmap.nbytes() for bitmaps in (self.extensions, self.directories, self.file_chunks,
+                                                                self.authors, self.touched)
+                                for bitmap in bitmaps.values()),
+        }
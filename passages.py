@@ -0,0 +1,153 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from query_analysis import tokenize
+from settings import PASSAGE_EXTRACTION, PASSAGE_MIN_CHARS, PASSAGE_WINDOW_CHARS, PASSAGE_MAX_WINDOWS
+
+# 摘录后仍超过原文该比例时不摘录（节省有限，保留完整上下文）
+PASSAGE_MAX_RATIO = 0.8
+# 窗口打分：覆盖到的不同查询词的权重之和，再加上每次命中的少量加分
+HIT_BONUS = 0.1
+
+# 句末标点（中英文），过长的行在这里切开
+_SENTENCE_END = re.compile(r"[。！？!?；;]+|\.(?=\s)")
+_LONG_LINE = 160
+
+
+class Unit:
+    """摘录的最小单位：一行，或长行中的一句"""
+    __slots__ = ("start", "end", "terms", "hits")
+
+    def __init__(self, start: int, end: int, terms: Set[str], hits: int):
+        self.start = start
+        self.end = end
+        self.terms = terms
+        self.hits = hits
+
+
+def split_units(content: str, weights: Dict[str, float]) -> List[Unit]:
+    units = []
+    offset = 0
+    for line in content.split("\n"):
+        cuts = [0]
+        if len(line) > _LONG_LINE:
+            cuts.extend(match.end() for match in _SENTENCE_END.finditer(line))
+        cuts.append(len(line))
+        for start, end in zip(cuts, cuts[1:]):
+            text = line[start:end]
+            if not text.strip():
+                continue
+            matched = [term for term in tokenize(text) if term in weights]
+            units.append(Unit(offset + start, offset + end, set(matched), len(matched)))
+        offset += len(line) + 1
+    return units
+
+
+def best_window(units: List[Unit], weights: Dict[str, float], covered: Set[str],
+                taken: Set[int]) -> Optional[Tuple[int, int, float]]:
+    """
+    字符数不超过PASSAGE_WINDOW_CHARS、首尾都是命中单位的连续窗口中，
+    新覆盖的查询词权重最高的一个（同分取更短的）；返回 (首单位, 尾单位, 得分)
+    """
+    best: Optional[Tuple[int, int, float]] = None
+    best_key = None
+    for first in range(len(units)):
+        if first in taken or not units[first].hits:
+            continue
+        terms: Set[str] = set()
+        hits = 0
+        for last in range(first, len(units)):
+            if last in taken or (last > first and units[last].end - units[first].start > PASSAGE_WINDOW_CHARS):
+                break
+            unit = units[last]
+            if not unit.hits:
+                continue
+            terms |= unit.terms
+            hits += unit.hits
+            gain = sum(weights[term] for term in terms - covered)
+            if gain <= 0:
+                continue
+            score = gain + HIT_BONUS * hits
+            key = (score, -(unit.end - units[first].start))
+            if best_key is None or key > best_key:
+                best, best_key = (first, last, score), key
+    return best
+
+
+def line_of(content: str, offset: int) -> int:
+    return content.count("\n", 0, offset)
+
+
+# -------------------------- 摘录 --------------------------
+class PassageExtractor:
+    """
+    按问题从检索到的片段中摘录最相关的窗口（查询词及同义词命中最密集的连续行/句），
+    附带片段所在的标题路径和摘录在原文件中的行号范围；统计提示词缩减的字符数
+    """
+
+    def __init__(self, enabled: bool = PASSAGE_EXTRACTION):
+        self.enabled = enabled
+        self.chunks = 0
+        self.excerpted = 0
+        self.chars_before = 0
+        self.chars_after = 0
+
+    def extract(self, item: Dict, weights: Dict[str, float]) -> Dict:
+        """返回替换了content的新结果（带 lines: [(起始行, 结束行)]）；不需要摘录时原样返回"""
+        content = item["content"]
+        self.chunks += 1
+        self.chars_before += len(content)
+        excerpt = self._excerpt(item, weights) if self.enabled else None
+        if excerpt is None:
+            self.chars_after += len(content)
+            return item
+        self.excerpted += 1
+        self.chars_after += len(excerpt["content"])
+        return {**item, **excerpt}
+
+    def _excerpt(self, item: Dict, weights: Dict[str, float]) -> Optional[Dict]:
+        content = item["content"]
+        # 函数/类的完整定义（片段ID带行号范围）始终完整保留
+        if len(content) < PASSAGE_MIN_CHARS or not weights or ":" in str(item["chunk_id"]):
+            return None
+        units = split_units(content, weights)
+        windows: List[Tuple[int, int]] = []
+        covered: Set[str] = set()
+        taken: Set[int] = set()
+        for _ in range(PASSAGE_MAX_WINDOWS):
+            window = best_window(units, weights, covered, taken)
+            if window is None:
+                break
+            first, last, _ = window
+            windows.append((first, last))
+            for unit_no in range(first, last + 1):
+                covered |= units[unit_no].terms
+                taken.add(unit_no)
+        if not windows:
+            return None  # 没有命中查询词（按文件名或符号选中的片段），保留原文
+
+        windows.sort()
+        spans = [(units[first].start, units[last].end) for first, last in windows]
+        if sum(end - start for start, end in spans) > len(content) * PASSAGE_MAX_RATIO:
+            return None
+        start_line = item.get("start_line") or 1
+        lines = [(start_line + line_of(content, start), start_line + line_of(content, end))
+                 for start, end in spans]
+        parts = [content[start:end].strip() for start, end in spans]
+        return {"content": "\n……\n".join(parts), "lines": lines, "excerpt": True}
+
+    def extract_all(self, relevant_content: List[Dict], weights: Dict[str, float]) -> List[Dict]:
+        return [self.extract(item, weights) for item in relevant_content]
+
+    def snapshot(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "chunks": self.chunks,
+            "excerpted": self.excerpted,
+            "chars_before": self.chars_before,
+            "chars_after": self.chars_after,
+            "shrink_ratio": round(1 - self.chars_after / self.chars_before, 4) if self.chars_before else None,
+        }
+
+
+extractor = PassageExtractor()
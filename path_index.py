@@ -0,0 +1,162 @@
+import re
+from typing import Dict, Iterable, List, Set
+
+# 查询中可能是文件名/路径的片段：带扩展名的词，或包含 "/" 的路径片段，或反引号括起来的内容
+_MENTION_PATTERN = re.compile(
+    r"`([^`\s]+)`"
+    r"|([\w\-./一-鿿]+\.[a-zA-Z0-9]{1,8})(?![a-zA-Z0-9_])"
+    r"|((?:[\w\-.一-鿿]+/)+[\w\-.一-鿿]*)"
+)
+# n-gram长度
+NGRAM_SIZE = 3
+
+
+def normalize_path(path: str) -> str:
+    return path.replace("\\", "/").strip("/").lower()
+
+
+def _ngrams(text: str) -> Set[str]:
+    if len(text) < NGRAM_SIZE:
+        return {text} if text else set()
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def extract_path_mentions(query: str) -> List[str]:
+    """从查询中提取疑似文件名或路径的片段"""
+    mentions = []
+    for match in _MENTION_PATTERN.finditer(query):
+        mention = next(group for group in match.groups() if group)
+        mention = mention.strip(".,;:!?，。；：！？")
+        if mention and mention not in mentions:
+            mentions.append(mention)
+    return mentions
+
+
+# -------------------------- 路径字典树 --------------------------
+class _TrieNode:
+    __slots__ = ("children", "paths")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.paths: Dict[str, None] = {}  # 以该节点为后缀的所有路径（保持插入顺序，删除为O(1)）
+
+
+class PathIndex:
+    """
+    相对路径索引
+    - 字典树：按路径组件倒序插入（文件名在根部），支持 "app.py"、"utils/app.py" 这样的后缀匹配
+    - n-gram索引：文件名的三元组，用于查询中文件名和其他文字粘连的情况
+    """
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self._root = _TrieNode()
+        self._ngrams: Dict[str, Set[str]] = {}
+        self._dirs: Dict[str, Set[str]] = {}  # 目录前缀 -> 其下所有路径
+        self._originals: Dict[str, str] = {}  # 规范化路径 -> 原始路径
+        for path in paths:
+            self.add(path)
+
+    def __len__(self) -> int:
+        return len(self._originals)
+
+    def add(self, path: str):
+        key = normalize_path(path)
+        if not key or key in self._originals:
+            return
+        self._originals[key] = path
+        node = self._root
+        for component in reversed(key.split("/")):
+            node = node.children.setdefault(component, _TrieNode())
+            node.paths[key] = None
+        basename = key.rsplit("/", 1)[-1]
+        for gram in _ngrams(basename):
+            self._ngrams.setdefault(gram, set()).add(key)
+        for directory in self._parent_dirs(key):
+            self._dirs.setdefault(directory, set()).add(key)
+
+    @staticmethod
+    def _parent_dirs(key: str) -> List[str]:
+        components = key.split("/")[:-1]
+        return ["/".join(components[:i]) for i in range(1, len(components) + 1)]
+
+    def remove(self, path: str):
+        key = normalize_path(path)
+        if self._originals.pop(key, None) is None:
+            return
+        node = self._root
+        for component in reversed(key.split("/")):
+            parent, node = node, node.children.get(component)
+            if node is None:
+                break
+            node.paths.pop(key, None)
+            if not node.paths:
+                # 该后缀下已没有路径，整棵子树都可以删除
+                del parent.children[component]
+                break
+        basename = key.rsplit("/", 1)[-1]
+        for gram in _ngrams(basename):
+            paths = self._ngrams.get(gram)
+            if paths is not None:
+                paths.discard(key)
+                if not paths:
+                    del self._ngrams[gram]
+        for directory in self._parent_dirs(key):
+            paths = self._dirs.get(directory)
+            if paths is not None:
+                paths.discard(key)
+                if not paths:
+                    del self._dirs[directory]
+
+    def lookup_suffix(self, fragment: str) -> List[str]:
+        """路径后缀匹配（按完整组件）：'app.py' 或 'src/app.py'"""
+        key = normalize_path(fragment)
+        if not key:
+            return []
+        node = self._root
+        for component in reversed(key.split("/")):
+            node = node.children.get(component)
+            if node is None:
+                return []
+        return [self._originals[p] for p in node.paths]
+
+    def lookup_prefix(self, fragment: str) -> List[str]:
+        """目录前缀匹配：'docs/' 匹配docs目录下的所有文件"""
+        key = normalize_path(fragment)
+        return sorted(self._originals[p] for p in self._dirs.get(key, ()))
+
+    def lookup_embedded(self, text: str) -> List[str]:
+        """文件名作为子串出现在text中（如 '看看mysql中的事务.md'），返回最长的匹配"""
+        key = text.lower()
+        counts: Dict[str, int] = {}
+        for gram in _ngrams(key):
+            for path in self._ngrams.get(gram, ()):
+                counts[path] = counts.get(path, 0) + 1
+        best: List[str] = []
+        best_length = 0
+        for path, count in counts.items():
+            basename = path.rsplit("/", 1)[-1]
+            if count < len(_ngrams(basename)) or basename not in key:
+                continue
+            if len(basename) > best_length:
+                best, best_length = [path], len(basename)
+            elif len(basename) == best_length:
+                best.append(path)
+        return [self._originals[p] for p in best]
+
+    def resolve(self, mention: str) -> List[str]:
+        """解析单个文件名/路径片段"""
+        matches = self.lookup_suffix(mention)
+        if not matches and mention.endswith("/"):
+            matches = self.lookup_prefix(mention)
+        if not matches:
+            matches = self.lookup_embedded(mention)
+        return matches
+
+    def resolve_query(self, query: str) -> List[str]:
+        """解析查询中提到的所有文件，按出现顺序去重"""
+        resolved: List[str] = []
+        for mention in extract_path_mentions(query):
+            for path in self.resolve(mention):
+                if path not in resolved:
+                    resolved.append(path)
+        return resolved
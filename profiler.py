@@ -0,0 +1,187 @@
+import cProfile
+import io
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from settings import (PROFILING_ENABLED, PROFILING_ADMIN_TOKEN, PROFILE_MAX_SECONDS, PROFILE_SAMPLE_INTERVAL,
+                      PROFILE_KEEP_REQUESTS)
+
+Stack = Tuple[str, ...]
+
+
+class ProfilerBusy(Exception):
+    """已有分析正在进行"""
+
+
+def check_admin_token(token: Optional[str]) -> bool:
+    return bool(PROFILING_ADMIN_TOKEN) and token is not None and \
+        secrets.compare_digest(token, PROFILING_ADMIN_TOKEN)
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# -------------------------- 采样分析 --------------------------
+class SamplingProfiler:
+    """
+    统计采样分析器：在独立线程中按固定间隔读取所有线程的当前调用栈（sys._current_frames），
+    不插桩、不影响被采样代码的执行，只在采样期间产生开销
+    结果为墙钟时间：等待I/O的线程（如空闲的事件循环）同样会被采到
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+
+    def sample(self, seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> Dict:
+        """阻塞采样seconds秒，返回 {"stacks": Counter[(线程名, 栈底..栈顶)], "samples", "interval", "duration"}"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("已有采样正在进行")
+        try:
+            self.runs += 1
+            me = threading.get_ident()
+            stacks: Counter = Counter()
+            samples = 0
+            start = time.monotonic()
+            deadline = start + min(seconds, PROFILE_MAX_SECONDS)
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack: List[str] = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    stacks[tuple(reversed(stack))] += 1
+                samples += 1
+                time.sleep(interval)
+            return {"stacks": stacks, "samples": samples, "interval": interval,
+                    "duration": time.monotonic() - start}
+        finally:
+            self._lock.release()
+
+
+def to_collapsed(result: Dict) -> str:
+    """折叠栈格式（flamegraph.pl / speedscope / inferno 均可读取）：每行 "帧;帧;帧 次数" """
+    return "\n".join(f"{';'.join(stack)} {count}" for stack, count in result["stacks"].most_common()) + "\n"
+
+
+def to_speedscope(result: Dict, name: str = "rag") -> Dict:
+    """speedscope 文件格式，每个线程一个sampled profile，权重单位为秒"""
+    frames: List[Dict] = []
+    frame_index: Dict[str, int] = {}
+    threads: Dict[str, Tuple[List[List[int]], List[float]]] = OrderedDict()
+    for stack, count in result["stacks"].most_common():
+        thread_name, calls = stack[0], stack[1:]
+        indexes = []
+        for call in calls:
+            if call not in frame_index:
+                frame_index[call] = len(frames)
+                frames.append({"name": call})
+            indexes.append(frame_index[call])
+        samples, weights = threads.setdefault(thread_name, ([], []))
+        samples.append(indexes)
+        weights.append(count * result["interval"])
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "rag-profiler",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+            for thread_name, (samples, weights) in threads.items()
+        ],
+    }
+
+
+# -------------------------- 单请求cProfile --------------------------
+# 正在分析的请求在工作线程中的分析结果；asyncio.to_thread 会复制上下文，工作线程中也能取到
+_worker_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar("worker_profiles", default=None)
+
+
+def profiled(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    在工作线程中执行func（用法：asyncio.to_thread(profiled, func, ...)）
+    cProfile只记录开启它的线程，所在请求正在分析时，这里为该线程单独开启分析，结束后计入请求的结果
+    """
+    profiles = _worker_profiles.get()
+    if profiles is None:
+        return func(*args, **kwargs)
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        profiles.append(profile)
+
+
+class RequestProfiles:
+    """
+    单请求确定性分析（cProfile），请求头 X-Profile: 1 开启
+    同一时间只分析一个请求（cProfile不能嵌套），其间同一线程上并发执行的其他请求也会被计入；
+    请求中通过 profiled 放到工作线程执行的部分单独分析，合并到同一份结果中
+    """
+
+    def __init__(self, keep: int = PROFILE_KEEP_REQUESTS):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[str, str]" = OrderedDict()
+        self._workers: List[cProfile.Profile] = []
+        self._context_token = None
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """开始分析，已有请求在分析时返回None；需在请求处理所在的上下文中调用"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        self._workers = []
+        self._context_token = _worker_profiles.set(self._workers)
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile: cProfile.Profile, label: str, limit: int = 60) -> str:
+        """结束分析，保存按累计耗时排序的统计文本（含工作线程），返回结果ID"""
+        try:
+            profile.disable()
+            _worker_profiles.reset(self._context_token)
+            workers = list(self._workers)
+        finally:
+            self._lock.release()
+        output = io.StringIO()
+        output.write(f"{label}\n\n")
+        stats = pstats.Stats(profile, stream=output)
+        for worker in workers:
+            stats.add(worker)
+        stats.sort_stats("cumulative").print_stats(limit)
+        profile_id = secrets.token_hex(8)
+        self._results[profile_id] = output.getvalue()
+        while len(self._results) > self.keep:
+            self._results.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[str]:
+        return self._results.get(profile_id)
+
+
+sampler = SamplingProfiler()
+request_profiles = RequestProfiles()
@@ -0,0 +1,126 @@
+import re
+from typing import Dict, Iterable, List, Optional
+
+# -------------------------- 停用词 --------------------------
+# 英文停用词（疑问词、冠词、助动词等）
+STOP_WORDS_EN = {
+    "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "at", "by", "for", "with",
+    "from", "as", "is", "are", "was", "were", "be", "been", "being", "do", "does", "did", "done",
+    "have", "has", "had", "it", "its", "this", "that", "these", "those", "there", "here",
+    "what", "which", "who", "whom", "whose", "when", "where", "why", "how",
+    "i", "me", "my", "we", "our", "you", "your", "he", "she", "they", "them", "their",
+    "can", "could", "should", "would", "will", "shall", "may", "might", "must",
+    "about", "into", "than", "then", "so", "not", "no", "yes", "all", "any", "some",
+    "please", "tell", "explain", "show", "describe", "mean", "means",
+}
+
+# 中文停用词：多字词按最长匹配作为分隔符切开中文串；单字词（的、是、都……）常出现在词中（目的、总是、首都），
+# 只在切开后单独成段时才去除
+STOP_WORDS_ZH = {
+    "什么", "怎么", "怎样", "如何", "为什么", "哪些", "哪个", "是否", "一下", "请问", "讲了", "说了",
+    "这个", "那个", "这些", "那些", "我们", "你们", "他们", "一个", "可以", "以及", "还是", "或者",
+    "的", "了", "吗", "呢", "吧", "啊", "是", "和", "与", "及", "或", "也", "都", "就",
+    "我", "你", "他", "她", "它", "请", "中讲", "中的", "里的", "当中",
+}
+
+_ZH_STOP_PATTERN = re.compile("|".join(sorted((re.escape(word) for word in STOP_WORDS_ZH if len(word) > 1),
+                                              key=len, reverse=True)))
+# 短缩写（如 b/s、i/o、tcp/ip）作为整体保留，其余英文按单词切分
+_TOKEN_PATTERN = re.compile(r"(?<![a-z0-9_/])[a-z0-9]{1,3}/[a-z0-9]{1,3}(?![a-z0-9_/]|\.[a-z0-9])|[a-z0-9_]+|[一-鿿]+")
+_CJK_PATTERN = re.compile(r"[一-鿿]")
+
+# 同义词扩展出的词相对原词的权重
+SYNONYM_WEIGHT = 0.6
+
+# 默认同义词组（同一组内的写法互相扩展），可通过 config/synonyms_config.json 覆盖
+DEFAULT_SYNONYMS = [
+    ["B/S", "浏览器/服务器", "browser/server"],
+    ["C/S", "客户端/服务器", "client/server"],
+    ["js", "javascript"],
+    ["ts", "typescript"],
+    ["数据库", "database", "db"],
+    ["事务", "transaction"],
+]
+
+
+# -------------------------- 分词 --------------------------
+def _cjk_terms(run: str) -> List[str]:
+    """中文串：先按多字停用词切开，再生成二元组（单字片段不是停用词时保留单字）"""
+    terms = []
+    for segment in _ZH_STOP_PATTERN.split(run):
+        if len(segment) == 1:
+            if segment not in STOP_WORDS_ZH:
+                terms.append(segment)
+        else:
+            terms.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return terms
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    文档和查询共用的分词：英文/数字按单词切分并去除英文停用词和单个字母，
+    中文按停用词切段后生成二元组
+    """
+    terms = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if _CJK_PATTERN.match(token):
+            terms.extend(_cjk_terms(token))
+        elif len(token) > 1 and token not in STOP_WORDS_EN:
+            terms.append(token)
+    return terms
+
+
+# -------------------------- 同义词 --------------------------
+class SynonymTable:
+    """同义词表：短语 -> 同组其他短语的词项"""
+
+    def __init__(self, groups: Iterable[Iterable[str]]):
+        self._phrases: Dict[str, List[List[str]]] = {}
+        for group in groups:
+            phrases = [p for p in (str(p).strip().lower() for p in group) if p]
+            for phrase in phrases:
+                others = [tokenize(other) for other in phrases if other != phrase]
+                self._phrases.setdefault(phrase, []).extend(t for t in others if t)
+        # 英文短语需要完整匹配单词边界（避免 "ts" 命中 "requests"）
+        self._patterns = {
+            phrase: re.compile(r"(?<![a-z0-9_])" + re.escape(phrase) + r"(?![a-z0-9_])")
+            for phrase in self._phrases
+        }
+
+    def expand(self, query_lower: str) -> List[str]:
+        """返回查询中出现的短语对应的同义词项"""
+        expanded = []
+        for phrase, alternatives in self._phrases.items():
+            if self._patterns[phrase].search(query_lower):
+                for terms in alternatives:
+                    expanded.extend(terms)
+        return expanded
+
+
+_default_table: Optional[SynonymTable] = None
+
+
+def default_synonym_table() -> SynonymTable:
+    global _default_table
+    if _default_table is None:
+        _default_table = SynonymTable(DEFAULT_SYNONYMS)
+    return _default_table
+
+
+# -------------------------- 查询分析 --------------------------
+def analyze_query(query: str, synonyms: Optional[SynonymTable] = None) -> Dict[str, float]:
+    """
+    查询分析：分词 + 停用词过滤 + 同义词扩展
+    返回去重后的 {词项: 查询权重}；原词权重为出现次数，同义词为 SYNONYM_WEIGHT
+    """
+    if synonyms is None:
+        synonyms = default_synonym_table()
+
+    weights: Dict[str, float] = {}
+    for term in tokenize(query):
+        weights[term] = weights.get(term, 0.0) + 1.0
+    for term in synonyms.expand(query.lower()):
+        if term not in weights:
+            weights[term] = SYNONYM_WEIGHT
+    return weights
@@ -0,0 +1,83 @@
+from typing import Dict, List, Optional, Tuple
+
+import log_index
+import tabular
+from metadata_index import Bitmap
+from query_analysis import SynonymTable, analyze_query
+from search_index import ChunkIndex
+
+
+# -------------------------- 检索计划 --------------------------
+class QueryPlan:
+    """
+    一个问题在某份索引上的检索计划：单条查询（/query、会话）和批量检索共用，保证两者的检索流程相同
+    片段编号只在生成计划时持有的 index.lock 内有效，检索也要在同一次加锁内完成
+    """
+
+    __slots__ = ("terms", "mentioned_files", "priority_chunks", "allowed", "boost", "log_chunks")
+
+    def __init__(self, terms: Dict[str, float], mentioned_files: List[str], priority_chunks: List[int],
+                 allowed: Optional[Bitmap], boost: Optional[Tuple[Bitmap, float]], log_chunks: List[int]):
+        self.terms = terms                      # 分析后的查询词权重
+        self.mentioned_files = mentioned_files  # 查询中提到的文件，优先从中取片段
+        self.priority_chunks = priority_chunks  # 符号定义、表格记录、日志时段等直接定位的片段
+        self.allowed = allowed                  # 元数据过滤（及日志时段）得到的片段位图
+        self.boost = boost                      # 顺带提到时间时，对该时段日志片段的加权
+        self.log_chunks = log_chunks            # 查询时间范围内的日志片段
+
+    @property
+    def is_plain(self) -> bool:
+        """只按查询词打分（没有直接定位、过滤和加权），可以与其他问题一起批量打分"""
+        return not self.mentioned_files and not self.priority_chunks and self.allowed is None and \
+            self.boost is None
+
+    def search(self, index: ChunkIndex, top_k: int) -> List[Dict]:
+        return index.search(self.terms, top_k, priority_files=self.mentioned_files,
+                            priority_chunks=self.priority_chunks, allowed=self.allowed, boost=self.boost)
+
+
+def plan_query(index: ChunkIndex, query: str, top_k: int, synonyms: Optional[SynonymTable] = None,
+               folder_path: Optional[str] = None, filters: Optional[Dict] = None) -> Optional[QueryPlan]:
+    """
+    查询分析（停用词、同义词、词项权重），以及不经打分直接定位的片段：
+    查询中提到的文件（如 `app.py`）通过路径索引直接定位，优先返回其片段
+    查询中提到的符号（如 load_documents）通过符号表定位，返回完整定义
+    查询中提到的表格主键值、表格文件的"第N行"，直接定位到记录所在的片段
+    查询中的时间范围（如"14:05左右"），通过日志的时间索引直接定位到该时段的片段：
+    查询针对日志时（提到日志文件或"日志""报错"等词）只在这些片段中打分，否则这些片段只在排序中加权
+    filters: 元数据过滤条件（见metadata.select），打分前先用位图求出允许的片段
+    folder_path: 索引所属的集合，表格和日志按集合登记，不传时跳过这两步
+    调用方需持有 index.lock；确定没有结果时返回None
+    """
+    if not len(index):
+        return None
+    allowed = index.metadata.select(**filters) if filters else None
+    if allowed is not None and not allowed.containers:
+        return None
+
+    terms = analyze_query(query, synonyms)
+    mentioned_files = index.paths.resolve_query(query)
+    priority_chunks = index.resolve_symbols(query)
+    log_chunks: List[int] = []
+    boost: Optional[Tuple[Bitmap, float]] = None
+    if folder_path is not None:
+        for filename, chunk_id in tabular.tables.resolve_query(folder_path, query, mentioned_files):
+            chunk_no = index.find_chunk(filename, chunk_id)
+            if chunk_no is not None and chunk_no not in priority_chunks:
+                priority_chunks.append(chunk_no)
+        log_chunks = [index.find_chunk(filename, chunk_id)
+                      for filename, chunk_id in log_index.logs.resolve_query(folder_path, query, mentioned_files)]
+        log_chunks = [chunk_no for chunk_no in log_chunks if chunk_no is not None]
+        if log_chunks and not log_index.logs.is_log_query(query, mentioned_files):
+            # 时间只是顺带提到（如"10:30执行备份"），不能排除其他文档
+            boost = (Bitmap.from_chunks(log_chunks), log_index.LOG_WINDOW_BOOST)
+        elif log_chunks and len(log_chunks) <= top_k:
+            priority_chunks.extend(chunk_no for chunk_no in log_chunks if chunk_no not in priority_chunks)
+        elif log_chunks:
+            window = Bitmap.from_chunks(log_chunks)
+            allowed = window if allowed is None else allowed & window
+            if not allowed.containers:
+                return None
+    if not terms and not mentioned_files and not priority_chunks:
+        return None
+    return QueryPlan(terms, mentioned_files, priority_chunks, allowed, boost, log_chunks)
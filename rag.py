@@ -1,22 +1,26 @@
+import argparse
+import asyncio
+import contextlib
 import requests
 import json
 import os
+import sys
 from typing import List, Dict, Optional
-from dotenv import load_dotenv  # 导入读取.env文件的库
 
-# -------------------------- 加载环境变量 --------------------------
-# 加载.env文件中的配置（如果不存在.env文件，会使用系统环境变量）
-load_dotenv()  # 关键：加载.env文件
+import batch_query
+import llm_client
+import passages
+from query_analysis import analyze_query, default_synonym_table
+from search_index import ChunkIndex
+# 从环境变量中读取配置（settings 加载.env文件，如果不存在.env文件，会使用系统环境变量）
+from settings import OPENROUTER_API_KEY, API_URL, MODEL_NAME, DOCS_FOLDER
 
-# 从环境变量中读取配置（支持.env文件和系统环境变量）
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-API_URL = os.getenv("API_URL")
-MODEL_NAME = os.getenv("MODEL_NAME")
-DOCS_FOLDER = os.getenv("DOCS_FOLDER", "docs")  # 默认值：docs（防止未配置）
+# -------------------------- 配置 --------------------------
+FOLLOW_UP_QUERY = "Are you sure? Think carefully."  # 第二轮追问
 
 # 验证必填配置是否存在
-required_env_vars = ["OPENROUTER_API_KEY", "API_URL", "MODEL_NAME"]
-missing_vars = [var for var in required_env_vars if not os.getenv(var)]
+required_env_vars = {"OPENROUTER_API_KEY": OPENROUTER_API_KEY, "API_URL": API_URL, "MODEL_NAME": MODEL_NAME}
+missing_vars = [var for var, value in required_env_vars.items() if not value]
 if missing_vars:
     raise ValueError(f"缺少必要的环境变量：{', '.join(missing_vars)}。请检查.env文件是否配置正确。")
 
@@ -99,11 +103,17 @@ def build_rag_prompt(query: str, relevant_content: List[Dict[str, str]]) -> str:
         # 没有检索到相关内容，直接返回原始查询
         return query
     
+    # 长片段只保留与问题最相关的部分
+    relevant_content = passages.extractor.extract_all(relevant_content, analyze_query(query, default_synonym_table()))
+    
     # 格式化相关内容
     context_parts = []
     for item in relevant_content:
+        location = f"片段 {item['chunk_id']}"
+        if item.get("lines"):
+            location += ", 第" + "、".join(f"{start}-{end}" for start, end in item["lines"]) + "行"
         context_parts.append(
-            f"来自文档 '{item['filename']}' (片段 {item['chunk_id']}):\n"
+            f"来自文档 '{item['filename']}' ({location}):\n"
             f"{item['content']}\n"
             "---"
         )
@@ -131,7 +141,7 @@ def main():
     
     # 2. 定义用户查询（可以修改为任意问题）
     user_query = "mysql中的事务.md 中讲了什么?"
-    follow_up_query = "Are you sure? Think carefully."
+    follow_up_query = FOLLOW_UP_QUERY
     
     # 3. 检索相关文档内容
     print("\n=== 检索相关内容 ===")
@@ -224,5 +234,48 @@ def main():
     print("第二次回答:")
     print(assistant_content2)  # 只输出content部分
 
+# -------------------------- 批量问答 --------------------------
+def run_batch(input_path: str, output_path: Optional[str] = None,
+              concurrency: int = batch_query.BATCH_LLM_CONCURRENCY, retrieve_only: bool = False):
+    """
+    批量问答：文档只加载一次并建立索引，所有问题批量检索后以有限并发调用LLM
+    输入为JSONL文件（每行 {"id", "query", "top_k"}），结果按完成顺序逐行写出（默认写到标准输出）
+    """
+    # 加载过程的日志输出到标准错误，避免混入JSONL结果
+    with contextlib.redirect_stdout(sys.stderr):
+        print("=== 加载文档 ===")
+        index = ChunkIndex.build(load_documents(DOCS_FOLDER))
+    with open(input_path, "r", encoding="utf-8-sig") as f:
+        items = batch_query.parse_jsonl(f)
+    print(f"共 {len(items)} 个问题，LLM并发数 {concurrency}", file=sys.stderr)
+
+    async def run():
+        output = open(output_path, "w", encoding="utf-8") if output_path else sys.stdout
+        try:
+            async for result in batch_query.run_batch(items, index, OPENROUTER_API_KEY, build_rag_prompt,
+                                                      FOLLOW_UP_QUERY, default_synonym_table(),
+                                                      concurrency, retrieve_only, folder_path=DOCS_FOLDER):
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+        finally:
+            if output_path:
+                output.close()
+            await llm_client.transport.aclose()
+
+    asyncio.run(run())
+    # 提示词缩减统计（与 PASSAGE_EXTRACTION=false 的结果对比回答质量）
+    print(f"片段摘录: {json.dumps(passages.extractor.snapshot(), ensure_ascii=False)}", file=sys.stderr)
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="RAG问答")
+    parser.add_argument("--batch", metavar="QUERIES.jsonl", help="批量问答：JSONL问题文件")
+    parser.add_argument("--output", metavar="RESULTS.jsonl", help="批量结果输出文件（默认标准输出）")
+    parser.add_argument("--concurrency", type=int, default=batch_query.BATCH_LLM_CONCURRENCY,
+                        help="批量问答时同时进行的LLM对话数")
+    parser.add_argument("--retrieve-only", action="store_true", help="批量模式下只检索，不调用LLM")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args.batch, args.output, args.concurrency, args.retrieve_only)
+    else:
+        main()
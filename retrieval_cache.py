@@ -0,0 +1,150 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from settings import RETRIEVAL_CACHE_SIZE
+
+# 缓存的检索结果：[(文件名, 片段ID, 得分, 命中词数), ...]
+RankedIds = List[Tuple[str, int, float, int]]
+
+
+def collection_key(folder_path: str) -> str:
+    """文档集合的唯一标识（规范化后的绝对路径）"""
+    return os.path.normcase(os.path.abspath(folder_path))
+
+
+# -------------------------- 语料版本号 --------------------------
+class CorpusGenerations:
+    """
+    每个文档集合一个单调递增的版本号
+    上传、删除文件以及仓库更新时递增，缓存按版本号失效
+    """
+
+    def __init__(self):
+        self._generations: Dict[str, int] = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def get(self, folder_path: str) -> int:
+        return self._generations.get(collection_key(folder_path), 0)
+
+    def bump(self, folder_path: str) -> int:
+        key = collection_key(folder_path)
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+        for listener in self._listeners:
+            listener(key, generation)
+        return generation
+
+    def subscribe(self, listener):
+        """注册版本变化回调：listener(集合标识, 新版本号)"""
+        self._listeners.append(listener)
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self._generations)
+
+
+generations = CorpusGenerations()
+
+
+# -------------------------- 检索结果缓存 --------------------------
+class RetrievalCache:
+    """
+    有界LRU缓存：(集合, 版本号, 规范化查询词, top_k) -> 排序后的片段ID列表
+    集合版本号变化时立即清除该集合的全部缓存条目
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, RankedIds]" = OrderedDict()
+        self._sizes: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.memory_bytes = 0
+
+    @staticmethod
+    def make_key(folder_path: str, tokens, top_k: int) -> Tuple:
+        return (collection_key(folder_path), generations.get(folder_path), tuple(sorted(tokens)), top_k)
+
+    @staticmethod
+    def _estimate_size(key: Tuple, value: RankedIds) -> int:
+        """粗略估算一个条目占用的内存（字节）"""
+        size = sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+        size += sum(sys.getsizeof(token) for token in key[2])
+        size += sys.getsizeof(value)
+        for item in value:
+            size += sys.getsizeof(item) + sum(sys.getsizeof(part) for part in item)
+        return size
+
+    def get(self, key: Tuple) -> Optional[RankedIds]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple, value: RankedIds):
+        if self.max_entries <= 0:
+            return
+        # 写入前版本号已变化，说明结果基于旧语料，直接丢弃
+        if key[1] != generations.snapshot().get(key[0], 0):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            size = self._estimate_size(key, value)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self.memory_bytes += size
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: Tuple):
+        self._entries.pop(key, None)
+        self.memory_bytes -= self._sizes.pop(key, 0)
+
+    def invalidate(self, collection: str, generation: Optional[int] = None):
+        """清除某个集合中版本号低于generation的条目（不传则清除全部）"""
+        with self._lock:
+            stale = [key for key in self._entries
+                     if key[0] == collection and (generation is None or key[1] < generation)]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.memory_bytes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "memory_bytes": self.memory_bytes,
+            "generations": generations.snapshot(),
+        }
+
+
+cache = RetrievalCache()
+generations.subscribe(cache.invalidate)
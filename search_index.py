@@ -0,0 +1,818 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from dedup import DEDUP_ENABLED, NearDuplicateDetector
+from git_history import is_history_file, parse_commit_chunk
+from metadata_index import Bitmap, MetadataIndex
+from path_index import PathIndex
+from query_analysis import tokenize
+from segments import Segment, build_segment, merge_segments, pack_posting, pick_merge
+from settings import INDEX_FINGERPRINT_INTERVAL
+from symbol_index import Symbol, SymbolTable, extract_symbols, symbol_source
+import retrieval_cache
+
+# -------------------------- 打分参数 --------------------------
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 命中标题（所在章节的标题路径）时的额外权重
+HEADING_BOOST = 1.5
+# 命中文件名时的额外权重
+FILENAME_BOOST = 2.0
+# 出现在超过该比例片段中的词项视为区分度过低，有其他词项时跳过
+MAX_DF_RATIO = 0.5
+# 增量更新后已删除片段占比超过该值时全量重建，回收墓碑占用的空间
+MAX_DEAD_RATIO = 0.5
+# 解码并算好权重的倒排表缓存的词项数（索引更新时清空）
+POSTINGS_CACHE_TERMS = 1024
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+
+def split_chunks(content: str) -> List[str]:
+    """按段落（空行）切分文档内容"""
+    return [chunk.strip() for chunk in content.split("\n\n") if chunk.strip()]
+
+
+def _chunk_start_lines(content: str) -> List[int]:
+    """split_chunks 切出的每个片段在原文中的起始行号（从1开始）"""
+    lines = []
+    line = 1
+    for piece in content.split("\n\n"):
+        stripped = piece.lstrip()
+        if stripped.strip():
+            lines.append(line + piece[:len(piece) - len(stripped)].count("\n"))
+        line += piece.count("\n") + 2
+    return lines
+
+
+def _heading_paths(chunks: List[str]) -> List[str]:
+    """计算每个片段所在的Markdown标题路径（片段内的标题也计入）"""
+    stack: List[Tuple[int, str]] = []
+    paths = []
+    for chunk in chunks:
+        for line in chunk.splitlines():
+            match = _HEADING_PATTERN.match(line.strip())
+            if match:
+                level = len(match.group(1))
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                stack.append((level, match.group(2)))
+        paths.append(" / ".join(title for _, title in stack))
+    return paths
+
+
+# -------------------------- 倒排索引 --------------------------
+class ChunkIndex:
+    """
+    片段级倒排索引，由若干不可变段组成（见segments.py）：段内倒排表保存压缩的 (片段, 词频, 是否在标题中)，
+    全局只维护文档频率和片段长度，查询时按当前统计计算BM25权重（含标题加权）并跨段累加
+    支持按文件增量更新：每次更新新增的片段写成一个新段，删除的片段只在所在段的墓碑位图上标记，
+    序号不复用；后台按分档策略合并小段并清除墓碑，更新本身只处理发生变化的片段
+    """
+
+    def __init__(self):
+        self.files: List[str] = []            # 文件序号 -> 文件名（已删除的文件保留占位）
+        self.file_numbers: Dict[str, int] = {}  # 现存文件名 -> 文件序号
+        self.chunks: List[Optional[Dict]] = []  # {"filename", "chunk_id", "content", "heading", "start_line"}，已删除为None
+        self.chunk_file: List[int] = []       # 片段序号 -> 文件序号
+        self.chunk_lookup: Dict[Tuple[str, int], int] = {}  # (文件名, 片段ID) -> 片段序号
+        self.file_chunks: Dict[str, Sequence[int]] = {}  # 文件名 -> 该文件的片段序号（通常是连续范围，末尾追加过的文件为列表）
+        self.file_symbols: Dict[str, List[Tuple[Symbol, int]]] = {}  # 文件名 -> [(符号, 定义片段序号)]
+        self.dead: Set[int] = set()           # 已删除的片段序号（墓碑）
+        self.paths = PathIndex()
+        self.metadata = MetadataIndex()
+        self.symbols = SymbolTable()
+        self.symbol_chunks: List[int] = []  # 符号下标 -> 定义片段的片段序号
+        # 近似重复：重复片段 -> 代表片段；代表片段 -> 其他出处 [(文件名, 片段ID)]
+        self.dedup: Optional[NearDuplicateDetector] = NearDuplicateDetector() if DEDUP_ENABLED else None
+        self.duplicate_of: Dict[int, int] = {}
+        self.duplicate_sources: Dict[int, List[Tuple[str, int]]] = {}
+        self.segments: List[Segment] = []
+        self.df: Dict[str, int] = {}          # 词项 -> 包含该词项的存活片段数
+        self.filename_postings: Dict[str, List[int]] = {}
+        self.filename_idf: Dict[str, float] = {}
+        self.indexed_count = 0  # 进入倒排表的片段数
+        self._total_length = 0
+        # 增量更新所需的正排数据：片段词频（定义片段为None）、标题词项、片段长度、文件名词项
+        self._chunk_terms: List[Optional[Dict[str, int]]] = []
+        self._heading_terms: List[set] = []
+        self._lengths: List[int] = []
+        self._file_terms: Dict[str, set] = {}
+        # 片段所在的段；本次更新中新进入倒排表、尚未写成段的片段
+        self._chunk_segment: List[Optional[Segment]] = []
+        self._pending: Set[int] = set()
+        self._weighted: "OrderedDict[str, List[Tuple[int, float]]]" = OrderedDict()
+        # 段统计：刷写和合并写出的倒排字节数（写放大 = 两者之和 / 刷写字节数）
+        self.flushed_bytes = 0
+        self.merged_bytes = 0
+        self.merges = 0
+        self.filtered_direct = 0  # 过滤范围较小、直接逐片段打分的查询数
+        self._merging = False
+        self._merge_done = threading.Condition()
+        # 更新和查询互斥（更新在后台线程执行，只在内存中计算）
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.chunks) - len(self.dead)
+
+    @property
+    def dead_ratio(self) -> float:
+        return len(self.dead) / len(self.chunks) if self.chunks else 0.0
+
+    @classmethod
+    def build(cls, documents: Dict[str, str], mtimes: Optional[Dict[str, float]] = None) -> "ChunkIndex":
+        index = cls()
+        index.update(documents, mtimes, merge=False)
+        return index
+
+    def update(self, changes: Dict[str, Optional[str]], mtimes: Optional[Dict[str, float]] = None,
+               merge: bool = True):
+        """
+        按文件更新索引：内容为None表示文件已删除，否则替换为新内容
+        mtimes: 文件修改时间（用于按时间过滤），缺少的文件不参与时间过滤
+        merge: 更新后在后台线程中按需合并段
+        """
+        mtimes = mtimes or {}
+        with self.lock:
+            for filename, content in changes.items():
+                if filename in self.file_numbers:
+                    if content is not None and self._update_file(filename, content, mtimes.get(filename)):
+                        continue
+                    self._remove_file(filename)
+                if content is not None:
+                    self._add_file(filename, content, mtimes.get(filename))
+            self._flush()
+            self._compute_filename_weights()
+            self._rebuild_symbols()
+            self._weighted.clear()
+        if merge:
+            self.start_merge()
+
+    def _append_chunk(self, file_no: int, filename: str, chunk_id, content: str, heading: str,
+                      start_line: int, tf: Optional[Dict[str, int]], headings: set) -> int:
+        self.chunks.append({
+            "filename": filename,
+            "chunk_id": chunk_id,
+            "content": content,
+            "heading": heading,
+            "start_line": start_line,
+        })
+        self.chunk_file.append(file_no)
+        self._chunk_terms.append(tf)
+        self._heading_terms.append(headings)
+        self._lengths.append(sum(tf.values()) if tf else 0)
+        self._chunk_segment.append(None)
+        chunk_no = len(self.chunks) - 1
+        self.chunk_lookup[(filename, chunk_id)] = chunk_no
+        return chunk_no
+
+    def _add_file(self, filename: str, content: str, mtime: Optional[float] = None):
+        file_no = len(self.files)
+        self.files.append(filename)
+        self.file_numbers[filename] = file_no
+        self.paths.add(filename)
+        self._file_terms[filename] = set(tokenize(filename))
+
+        start = len(self.chunks)
+        self._add_chunks(file_no, filename, content, split_chunks(content))
+        self.file_chunks[filename] = range(start, len(self.chunks))
+
+        # 代码文件：每个函数/类/方法定义作为一个完整片段加入（不进入倒排表，只通过符号表命中）
+        # 片段ID形如 "ChunkIndex.search:120-158"
+        symbols = extract_symbols(filename, content)
+        if symbols:
+            lines = content.splitlines()
+            self.file_symbols[filename] = [
+                (symbol, self._append_chunk(file_no, symbol.path,
+                                            f"{symbol.qualname}:{symbol.start_line}-{symbol.end_line}",
+                                            symbol_source(lines, symbol), f"{symbol.kind} {symbol.qualname}",
+                                            symbol.start_line, None, set()))
+                for symbol in symbols
+            ]
+        self._add_metadata(filename, list(self.file_chunks[filename]) +
+                           [chunk_no for _, chunk_no in self.file_symbols.get(filename, [])], mtime)
+
+    def _add_metadata(self, filename: str, chunk_nos: List[int], mtime: Optional[float]):
+        """提交历史分片中的每个片段按提交的作者、时间和修改的文件登记，不使用分片文件的修改时间"""
+        commits = []
+        if is_history_file(filename):
+            for chunk_no in chunk_nos:
+                commit = parse_commit_chunk(self.chunks[chunk_no]["content"])
+                if commit is not None:
+                    commits.append((chunk_no,) + commit)
+        self.metadata.add_file(filename, chunk_nos, None if commits else mtime, commits)
+
+    def _add_chunks(self, file_no: int, filename: str, content: str, chunks: List[str], first: int = 0):
+        """把文件的第first个及之后的片段加入索引（标题路径和起始行号按整个文件计算）"""
+        headings = _heading_paths(chunks)
+        start_lines = _chunk_start_lines(content)
+        for chunk_id in range(first, len(chunks)):
+            tokens = tokenize(chunks[chunk_id])
+            tf: Dict[str, int] = {}
+            for term in tokens:
+                tf[term] = tf.get(term, 0) + 1
+            chunk_no = self._append_chunk(file_no, filename, chunk_id, chunks[chunk_id], headings[chunk_id],
+                                          start_lines[chunk_id], tf, set(tokenize(headings[chunk_id])))
+            self._assign_duplicate(chunk_no, tokens)
+            if chunk_no not in self.duplicate_of:
+                self._index_chunk(chunk_no)
+
+    def _update_file(self, filename: str, content: str, mtime: Optional[float] = None) -> bool:
+        """
+        保留文件开头内容未变的片段，只替换之后的片段（持续追加的日志等文件每次只处理末尾）
+        有定义片段的代码文件、或第一个片段就已变化时返回False，由调用方整体替换
+        """
+        if filename in self.file_symbols:
+            return False
+        old = self.file_chunks[filename]
+        chunks = split_chunks(content)
+        kept = 0
+        for chunk_no, chunk in zip(old, chunks):
+            if self.chunks[chunk_no]["content"] != chunk:
+                break
+            kept += 1
+        if not kept or extract_symbols(filename, content):
+            return False
+        for chunk_no in old[kept:]:
+            self._drop_chunk(chunk_no)
+        start = len(self.chunks)
+        self._add_chunks(self.file_numbers[filename], filename, content, chunks, kept)
+        self.file_chunks[filename] = list(old[:kept]) + list(range(start, len(self.chunks)))
+        self.metadata.remove_file(filename)
+        self._add_metadata(filename, self.file_chunks[filename], mtime)
+        return True
+
+    def _remove_file(self, filename: str):
+        del self.file_numbers[filename]
+        del self._file_terms[filename]
+        self.paths.remove(filename)
+        self.metadata.remove_file(filename)
+        removed = list(self.file_chunks.pop(filename))
+        removed.extend(chunk_no for _, chunk_no in self.file_symbols.pop(filename, []))
+        for chunk_no in removed:
+            self._drop_chunk(chunk_no)
+
+    def _drop_chunk(self, chunk_no: int):
+        chunk = self.chunks[chunk_no]
+        self.chunk_lookup.pop((chunk["filename"], chunk["chunk_id"]), None)
+        self._release_duplicate(chunk_no)
+        self._unindex_chunk(chunk_no)
+        self.dead.add(chunk_no)
+        self.chunks[chunk_no] = None
+        self._chunk_terms[chunk_no] = None
+        self._heading_terms[chunk_no] = set()
+
+    def _assign_duplicate(self, chunk_no: int, tokens: Optional[List[str]] = None):
+        """近似重复的片段不进入倒排表，只在代表片段上记录出处"""
+        if self.dedup is None:
+            return
+        chunk = self.chunks[chunk_no]
+        if tokens is None:
+            tokens = tokenize(chunk["content"])
+        representative = self.dedup.find_or_add(chunk_no, chunk["content"], tokens)
+        if representative is not None:
+            self.duplicate_of[chunk_no] = representative
+            self.duplicate_sources.setdefault(representative, []).append((chunk["filename"], chunk["chunk_id"]))
+
+    def _release_duplicate(self, chunk_no: int):
+        """片段被删除前解除重复关系：重复片段从出处中移除；代表片段被删除时，其余出处重新选出代表"""
+        if self.dedup is None:
+            return
+        representative = self.duplicate_of.pop(chunk_no, None)
+        if representative is not None:
+            chunk = self.chunks[chunk_no]
+            sources = self.duplicate_sources[representative]
+            sources.remove((chunk["filename"], chunk["chunk_id"]))
+            if not sources:
+                del self.duplicate_sources[representative]
+            return
+        self.dedup.discard(chunk_no)
+        for source in self.duplicate_sources.pop(chunk_no, []):
+            member = self.chunk_lookup.get(source)
+            if member is None:
+                continue
+            del self.duplicate_of[member]
+            self._assign_duplicate(member)
+            if member not in self.duplicate_of:
+                self._index_chunk(member)
+
+    def _rebuild_symbols(self):
+        table = SymbolTable()
+        entries = [entry for symbols in self.file_symbols.values() for entry in symbols]
+        table.add_all([symbol for symbol, _ in entries])
+        self.symbols, self.symbol_chunks = table, [chunk_no for _, chunk_no in entries]
+
+    def resolve_symbols(self, query: str) -> List[int]:
+        """查询中提到的符号对应的定义片段序号"""
+        with self.lock:
+            return [self.symbol_chunks[symbol_no] for symbol_no in self.symbols.resolve_query(query)]
+
+    def _chunk_term_set(self, chunk_no: int) -> set:
+        return set(self._chunk_terms[chunk_no]) | self._heading_terms[chunk_no]
+
+    def _index_chunk(self, chunk_no: int):
+        """片段进入倒排表（重复片段、定义片段不进入）：计入统计，本次更新结束时写入新段"""
+        self._pending.add(chunk_no)
+        self.indexed_count += 1
+        self._total_length += self._lengths[chunk_no]
+        for term in self._chunk_term_set(chunk_no):
+            self.df[term] = self.df.get(term, 0) + 1
+
+    def _unindex_chunk(self, chunk_no: int):
+        """从统计中移除；已写入段的片段在段的墓碑位图上标记"""
+        segment = self._chunk_segment[chunk_no]
+        if segment is not None:
+            segment.delete(chunk_no)
+            self._chunk_segment[chunk_no] = None
+        elif chunk_no in self._pending:
+            self._pending.discard(chunk_no)
+        else:
+            return
+        self.indexed_count -= 1
+        self._total_length -= self._lengths[chunk_no]
+        for term in self._chunk_term_set(chunk_no):
+            count = self.df[term] - 1
+            if count:
+                self.df[term] = count
+            else:
+                del self.df[term]
+
+    def _flush(self):
+        """把本次更新新进入倒排表的片段写成一个不可变段"""
+        if not self._pending:
+            return
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for chunk_no in self._pending:
+            tf, headings = self._chunk_terms[chunk_no], self._heading_terms[chunk_no]
+            for term in set(tf) | headings:
+                postings.setdefault(term, []).append((chunk_no, pack_posting(tf.get(term, 0), term in headings)))
+        segment = build_segment(postings)
+        for chunk_no in segment.chunk_nos:
+            self._chunk_segment[chunk_no] = segment
+        self.segments.append(segment)
+        self.flushed_bytes += segment.encoded_bytes
+        self._pending = set()
+
+    def _compute_filename_weights(self):
+        filename_postings: Dict[str, List[int]] = {}
+        for filename, terms in self._file_terms.items():
+            for term in terms:
+                filename_postings.setdefault(term, []).append(self.file_numbers[filename])
+        file_count = len(self.file_numbers)
+        self.filename_idf = {
+            term: math.log(1 + (file_count - len(file_nos) + 0.5) / (len(file_nos) + 0.5))
+            for term, file_nos in filename_postings.items()
+        }
+        self.filename_postings = filename_postings
+
+    def idf(self, term: str) -> float:
+        n, count = self.indexed_count, self.df.get(term, 0)
+        return math.log(1 + (n - count + 0.5) / (count + 0.5))
+
+    @staticmethod
+    def _weight(idf: float, freq: int, in_heading: bool, length: int, avg_length: float) -> float:
+        weight = 0.0
+        if freq:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            weight = idf * freq * (BM25_K1 + 1) / (freq + norm)
+        if in_heading:
+            weight += HEADING_BOOST * idf
+        return weight
+
+    def _avg_length(self) -> float:
+        avg_length = (self._total_length / self.indexed_count) if self.indexed_count else 1.0
+        return avg_length or 1.0
+
+    def postings(self, term: str) -> List[Tuple[int, float]]:
+        """词项的倒排表 [(片段序号, BM25权重)]：跨段解码并按当前统计计算权重，结果按词项缓存到下次更新"""
+        cached = self._weighted.get(term)
+        if cached is not None:
+            self._weighted.move_to_end(term)
+            return cached
+        if term not in self.df:
+            return []
+        idf, avg_length, lengths = self.idf(term), self._avg_length(), self._lengths
+        weighted = [(chunk_no, self._weight(idf, packed >> 1, packed & 1, lengths[chunk_no], avg_length))
+                    for segment in self.segments for chunk_no, packed in segment.lookup(term)]
+        self._weighted[term] = weighted
+        while len(self._weighted) > POSTINGS_CACHE_TERMS:
+            self._weighted.popitem(last=False)
+        return weighted
+
+    # -------------------------- 段合并 --------------------------
+    def start_merge(self, background: bool = True):
+        """按合并策略合并段；已有合并在进行时直接返回"""
+        with self.lock:
+            if self._merging or not pick_merge(self.segments):
+                return
+            self._merging = True
+        if background:
+            threading.Thread(target=self._merge_loop, name="segment-merge", daemon=True).start()
+        else:
+            self._merge_loop()
+
+    def _merge_loop(self):
+        """合并在锁外进行（段不可变，只读取编码后的倒排表），只在替换段时短暂持锁"""
+        try:
+            while True:
+                with self.lock:
+                    candidates = pick_merge(self.segments)
+                    if not candidates:
+                        return
+                merged = merge_segments(candidates)
+                with self.lock:
+                    # 合并期间被删除的片段在新段上补打墓碑，其余片段改为指向新段
+                    for chunk_no in merged.chunk_nos:
+                        if chunk_no in self.dead:
+                            merged.delete(chunk_no)
+                        else:
+                            self._chunk_segment[chunk_no] = merged
+                    remaining = [segment for segment in self.segments if all(segment is not c for c in candidates)]
+                    if merged.live_count:
+                        remaining.append(merged)
+                    self.segments = remaining
+                    self.merged_bytes += merged.encoded_bytes
+                    self.merges += 1
+        finally:
+            with self._merge_done:
+                self._merging = False
+                self._merge_done.notify_all()
+
+    def wait_for_merges(self, timeout: Optional[float] = None):
+        with self._merge_done:
+            self._merge_done.wait_for(lambda: not self._merging, timeout)
+
+    def segment_stats(self) -> Dict:
+        with self.lock:
+            postings = sum(segment.posting_count for segment in self.segments)
+            encoded = sum(segment.encoded_bytes for segment in self.segments)
+            return {
+                "segments": len(self.segments),
+                "segment_sizes": [len(segment) for segment in self.segments],
+                "postings": postings,
+                "deleted_chunks": sum(segment.deleted for segment in self.segments),
+                # 编码后的倒排表大小（即序列化到磁盘的大小）与常驻内存估算
+                "encoded_bytes": encoded,
+                "bytes_per_posting": round(encoded / postings, 2) if postings else None,
+                "memory_bytes": sum(segment.memory_bytes() for segment in self.segments),
+                "merges": self.merges,
+                "merging": self._merging,
+                "write_amplification": round((self.flushed_bytes + self.merged_bytes) / self.flushed_bytes, 3)
+                if self.flushed_bytes else None,
+            }
+
+    def plan(self, weights: Dict[str, float]) -> Dict[str, float]:
+        """
+        查询计划：丢弃索引中不存在的词项，以及区分度过低的常见词（仍有其他词项时）
+        返回实际需要查找倒排表的 {词项: 查询权重}
+        """
+        present = {term: w for term, w in weights.items()
+                   if term in self.df or term in self.filename_postings}
+        max_df = max(1, int(self.indexed_count * MAX_DF_RATIO))
+        selective = {term: w for term, w in present.items()
+                     if self.df.get(term, 0) <= max_df}
+        return selective or present
+
+    def search(self, weights: Dict[str, float], top_k: int = 2,
+               priority_files: Sequence[str] = (), priority_chunks: Sequence[int] = (),
+               allowed: Optional[Bitmap] = None, boost: Optional[Tuple[Bitmap, float]] = None) -> List[Dict]:
+        """
+        按查询词权重检索，返回得分最高的top_k个片段
+        priority_chunks: 查询中提到的符号的定义片段，排在最前
+        priority_files: 查询中明确提到的文件，优先从这些文件中取片段（不足时再用全局结果补齐）
+        allowed: 元数据过滤得到的片段位图（见metadata.select），只有其中的片段参与打分和返回
+        boost: (片段位图, 倍数)，其中的片段在全局排序中得分乘以该倍数（如查询时段内的日志片段）
+        """
+        with self.lock:
+            results: List[Dict] = [self.result(chunk_no, 0.0, 0) for chunk_no in priority_chunks[:top_k]
+                                   if chunk_no not in self.dead and (allowed is None or chunk_no in allowed)]
+            taken = {(item["filename"], item["chunk_id"]) for item in results}
+            if priority_files and len(results) < top_k:
+                # 多取出已在结果中的片段数，去重后仍能补足
+                for item in self.search_in_files(weights, priority_files, top_k, allowed):
+                    if len(results) >= top_k:
+                        break
+                    if (item["filename"], item["chunk_id"]) not in taken:
+                        results.append(item)
+                        taken.add((item["filename"], item["chunk_id"]))
+            if len(results) >= top_k:
+                return results
+            stand_in: Dict[int, int] = {}
+            if allowed is not None:
+                allowed, stand_in = self._with_representatives(allowed)
+            for item in self._search_all(weights, top_k + len(results), allowed, stand_in, boost):
+                if len(results) >= top_k:
+                    break
+                if (item["filename"], item["chunk_id"]) not in taken:
+                    results.append(item)
+            return results
+
+    def search_in_files(self, weights: Dict[str, float], filenames: Sequence[str], top_k: int,
+                        allowed: Optional[Bitmap] = None) -> List[Dict]:
+        """
+        只在指定文件内检索：按查询词打分，命中不足时按文件顺序取开头的片段
+        只访问这些文件的片段范围，不扫描其他文件
+        """
+        ranges = [self.file_chunks[f] for f in filenames if f in self.file_chunks]
+        if not ranges:
+            return []
+        members = [r if isinstance(r, range) else set(r) for r in ranges]
+
+        def in_files(chunk_no: int) -> bool:
+            return any(chunk_no in m for m in members) and (allowed is None or chunk_no in allowed)
+
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        for term, query_weight in self.plan(weights).items():
+            for chunk_no, weight in self.postings(term):
+                if in_files(chunk_no):
+                    scores[chunk_no] = scores.get(chunk_no, 0.0) + query_weight * weight
+                    matched[chunk_no] = matched.get(chunk_no, 0) + 1
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+        results = [self.result(chunk_no, score, matched[chunk_no]) for chunk_no, score in best]
+        for r in ranges:
+            for chunk_no in r:
+                if len(results) >= top_k:
+                    return results
+                if chunk_no not in scores and in_files(chunk_no):
+                    results.append(self.result(chunk_no, 0.0, 0))
+        return results
+
+    def _with_representatives(self, allowed: Bitmap) -> Tuple[Bitmap, Dict[int, int]]:
+        """
+        重复片段不进入倒排表，过滤范围内的重复片段由其代表片段参与打分
+        返回加入代表片段后的打分范围，以及 {范围外的代表片段: 范围内序号最小的出处}
+        """
+        if not self.duplicate_of:
+            return allowed, {}
+        if len(self.duplicate_of) < len(allowed):
+            members = [chunk_no for chunk_no in self.duplicate_of if chunk_no in allowed]
+        else:
+            members = [chunk_no for chunk_no in allowed if chunk_no in self.duplicate_of]
+        stand_in: Dict[int, int] = {}
+        for member in members:
+            representative = self.duplicate_of[member]
+            if representative not in allowed and member < stand_in.get(representative, len(self.chunks)):
+                stand_in[representative] = member
+        if not stand_in:
+            return allowed, stand_in
+        return allowed | Bitmap.from_chunks(stand_in), stand_in
+
+    def _search_all(self, weights: Dict[str, float], top_k: int, allowed: Optional[Bitmap] = None,
+                    stand_in: Optional[Dict[int, int]] = None,
+                    boost: Optional[Tuple[Bitmap, float]] = None) -> List[Dict]:
+        """stand_in: 代表片段在过滤范围外时，命中后改为返回范围内的出处（见_with_representatives）"""
+        terms = self.plan(weights)
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        if allowed is not None and len(allowed) * len(terms) < sum(self.df.get(term, 0) for term in terms):
+            # 过滤范围比倒排表小：直接对范围内的片段按正排词频打分，不遍历倒排表
+            self._score_chunks(terms, allowed, scores, matched)
+            self.filtered_direct += 1
+        else:
+            for term, query_weight in terms.items():
+                for chunk_no, weight in self.postings(term):
+                    if allowed is None or chunk_no in allowed:
+                        scores[chunk_no] = scores.get(chunk_no, 0.0) + query_weight * weight
+                        matched[chunk_no] = matched.get(chunk_no, 0) + 1
+        if boost is not None:
+            boosted, factor = boost
+            for chunk_no in scores:
+                if chunk_no in boosted:
+                    scores[chunk_no] *= factor
+        for representative, member in (stand_in or {}).items():
+            if representative in scores:
+                scores[member] = scores.pop(representative)
+                matched[member] = matched.pop(representative)
+        return self._rank(terms, scores, matched, top_k)
+
+    def _score_chunks(self, terms: Dict[str, float], chunk_nos: Iterable[int],
+                      scores: Dict[int, float], matched: Dict[int, int]):
+        """逐片段打分，结果与遍历倒排表相同（只计入进入倒排表的片段）"""
+        idfs = {term: self.idf(term) for term in terms if term in self.df}
+        avg_length = self._avg_length()
+        for chunk_no in chunk_nos:
+            if self._chunk_segment[chunk_no] is None:
+                continue  # 重复片段、定义片段或已删除
+            tf, headings = self._chunk_terms[chunk_no], self._heading_terms[chunk_no]
+            for term, query_weight in terms.items():
+                if term not in idfs:
+                    continue
+                freq, in_heading = tf.get(term, 0), term in headings
+                if not freq and not in_heading:
+                    continue
+                weight = self._weight(idfs[term], freq, in_heading, self._lengths[chunk_no], avg_length)
+                scores[chunk_no] = scores.get(chunk_no, 0.0) + query_weight * weight
+                matched[chunk_no] = matched.get(chunk_no, 0) + 1
+
+    def search_batch(self, weights_list: Sequence[Dict[str, float]], top_k: int = 2) -> List[List[Dict]]:
+        """
+        批量检索：整批查询按词项合并，每个词项的倒排表只遍历一次，同时累加到所有包含该词项的查询上
+        结果与逐条调用 search(weights, top_k) 相同（不处理文件/符号优先）
+        """
+        with self.lock:
+            plans = [self.plan(weights) for weights in weights_list]
+            queries_by_term: Dict[str, List[Tuple[Dict[int, float], Dict[int, int], float]]] = {}
+            accumulators = [({}, {}) for _ in plans]
+            for terms, (scores, matched) in zip(plans, accumulators):
+                for term, query_weight in terms.items():
+                    queries_by_term.setdefault(term, []).append((scores, matched, query_weight))
+
+            for term, queries in queries_by_term.items():
+                for chunk_no, weight in self.postings(term):
+                    for scores, matched, query_weight in queries:
+                        scores[chunk_no] = scores.get(chunk_no, 0.0) + query_weight * weight
+                        matched[chunk_no] = matched.get(chunk_no, 0) + 1
+
+            return [self._rank(terms, scores, matched, top_k)
+                    for terms, (scores, matched) in zip(plans, accumulators)]
+
+    def _rank(self, terms: Dict[str, float], scores: Dict[int, float], matched: Dict[int, int],
+              top_k: int) -> List[Dict]:
+        # 文件名命中：为已命中片段中属于该文件的片段加分
+        if scores:
+            file_boost: Dict[int, float] = {}
+            for term, query_weight in terms.items():
+                for file_no in self.filename_postings.get(term, ()):
+                    file_boost[file_no] = file_boost.get(file_no, 0.0) + \
+                        query_weight * FILENAME_BOOST * self.filename_idf[term]
+            if file_boost:
+                for chunk_no in scores:
+                    scores[chunk_no] += file_boost.get(self.chunk_file[chunk_no], 0.0)
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.result(chunk_no, score, matched[chunk_no]) for chunk_no, score in best]
+
+    def result(self, chunk_no: int, score: float, match_count: int) -> Dict:
+        chunk = self.chunks[chunk_no]
+        item = {
+            "filename": chunk["filename"],
+            "chunk_id": chunk["chunk_id"],
+            "content": chunk["content"],
+            "heading": chunk["heading"],
+            "start_line": chunk["start_line"],
+            "match_count": match_count,
+            "score": round(score, 4),
+        }
+        if chunk_no in self.duplicate_sources:
+            item["sources"] = list(self.duplicate_sources[chunk_no])
+        return item
+
+    def find_chunk(self, filename: str, chunk_id: int) -> Optional[int]:
+        """根据 (文件名, 片段ID) 找到片段在索引中的位置"""
+        return self.chunk_lookup.get((filename, chunk_id))
+
+
+# -------------------------- 索引注册表 --------------------------
+def _file_mtimes(folder_path: str, relative_paths: Iterable[str]) -> Dict[str, float]:
+    mtimes = {}
+    for relative_path in relative_paths:
+        try:
+            mtimes[relative_path] = os.path.getmtime(os.path.join(folder_path, relative_path))
+        except OSError:
+            pass
+    return mtimes
+
+
+class IndexRegistry:
+    """
+    每个文档集合缓存一份索引，按语料版本号失效
+    - 被文件监听器覆盖的集合：变化由监听器推送到apply_changes增量更新，获取时不访问文件系统
+    - 其他集合（监听器关闭或异常）：按轮询处理，距上次比对超过INDEX_FINGERPRINT_INTERVAL时才比对目录指纹
+      （文件大小和修改时间），发现外部改动时递增版本号并重建；上传、删除接口的修改仍然立即生效
+    """
+
+    def __init__(self, loader: Callable[[str], Dict[str, str]], fingerprint: Callable[[str], str],
+                 reader: Callable[[str, str], Optional[str]], watched: Callable[[str], bool] = lambda path: False):
+        self._loader = loader
+        self._fingerprint = fingerprint
+        self._reader = reader      # (集合目录, 相对路径) -> 文件内容，不应收录或已删除时为None
+        self._watched = watched
+        self._entries: Dict[str, Tuple[int, Optional[str], ChunkIndex]] = {}
+        self._checked: Dict[str, float] = {}  # 未监听的集合上次比对指纹（且一致）的时间
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.builds = 0
+        self.updates = 0
+        self.files_updated = 0
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, folder_path: str) -> ChunkIndex:
+        key = retrieval_cache.collection_key(folder_path)
+        with self._lock_for(key):
+            entry = self._entries.get(key)
+            generation = retrieval_cache.generations.get(folder_path)
+            watched = self._watched(folder_path)
+            now = time.monotonic()
+            if entry is not None and entry[0] == generation and (watched or self._recently_checked(key, now)):
+                return entry[2]
+            fingerprint = None if watched else self._fingerprint(folder_path)
+            if entry is not None and entry[0] == generation:
+                if watched or entry[1] == fingerprint:
+                    self._checked[key] = now
+                    return entry[2]
+                # 文件在上传接口之外被修改（rsync、挂载卷等），且没有监听器
+                generation = retrieval_cache.generations.bump(folder_path)
+
+            documents = self._loader(folder_path)
+            index = ChunkIndex.build(documents, _file_mtimes(folder_path, documents))
+            self.builds += 1
+            self._entries[key] = (generation, fingerprint, index)
+            self._checked[key] = now
+            return index
+
+    def _recently_checked(self, key: str, now: float) -> bool:
+        checked = self._checked.get(key)
+        return checked is not None and now - checked < INDEX_FINGERPRINT_INTERVAL
+
+    def is_cached(self, folder_path: str) -> bool:
+        """索引已构建、版本号最新，且由监听器维护或刚比对过指纹（获取时不需要访问磁盘）"""
+        key = retrieval_cache.collection_key(folder_path)
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] == retrieval_cache.generations.get(folder_path) and \
+            (self._watched(folder_path) or self._recently_checked(key, time.monotonic()))
+
+    def _expand(self, folder_path: str, index: ChunkIndex, relative_paths: Iterable[str]) -> Set[str]:
+        """目录展开为其下的文件：新目录中的现有文件，以及索引中该目录下的文件（可能已被删除或移走）"""
+        expanded: Set[str] = set()
+        for relative_path in relative_paths:
+            full_path = os.path.join(folder_path, relative_path)
+            if os.path.isdir(full_path):
+                for root, _, files in os.walk(full_path):
+                    expanded.update(os.path.relpath(os.path.join(root, f), folder_path) for f in files)
+            else:
+                expanded.add(relative_path)
+            prefix = relative_path.rstrip(os.sep) + os.sep
+            expanded.update(f for f in index.file_numbers if f.startswith(prefix))
+        return expanded
+
+    def apply_changes(self, folder_path: str, relative_paths: Iterable[str]):
+        """
+        增量更新：只重新读取发生变化的文件，然后递增版本号
+        relative_paths中包含空字符串（整个集合）时全量重建
+        索引尚未构建过的集合直接忽略，首次查询时会全量加载
+        """
+        key = retrieval_cache.collection_key(folder_path)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        relative_paths = set(relative_paths)
+
+        # 在加锁之前读取文件，查询不会等待文件I/O
+        if "" in relative_paths or entry[2].dead_ratio > MAX_DEAD_RATIO:
+            documents = self._loader(folder_path)
+            rebuilt = ChunkIndex.build(documents, _file_mtimes(folder_path, documents))
+            changes = None
+        else:
+            rebuilt = None
+            changes = {}
+            for relative_path in self._expand(folder_path, entry[2], relative_paths):
+                content = self._reader(folder_path, relative_path)
+                if content is not None or relative_path in entry[2].file_numbers:
+                    changes[relative_path] = content
+            if not changes:
+                return
+            mtimes = _file_mtimes(folder_path, [name for name, content in changes.items() if content is not None])
+
+        with self._lock_for(key):
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != retrieval_cache.generations.get(folder_path):
+                return  # 已失效，下次获取时重建
+            if rebuilt is not None:
+                index = rebuilt
+                self.builds += 1
+            else:
+                index = entry[2]
+                index.update(changes, mtimes)
+                self.updates += 1
+                self.files_updated += len(changes)
+            generation = retrieval_cache.generations.bump(folder_path)
+            fingerprint = None if self._watched(folder_path) else self._fingerprint(folder_path)
+            self._entries[key] = (generation, fingerprint, index)
+            self._checked[key] = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        return {
+            "builds": self.builds,
+            "updates": self.updates,
+            "files_updated": self.files_updated,
+            "collections": {
+                key: {"generation": generation, "files": len(index.file_numbers),
+                      "chunks": len(index), "terms": len(index.df),
+                      "duplicates": len(index.duplicate_of), "dead_chunks": len(index.dead),
+                      "segments": index.segment_stats(), "metadata": index.metadata.snapshot(),
+                      "filtered_direct": index.filtered_direct}
+                for key, (generation, _, index) in self._entries.items()
+            },
+        }
@@ -0,0 +1,155 @@
+import math
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# -------------------------- 段合并参数 --------------------------
+# 同一大小档位（按存活片段数的MERGE_FACTOR对数分档）的段达到该数量时合并为一个
+MERGE_FACTOR = 4
+# 段内已删除片段超过该比例时单独重写，清除墓碑
+SEGMENT_MAX_DELETED_RATIO = 0.3
+
+
+# -------------------------- 变长整数编码 --------------------------
+def encode_varints(values: Iterable[int]) -> bytes:
+    """每个非负整数按7位一组编码，最高位表示后面还有字节"""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data: bytes) -> List[int]:
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+def pack_posting(tf: int, in_heading: bool) -> int:
+    """倒排项的载荷：词频左移一位，最低位表示词项出现在标题中"""
+    return (tf << 1) | int(in_heading)
+
+
+# -------------------------- 不可变段 --------------------------
+class Segment:
+    """
+    不可变的倒排段：段内片段按全局片段序号排序后编号为局部ID，
+    每个词项的倒排表为 (局部ID差值, 载荷) 交替的变长整数序列
+    删除只在墓碑位图上标记，合并时才真正移除
+    """
+
+    def __init__(self, chunk_nos: Sequence[int], postings: Dict[str, bytes], posting_count: int):
+        self.chunk_nos = array("q", chunk_nos)
+        self.postings = postings
+        self.posting_count = posting_count
+        self.tombstones = bytearray((len(chunk_nos) + 7) // 8)
+        self.deleted = 0
+        self.encoded_bytes = sum(len(data) for data in postings.values())
+
+    def __len__(self) -> int:
+        return len(self.chunk_nos)
+
+    @property
+    def live_count(self) -> int:
+        return len(self.chunk_nos) - self.deleted
+
+    def _local_id(self, chunk_no: int) -> int:
+        local_id = bisect_left(self.chunk_nos, chunk_no)
+        if local_id == len(self.chunk_nos) or self.chunk_nos[local_id] != chunk_no:
+            raise KeyError(chunk_no)
+        return local_id
+
+    def delete(self, chunk_no: int):
+        local_id = self._local_id(chunk_no)
+        mask = 1 << (local_id & 7)
+        if not self.tombstones[local_id >> 3] & mask:
+            self.tombstones[local_id >> 3] |= mask
+            self.deleted += 1
+
+    def is_deleted(self, local_id: int) -> bool:
+        return bool(self.tombstones[local_id >> 3] >> (local_id & 7) & 1)
+
+    def lookup(self, term: str) -> List[Tuple[int, int]]:
+        """词项在本段中的存活倒排项 [(全局片段序号, 载荷)]"""
+        data = self.postings.get(term)
+        if data is None:
+            return []
+        values = decode_varints(data)
+        chunk_nos, tombstones = self.chunk_nos, self.tombstones
+        if not self.deleted:
+            return [(chunk_nos[local_id], packed)
+                    for local_id, packed in zip(accumulate(values[0::2]), values[1::2])]
+        return [(chunk_nos[local_id], packed)
+                for local_id, packed in zip(accumulate(values[0::2]), values[1::2])
+                if not tombstones[local_id >> 3] >> (local_id & 7) & 1]
+
+    def live_postings(self) -> Iterable[Tuple[str, List[Tuple[int, int]]]]:
+        for term in self.postings:
+            entries = self.lookup(term)
+            if entries:
+                yield term, entries
+
+    def memory_bytes(self) -> int:
+        """估算常驻内存：倒排字节串、词项字典、片段序号数组和墓碑位图"""
+        return (sys.getsizeof(self.postings)
+                + sum(sys.getsizeof(data) for data in self.postings.values())
+                + self.chunk_nos.itemsize * len(self.chunk_nos)
+                + sys.getsizeof(self.tombstones))
+
+
+def build_segment(postings: Dict[str, List[Tuple[int, int]]]) -> Segment:
+    """由 {词项: [(全局片段序号, 载荷)]}（无需有序）构建段"""
+    chunk_nos = sorted({chunk_no for entries in postings.values() for chunk_no, _ in entries})
+    local_ids = {chunk_no: local_id for local_id, chunk_no in enumerate(chunk_nos)}
+    encoded: Dict[str, bytes] = {}
+    posting_count = 0
+    for term, entries in postings.items():
+        entries = sorted((local_ids[chunk_no], packed) for chunk_no, packed in entries)
+        values: List[int] = []
+        previous = 0
+        for local_id, packed in entries:
+            values.append(local_id - previous)
+            values.append(packed)
+            previous = local_id
+        encoded[term] = encode_varints(values)
+        posting_count += len(entries)
+    return Segment(chunk_nos, encoded, posting_count)
+
+
+def merge_segments(segments: Sequence[Segment]) -> Segment:
+    """合并多个段为一个新段，丢弃已删除的片段"""
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for segment in segments:
+        for term, entries in segment.live_postings():
+            postings.setdefault(term, []).extend(entries)
+    return build_segment(postings)
+
+
+def pick_merge(segments: Sequence[Segment]) -> List[Segment]:
+    """
+    分档合并策略：存活片段数处于同一个MERGE_FACTOR对数档位的段攒够MERGE_FACTOR个时合并（从最小档开始），
+    否则重写墓碑占比过高的段；没有需要合并的段时返回空列表
+    """
+    tiers: Dict[int, List[Segment]] = {}
+    for segment in segments:
+        tier = int(math.log(max(1, segment.live_count), MERGE_FACTOR))
+        tiers.setdefault(tier, []).append(segment)
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= MERGE_FACTOR:
+            return tiers[tier][:MERGE_FACTOR]
+    for segment in segments:
+        if len(segment) and segment.deleted / len(segment) > SEGMENT_MAX_DELETED_RATIO:
+            return [segment]
+    return []
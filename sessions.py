@@ -0,0 +1,183 @@
+import asyncio
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from settings import SESSION_TTL, SESSION_MAX, SESSION_MAX_TURNS, SESSION_DROP_TURNS
+
+# 系统提示后附带的已丢弃问题的最大条数和每条的最大字符数
+SESSION_SUMMARY_QUESTIONS = 20
+SESSION_SUMMARY_CHARS = 100
+
+ChunkKey = Tuple[str, Any]  # (文件名, 片段ID)
+
+
+# -------------------------- 会话 --------------------------
+class Session:
+    """
+    一个多轮对话会话
+    消息按 [系统提示, 第1轮问, 第1轮答, 第2轮问, ...] 只追加不修改，
+    每个参考片段只在第一次被检索到的那一轮随问题发送一次（固定在历史中），之后的轮次只引用，
+    这样每轮请求的前缀与上一轮完全相同，上游的提示词前缀缓存可以命中
+    超出轮数上限时成批丢弃最早的轮次，系统提示保持不变，其后附上已丢弃轮次的问题列表；
+    前缀只在成批丢弃的那一轮变化一次
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.collection_path: Optional[str] = None
+        self.system_prompt: Optional[str] = None
+        self.turns: List[Dict] = []   # {"question", "user_message", "assistant_message", "chunks": [片段key]}
+        self.pinned: Dict[ChunkKey, int] = {}  # 已发送过的片段 -> 所在轮次序号（从0开始计）
+        self.created = time.time()
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()  # 同一会话的轮次依次执行
+        self.input_chars = 0        # 实际发送的字符数（累计）
+        self.reused_chars = 0       # 因复用已发送片段而少发送的字符数（累计）
+        self.turn_offset = 0        # 已被丢弃的轮数
+        self.dropped_questions: List[str] = []  # 已丢弃轮次的问题（最近的若干条）
+
+    def bind(self, collection_path: str, system_prompt: str):
+        """第一轮时绑定文档集合和系统提示（之后不再变化，保证前缀稳定）"""
+        self.collection_path = collection_path
+        self.system_prompt = system_prompt
+
+    def split_chunks(self, relevant_content: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """把本轮检索结果分为 (需要新发送的片段, 已在历史中的片段)"""
+        new_chunks, reused_chunks = [], []
+        for item in relevant_content:
+            key = (item["filename"], item["chunk_id"])
+            if key in self.pinned:
+                reused_chunks.append(item)
+                self.reused_chars += len(item["content"])
+            else:
+                new_chunks.append(item)
+        return new_chunks, reused_chunks
+
+    def messages(self, user_message: str) -> List[Dict]:
+        """历史消息 + 本轮问题"""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self.dropped_questions:
+            messages.append({"role": "system", "content": "更早的对话已省略，其中用户问过：\n" + "\n".join(
+                f"- {question}" for question in self.dropped_questions
+            )})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["user_message"]})
+            messages.append(turn["assistant_message"])
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def add_turn(self, question: str, user_message: str, assistant_message: Dict, new_chunks: List[Dict]):
+        """记录一轮完成的对话（发送的messages即 self.messages(user_message)）"""
+        self.input_chars += sum(len(message.get("content") or "") for message in self.messages(user_message))
+        turn_no = self.turn_offset + len(self.turns)
+        keys = [(item["filename"], item["chunk_id"]) for item in new_chunks]
+        for key in keys:
+            self.pinned[key] = turn_no
+        self.turns.append({
+            "question": question,
+            "user_message": user_message,
+            "assistant_message": assistant_message,
+            "chunks": keys,
+        })
+        # 超出轮数上限时成批丢弃最早的轮次（逐轮丢弃会使每轮的前缀都不同），其中的片段不再视为已发送
+        if len(self.turns) > SESSION_MAX_TURNS:
+            count = min(len(self.turns) - 1, max(len(self.turns) - SESSION_MAX_TURNS, SESSION_DROP_TURNS))
+            dropped, self.turns = self.turns[:count], self.turns[count:]
+            self.turn_offset += count
+            for turn in dropped:
+                for key in turn["chunks"]:
+                    self.pinned.pop(key, None)
+                question = " ".join(turn["question"].split())
+                if len(question) > SESSION_SUMMARY_CHARS:
+                    question = question[:SESSION_SUMMARY_CHARS] + "…"
+                self.dropped_questions.append(question)
+            del self.dropped_questions[:-SESSION_SUMMARY_QUESTIONS]
+
+    def summary(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "collection": self.collection_path,
+            "created": self.created,
+            "turns": [
+                {
+                    "question": turn["question"],
+                    "answer": turn["assistant_message"].get("content", ""),
+                    "new_chunks": [{"filename": f, "chunk_id": c} for f, c in turn["chunks"]],
+                }
+                for turn in self.turns
+            ],
+            "pinned_chunks": len(self.pinned),
+            "input_chars": self.input_chars,
+            "reused_chars": self.reused_chars,
+        }
+
+
+# -------------------------- 会话存储 --------------------------
+class SessionStore:
+    """有界LRU + 空闲过期的内存会话存储"""
+
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl: float = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _purge_expired(self, now: float):
+        # 按最近使用排序，最早的在前
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def create(self) -> Session:
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            session = Session(secrets.token_urlsafe(16))
+            session.last_used = now
+            self._sessions[session.session_id] = session
+            self.created += 1
+            return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """获取会话并刷新过期时间，不存在或已过期时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            sessions = list(self._sessions.values())
+        return {
+            "active": len(sessions),
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "input_chars": sum(s.input_chars for s in sessions),
+            "reused_chars": sum(s.reused_chars for s in sessions),
+        }
+
+
+store = SessionStore()
@@ -0,0 +1,187 @@
+import os
+
+from dotenv import load_dotenv
+
+# -------------------------- 加载环境变量 --------------------------
+# 所有配置都在这里读取：.env文件只在导入本模块时加载一次（不存在时使用系统环境变量），
+# 各模块 from settings import ... 取得需要的配置
+load_dotenv()
+
+# -------------------------- 服务与目录 --------------------------
+# 上游LLM接口（rag.py 命令行还需要 OPENROUTER_API_KEY）
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+API_URL = os.getenv("API_URL")
+MODEL_NAME = os.getenv("MODEL_NAME")
+DOCS_FOLDER = os.getenv("DOCS_FOLDER", "docs")
+GIT_REPOS_FOLDER = os.getenv("GIT_REPOS_FOLDER", "git_repos")
+CONFIG_FOLDER = os.getenv("CONFIG_FOLDER", "config")
+# /files 默认每页数量，以及 /files/{filename}/content 直接返回的最大文件大小（更大的文件使用 /raw 分段读取）
+FILES_PAGE_SIZE = int(os.getenv("FILES_PAGE_SIZE", "200"))
+FILE_CONTENT_MAX_BYTES = int(os.getenv("FILE_CONTENT_MAX_BYTES", str(1024 * 1024)))
+
+# -------------------------- 限流与准入（admission） --------------------------
+# 每个api_key的令牌桶：每秒补充的请求数（0 表示不限速）和桶容量（允许的突发请求数）
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "2"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+# 最多记录的api_key数，超出时丢弃最久未使用的令牌桶
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+
+# 各阶段的最大并发数：ingest（克隆仓库、加载语料、构建索引）、retrieval（检索和构建提示词）、llm（上游调用）
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+RETRIEVAL_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", "8"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+# 每个阶段最多排队的请求数，以及排队的最长时间（秒）；超出时直接拒绝
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+# -------------------------- 批量查询（batch_query） --------------------------
+# 批量任务中同时进行的LLM对话数
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+# 单个批量任务最多的问题数
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "10000"))
+# 每个问题的top_k上限（超出范围的行报告为格式错误）
+BATCH_MAX_TOP_K = int(os.getenv("BATCH_MAX_TOP_K", "20"))
+
+# -------------------------- 近似重复检测（dedup） --------------------------
+# 是否开启入库时的近似重复检测
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# 估计的Jaccard相似度达到该值视为重复
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+# 词项数少于该值的片段不参与检测（标题、分隔线等短片段）
+DEDUP_MIN_TOKENS = int(os.getenv("DEDUP_MIN_TOKENS", "8"))
+
+# -------------------------- 文件I/O（file_io） --------------------------
+# 文件I/O专用线程数（与默认线程池分开，慢速/网络卷不会占满索引、检索等其他后台任务的线程）
+FILE_IO_THREADS = int(os.getenv("FILE_IO_THREADS", "8"))
+# 目录列表缓存的最长有效期（秒）；目录本身的修改时间变化时立即失效
+FILE_LIST_TTL = float(os.getenv("FILE_LIST_TTL", "5"))
+
+# -------------------------- 文件类型检测（file_sniffer） --------------------------
+# 只读取文件开头这么多字节来判断类型和编码
+SNIFF_BYTES = int(os.getenv("LOADER_SNIFF_BYTES", "8192"))
+# 单个文件大小上限（字节），超过的文件不加载
+MAX_FILE_BYTES = int(os.getenv("LOADER_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+
+# -------------------------- 文件监听（fs_watcher） --------------------------
+# 是否启用文件监听
+WATCHER_ENABLED = os.getenv("WATCHER_ENABLED", "true").lower() == "true"
+# 后端：auto（优先inotify，不可用时轮询）/ inotify / polling
+WATCHER_BACKEND = os.getenv("WATCHER_BACKEND", "auto")
+# 防抖：事件停止这么久（秒）后再处理；持续有事件时最多等待WATCHER_MAX_DELAY
+WATCHER_DEBOUNCE = float(os.getenv("WATCHER_DEBOUNCE", "0.5"))
+WATCHER_MAX_DELAY = float(os.getenv("WATCHER_MAX_DELAY", "5"))
+# 轮询间隔（秒）
+WATCHER_POLL_INTERVAL = float(os.getenv("WATCHER_POLL_INTERVAL", "2"))
+
+# -------------------------- Git提交历史（git_history） --------------------------
+# 是否把克隆仓库的提交历史（提交说明、作者、时间、修改的文件和截断的diff）加入该仓库的索引
+GIT_HISTORY_ENABLED = os.getenv("GIT_HISTORY_ENABLED", "false").lower() == "true"
+# 每个仓库最多收录的最近提交数（超出时整片丢弃最旧的分片），索引占用的内存与历史深度无关
+GIT_HISTORY_MAX_COMMITS = int(os.getenv("GIT_HISTORY_MAX_COMMITS", "20000"))
+# 每个分片文件包含的提交数（新提交只追加到最后一个分片）
+GIT_HISTORY_SHARD_COMMITS = int(os.getenv("GIT_HISTORY_SHARD_COMMITS", "200"))
+# 每个提交收录的diff字符数
+GIT_HISTORY_DIFF_CHARS = int(os.getenv("GIT_HISTORY_DIFF_CHARS", "1500"))
+
+# -------------------------- HTTP缓存与压缩（http_cache） --------------------------
+# 小于该字节数的响应不压缩（压缩头部开销抵消收益）
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+# 缓存的压缩结果条数（按ETag和编码区分），轮询的客户端重复请求时不用再压缩
+HTTP_COMPRESS_CACHE_ENTRIES = int(os.getenv("HTTP_COMPRESS_CACHE_ENTRIES", "64"))
+# 超过该字节数的响应在线程中压缩，避免阻塞事件循环
+HTTP_COMPRESS_THREAD_BYTES = int(os.getenv("HTTP_COMPRESS_THREAD_BYTES", str(64 * 1024)))
+# /static 下文件的缓存时间（秒）；文件名不带版本号，默认0表示每次都要重新验证
+HTTP_STATIC_MAX_AGE = int(os.getenv("HTTP_STATIC_MAX_AGE", "0"))
+
+# -------------------------- 启动预热（lifecycle） --------------------------
+# 启动后在后台预先构建 docs 文件夹的索引（关闭时首个查询才构建）
+INDEX_WARMUP = os.getenv("INDEX_WARMUP", "true").lower() == "true"
+
+# -------------------------- LLM对话（llm_client） --------------------------
+# 一次对话（首次回答 + 追问）的总耗时预算（秒）
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# 合并范围：key（同一api_key的相同请求才合并）或 global（所有相同请求合并）
+LLM_COALESCE_SCOPE = os.getenv("LLM_COALESCE_SCOPE", "key")
+# 微批处理窗口（毫秒），0 表示关闭；仅在配置了批量接口时生效
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "16"))
+# 支持批量输入的接口地址，请求体 {"model", "requests": [...]}，响应体 {"responses": [...]}（顺序一致）
+LLM_BATCH_API_URL = os.getenv("LLM_BATCH_API_URL", "")
+
+# -------------------------- 上游请求（重试、对冲、熔断）（llm_transport） --------------------------
+# 单次上游请求超时（秒）
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# 最大重试次数（不含首次请求）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# 指数退避的基础间隔和上限（秒）
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# 对冲请求：首个请求超过p95延迟仍未返回时，再发一个相同请求，取先返回者
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+# 熔断器：连续失败次数阈值和熔断持续时间（秒）
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+# -------------------------- 日志索引（log_index） --------------------------
+# 日志文件的大小上限（字节），按行流式解析，不受普通文本文件的上限限制
+LOG_MAX_FILE_BYTES = int(os.getenv("LOG_MAX_FILE_BYTES", str(256 * 1024 * 1024)))
+# 时间分段：同一段内的日志落在同一个时间桶（秒）内，且不超过字节数上限（在日志条目之间切分）
+LOG_SEGMENT_SECONDS = int(os.getenv("LOG_SEGMENT_SECONDS", "60"))
+LOG_SEGMENT_BYTES = int(os.getenv("LOG_SEGMENT_BYTES", "2000"))
+# 查询中只给出单个时间点（"14:05左右"）时，前后各扩展的秒数
+LOG_QUERY_WINDOW_SECONDS = int(os.getenv("LOG_QUERY_WINDOW_SECONDS", "120"))
+# 查询不是针对日志的（如"10:30执行备份"）时，该时段的日志片段在排序中的得分倍数（不排除其他文档）
+LOG_WINDOW_BOOST = float(os.getenv("LOG_WINDOW_BOOST", "2"))
+
+# -------------------------- 片段摘录（passages） --------------------------
+# 是否只把片段中与问题相关的部分放进提示词（关闭时原样放入整个片段）
+PASSAGE_EXTRACTION = os.getenv("PASSAGE_EXTRACTION", "true").lower() == "true"
+# 短于该字符数的片段原样保留
+PASSAGE_MIN_CHARS = int(os.getenv("PASSAGE_MIN_CHARS", "600"))
+# 每个摘录窗口的最大字符数，以及每个片段最多摘录的窗口数
+PASSAGE_WINDOW_CHARS = int(os.getenv("PASSAGE_WINDOW_CHARS", "400"))
+PASSAGE_MAX_WINDOWS = int(os.getenv("PASSAGE_MAX_WINDOWS", "2"))
+
+# -------------------------- 性能分析（profiler） --------------------------
+# 是否开启性能分析接口（默认关闭；关闭时不注册中间件，没有任何额外开销）
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# 管理接口令牌，请求头 X-Admin-Token 需与之一致
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+# 单次采样的最长时间（秒）和默认采样间隔（秒）
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# 保留的单请求cProfile结果数
+PROFILE_KEEP_REQUESTS = int(os.getenv("PROFILE_KEEP_REQUESTS", "20"))
+
+# -------------------------- 检索缓存（retrieval_cache） --------------------------
+# 检索结果缓存的最大条目数（0 表示关闭缓存）
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+
+# -------------------------- 索引缓存（search_index） --------------------------
+# 没有文件监听的集合两次比对目录指纹的最小间隔（秒），期间的查询直接使用缓存的索引
+INDEX_FINGERPRINT_INTERVAL = float(os.getenv("INDEX_FINGERPRINT_INTERVAL", "2"))
+
+# -------------------------- 会话（sessions） --------------------------
+# 会话空闲多久（秒）后过期
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+# 同时保存的最大会话数，超出时淘汰最久未使用的会话
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+# 每个会话保留的最大轮数，超出时丢弃最早的轮次（及其引入的参考片段）
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))
+# 超出上限时一次丢弃的轮数：成批丢弃，之后的若干轮请求前缀保持不变（默认为上限的一半）
+SESSION_DROP_TURNS = int(os.getenv("SESSION_DROP_TURNS", str(max(1, SESSION_MAX_TURNS // 2))))
+
+# -------------------------- 表格数据（tabular） --------------------------
+# 表格文件（CSV/TSV/JSON数组/JSON Lines）的大小上限（字节），按行流式解析，不受普通文本文件的上限限制
+TABULAR_MAX_FILE_BYTES = int(os.getenv("TABULAR_MAX_FILE_BYTES", str(512 * 1024 * 1024)))
+# 每个文件最多收录的行数，超出部分不收录（摘要中注明）
+TABULAR_MAX_ROWS = int(os.getenv("TABULAR_MAX_ROWS", "200000"))
+# 每个文件渲染成文档的最大字符数：之后的行仍在列存储中参与统计，但不生成片段（摘要中注明）
+TABULAR_MAX_RENDER_CHARS = int(os.getenv("TABULAR_MAX_RENDER_CHARS", str(8 * 1024 * 1024)))
+# 每个片段最多包含的行数和字符数
+TABULAR_CHUNK_ROWS = int(os.getenv("TABULAR_CHUNK_ROWS", "20"))
+TABULAR_CHUNK_CHARS = int(os.getenv("TABULAR_CHUNK_CHARS", "1500"))
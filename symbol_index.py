@@ -0,0 +1,309 @@
+import ast
+import bisect
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from query_analysis import STOP_WORDS_EN
+
+# 单个定义片段的最大行数（超出部分截断）
+MAX_SYMBOL_LINES = 200
+# 同名定义最多返回的数量
+MAX_SYMBOL_MATCHES = 3
+# 查询中作为符号名候选的最短长度
+MIN_SYMBOL_NAME = 3
+
+
+class Symbol(NamedTuple):
+    name: str          # 名称，如 load_documents
+    qualname: str      # 限定名，如 ChunkIndex.search
+    kind: str          # function / class / method
+    path: str          # 文件相对路径
+    start_line: int    # 起始行（从1开始，含装饰器）
+    end_line: int      # 结束行（含）
+
+
+# -------------------------- Python：使用ast --------------------------
+def _python_symbols(path: str, source: str) -> List[Symbol]:
+    tree = ast.parse(source)
+    symbols: List[Symbol] = []
+
+    def visit(body, prefix: str, in_class: bool):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+                end = getattr(node, "end_lineno", None) or node.lineno
+                qualname = f"{prefix}{node.name}"
+                if isinstance(node, ast.ClassDef):
+                    kind = "class"
+                else:
+                    kind = "method" if in_class else "function"
+                symbols.append(Symbol(node.name, qualname, kind, path, start, end))
+                visit(node.body, qualname + ".", isinstance(node, ast.ClassDef))
+
+    visit(tree.body, "", False)
+    return symbols
+
+
+# -------------------------- 其他语言：正则 + 括号匹配 --------------------------
+_CONTROL_KEYWORDS = {"if", "for", "while", "switch", "catch", "return", "else", "do", "try", "with", "new", "sizeof"}
+
+_BRACE_GRAMMARS: Dict[str, List[Tuple[str, re.Pattern]]] = {
+    "js": [
+        ("class", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)")),
+        ("function", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)")),
+        ("function", re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)")),
+        ("method", re.compile(r"^\s+(?:(?:public|private|protected|static|async|readonly|get|set|override)\s+)*([A-Za-z_$][\w$]*)\s*(?:<[^>]*>)?\([^;]*\)\s*(?::\s*[^{;]+)?\{\s*$")),
+    ],
+    "java": [
+        ("class", re.compile(r"^\s*(?:(?:public|private|protected|static|final|abstract|sealed)\s+)*(?:class|interface|enum|record)\s+([A-Za-z_]\w*)")),
+        ("method", re.compile(r"^\s*(?:(?:public|private|protected|static|final|abstract|synchronized|native|default)\s+)*(?:<[^>]+>\s+)?[\w<>\[\],.?\s]+?\s+([A-Za-z_]\w*)\s*\([^;]*\)\s*(?:throws\s+[\w.,\s]+)?\{?\s*$")),
+    ],
+    "go": [
+        ("function", re.compile(r"^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)")),
+        ("class", re.compile(r"^type\s+([A-Za-z_]\w*)\s+(?:struct|interface)\b")),
+    ],
+    "c": [
+        ("class", re.compile(r"^\s*(?:typedef\s+)?(?:class|struct|union|enum)\s+([A-Za-z_]\w*)\s*(?::[^{]*)?\{?\s*$")),
+        ("function", re.compile(r"^(?!\s)(?:[\w\*&:<>,]+\s+)+\**&?([A-Za-z_][\w:~]*)\s*\([^;]*\)\s*(?:const)?\s*\{?\s*$")),
+    ],
+    "php": [
+        ("class", re.compile(r"^\s*(?:(?:abstract|final)\s+)?(?:class|interface|trait)\s+([A-Za-z_]\w*)")),
+        ("function", re.compile(r"^\s*(?:(?:public|private|protected|static|abstract|final)\s+)*function\s+&?([A-Za-z_]\w*)")),
+    ],
+    "rust": [
+        ("function", re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:const\s+|async\s+|unsafe\s+|extern\s+\"[^\"]*\"\s+)*fn\s+([A-Za-z_]\w*)")),
+        ("class", re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|union)\s+([A-Za-z_]\w*)")),
+        ("class", re.compile(r"^\s*impl(?:<[^>]*>)?\s+(?:[\w:<>]+\s+for\s+)?([A-Za-z_]\w*)")),
+    ],
+}
+
+_RUBY_GRAMMAR = [
+    ("class", re.compile(r"^\s*(?:class|module)\s+([A-Z]\w*(?:::\w+)*)")),
+    ("function", re.compile(r"^\s*def\s+(?:self\.)?([A-Za-z_]\w*[?!=]?)")),
+]
+
+# 扩展名 -> 语法
+LANGUAGE_BY_EXTENSION = {
+    ".py": "python",
+    ".js": "js", ".jsx": "js", ".ts": "js", ".tsx": "js", ".mjs": "js",
+    ".java": "java", ".kt": "java", ".cs": "java", ".scala": "java",
+    ".go": "go",
+    ".c": "c", ".h": "c", ".cpp": "c", ".cc": "c", ".hpp": "c",
+    ".php": "php",
+    ".rs": "rust",
+    ".rb": "ruby",
+}
+
+
+def _brace_block_end(lines: List[str], start: int) -> int:
+    """
+    从start行（下标从0开始）开始做轻量的括号匹配，返回块结束的行下标
+    跳过字符串和注释；在遇到 "{" 之前遇到 ";" 视为声明，结束于当前行
+    """
+    depth = 0
+    opened = False
+    in_block_comment = False
+    limit = min(len(lines), start + MAX_SYMBOL_LINES * 5)
+    for line_no in range(start, limit):
+        line = lines[line_no]
+        i = 0
+        quote = None
+        while i < len(line):
+            ch = line[i]
+            if in_block_comment:
+                if line.startswith("*/", i):
+                    in_block_comment = False
+                    i += 1
+            elif quote:
+                if ch == "\\":
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif line.startswith("//", i):
+                break
+            elif line.startswith("/*", i):
+                in_block_comment = True
+                i += 1
+            elif ch in "\"'`":
+                quote = ch
+            elif ch == "{":
+                depth += 1
+                opened = True
+            elif ch == "}":
+                depth -= 1
+                if opened and depth <= 0:
+                    return line_no
+            elif ch == ";" and not opened:
+                return line_no
+            i += 1
+    return start if not opened else limit - 1
+
+
+def _indent_block_end(lines: List[str], start: int, closing: Optional[str] = None) -> int:
+    """缩进语言：块结束于下一个缩进不大于起始行的非空行（Ruby为对应的end）"""
+    indent = len(lines[start]) - len(lines[start].lstrip())
+    end = start
+    for line_no in range(start + 1, min(len(lines), start + MAX_SYMBOL_LINES * 5)):
+        stripped = lines[line_no].strip()
+        if not stripped:
+            continue
+        current = len(lines[line_no]) - len(lines[line_no].lstrip())
+        if current <= indent:
+            if closing and stripped == closing and current == indent:
+                return line_no
+            break
+        end = line_no
+    return end
+
+
+def _regex_symbols(path: str, source: str, language: str) -> List[Symbol]:
+    lines = source.splitlines()
+    symbols: List[Symbol] = []
+    if language == "ruby":
+        grammar = _RUBY_GRAMMAR
+    elif language == "python":
+        grammar = [
+            ("class", re.compile(r"^\s*class\s+([A-Za-z_]\w*)")),
+            ("function", re.compile(r"^\s*(?:async\s+)?def\s+([A-Za-z_]\w*)")),
+        ]
+    else:
+        grammar = _BRACE_GRAMMARS[language]
+
+    for line_no, line in enumerate(lines):
+        for kind, pattern in grammar:
+            match = pattern.match(line)
+            if not match:
+                continue
+            name = match.group(1).split("::")[-1]
+            if name in _CONTROL_KEYWORDS:
+                continue
+            if language == "ruby":
+                end = _indent_block_end(lines, line_no, "end")
+            elif language == "python":
+                end = _indent_block_end(lines, line_no)
+            else:
+                end = _brace_block_end(lines, line_no)
+            symbols.append(Symbol(name, name, kind, path, line_no + 1, end + 1))
+            break
+    return _qualify(symbols)
+
+
+def _qualify(symbols: List[Symbol]) -> List[Symbol]:
+    """根据行范围嵌套关系，把类中定义的函数标记为方法并加上类名前缀"""
+    classes = [s for s in symbols if s.kind == "class"]
+    qualified = []
+    for symbol in symbols:
+        if symbol.kind != "class":
+            owners = [c for c in classes
+                      if c.start_line < symbol.start_line and symbol.end_line <= c.end_line]
+            if owners:
+                owner = max(owners, key=lambda c: c.start_line)
+                symbol = symbol._replace(kind="method", qualname=f"{owner.name}.{symbol.name}")
+        qualified.append(symbol)
+    return qualified
+
+
+def extract_symbols(path: str, source: str) -> List[Symbol]:
+    """提取文件中的定义（函数、类、方法）；不支持的语言返回空列表"""
+    language = LANGUAGE_BY_EXTENSION.get(os.path.splitext(path)[1].lower())
+    if language is None:
+        return []
+    if language == "python":
+        try:
+            return _python_symbols(path, source)
+        except (SyntaxError, ValueError):
+            pass
+    return _regex_symbols(path, source, language)
+
+
+def symbol_source(source_lines: List[str], symbol: Symbol) -> str:
+    """截取定义的源码（超出MAX_SYMBOL_LINES时截断）"""
+    end = min(symbol.end_line, symbol.start_line + MAX_SYMBOL_LINES - 1)
+    text = "\n".join(source_lines[symbol.start_line - 1:end])
+    if end < symbol.end_line:
+        text += f"\n... (省略 {symbol.end_line - end} 行)"
+    return text
+
+
+# -------------------------- 符号表 --------------------------
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][\w]*(?:(?:\.|::|#)[A-Za-z_]\w*)*")
+_CAMEL_CASE = re.compile(r"[a-z][A-Z]")
+
+
+def _identifier_shaped(query: str, match: "re.Match") -> bool:
+    """
+    查询中的词是否明显是代码标识符：snake_case、CamelCase、限定名（a.b、A::b、A#b）、
+    后面跟着括号（run()）或用反引号括起来（`get`）
+    普通单词（get、run、load、update）即使与某个定义同名也不算，避免占用检索结果的优先位置
+    """
+    identifier = match.group()
+    if "_" in identifier or _CAMEL_CASE.search(identifier) or any(sep in identifier for sep in (".", "::", "#")):
+        return True
+    after = query[match.end():match.end() + 1]
+    before = query[match.start() - 1:match.start()] if match.start() else ""
+    return after == "(" or (before == "`" and after == "`")
+
+
+class SymbolTable:
+    """
+    按名称排序的符号表，名称和限定名都可查（不区分大小写）
+    查找通过二分完成，O(log n)
+    """
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._values: List[int] = []   # 与 _keys 对应的符号下标
+        self.symbols: List[Symbol] = []
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def add_all(self, symbols: List[Symbol]):
+        pairs = list(zip(self._keys, self._values))
+        for symbol in symbols:
+            symbol_no = len(self.symbols)
+            self.symbols.append(symbol)
+            pairs.append((symbol.name.lower(), symbol_no))
+            if symbol.qualname != symbol.name:
+                pairs.append((symbol.qualname.lower(), symbol_no))
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._values = [value for _, value in pairs]
+
+    def lookup(self, name: str) -> List[int]:
+        """精确查找名称或限定名，返回符号下标"""
+        key = name.lower()
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key, lo)
+        return self._values[lo:hi]
+
+    def lookup_prefix(self, prefix: str, limit: int = 20) -> List[int]:
+        """前缀查找（用于补全等场景）"""
+        key = prefix.lower()
+        lo = bisect.bisect_left(self._keys, key)
+        result = []
+        for i in range(lo, len(self._keys)):
+            if not self._keys[i].startswith(key) or len(result) >= limit:
+                break
+            result.append(self._values[i])
+        return result
+
+    def resolve_query(self, query: str) -> List[int]:
+        """找出查询中以标识符形式出现的符号（如 load_documents、ChunkIndex.search、run()）"""
+        resolved: List[int] = []
+        for match in _IDENTIFIER_PATTERN.finditer(query):
+            if not _identifier_shaped(query, match):
+                continue
+            identifier = match.group().replace("::", ".").replace("#", ".")
+            if len(identifier) < MIN_SYMBOL_NAME or identifier.lower() in STOP_WORDS_EN:
+                continue
+            hits = self.lookup(identifier)
+            if not hits and "." in identifier:
+                last = identifier.rsplit(".", 1)[-1]
+                if len(last) >= MIN_SYMBOL_NAME:
+                    hits = self.lookup(last)
+            for symbol_no in hits[:MAX_SYMBOL_MATCHES]:
+                if symbol_no not in resolved:
+                    resolved.append(symbol_no)
+        return resolved
@@ -0,0 +1,484 @@
+import csv
+import json
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import file_sniffer
+from settings import (TABULAR_MAX_FILE_BYTES, TABULAR_MAX_ROWS, TABULAR_MAX_RENDER_CHARS, TABULAR_CHUNK_ROWS,
+                      TABULAR_CHUNK_CHARS)
+
+# 单元格在片段中显示的最大字符数
+TABULAR_MAX_CELL_CHARS = 200
+# 每列最多记录的不同值个数（超过后只报告"至少"）
+DISTINCT_LIMIT = 1000
+# JSON数组流式解析每次读取的字符数
+_READ_SIZE = 64 * 1024
+# 单个数组元素的最大字符数，超过时按普通文本处理（不会为一个元素把整个文件读进内存）
+_MAX_ELEMENT_CHARS = 64 * _READ_SIZE
+# 解码错误出现在缓冲区末尾这么多字符内时，可能只是元素被缓冲区边界截断（如 tr|ue、\u00|e9）
+_BOUNDARY_CHARS = 16
+
+TABULAR_EXTENSIONS = {".csv": ",", ".tsv": "\t", ".json": None, ".jsonl": None, ".ndjson": None}
+
+_KEY_NAMES = {"id", "key", "uuid", "code", "编号", "主键"}
+_ROW_PATTERN = re.compile(r"第\s*(\d+)\s*行|\brow\s*#?\s*(\d+)", re.IGNORECASE)
+_VALUE_PATTERN = re.compile(r"[\w.@\-]+")
+_NUMBER_PATTERN = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+
+
+def _is_distinctive(value: str) -> bool:
+    """不是数字，且带数字或 @ . - _ 分隔符的值；作为其他表格的主键值查找时不容易误命中"""
+    return not _NUMBER_PATTERN.fullmatch(value) and any(ch.isdigit() or ch in "@.-_" for ch in value)
+
+
+Row = Dict[str, Any]
+
+
+class NotTabular(Exception):
+    """JSON文件不是对象数组，按普通文本处理"""
+
+
+# -------------------------- 列存储 --------------------------
+class Column:
+    """
+    一列的类型化存储和统计：类型按值逐步放宽（empty -> boolean / integer -> number -> text），
+    整数和数值存放在array中，布尔和文本存放在列表中；空值只记录行号
+    """
+
+    def __init__(self, name: str, rows_before: int = 0):
+        self.name = name
+        self.kind = "empty"
+        self.values: Any = [""] * rows_before
+        self.nulls = set(range(rows_before))
+        self.count = rows_before
+        self.minimum: Any = None
+        self.maximum: Any = None
+        self.total = 0.0
+        self.distinct: Optional[set] = set()
+
+    @staticmethod
+    def _parse(raw: Any) -> Tuple[str, Any]:
+        if isinstance(raw, bool):
+            return "boolean", raw
+        if isinstance(raw, int):
+            return "integer", raw
+        if isinstance(raw, float):
+            return "number", raw
+        text = raw.strip()
+        lowered = text.lower()
+        if lowered in ("true", "false"):
+            return "boolean", lowered == "true"
+        if _NUMBER_PATTERN.fullmatch(text):
+            digits = text.lstrip("+-")
+            if digits.isdigit():
+                # 带前导零的编号（如邮编 007）按文本保留
+                if len(digits) > 1 and digits[0] == "0":
+                    return "text", text
+                return "integer", int(text)
+            return "number", float(text)
+        return "text", text
+
+    def _widen(self, kind: str):
+        """放宽列类型并转换已存储的值"""
+        if kind == self.kind or self.kind == "text" or (kind == "integer" and self.kind == "number"):
+            return
+        if self.kind == "empty":
+            target = kind
+        elif kind == "text" or "boolean" in (kind, self.kind):
+            target = "text"
+        else:
+            target = "number"
+        previous, self.kind = self.kind, target
+        if previous == "empty":
+            self.values = {"integer": lambda n: array("q", bytes(8 * n)),
+                           "number": lambda n: array("d", bytes(8 * n)),
+                           "boolean": lambda n: [False] * n}.get(target, lambda n: [""] * n)(len(self.values))
+        elif target == "number":
+            self.values = array("d", self.values)
+        else:
+            self.values = [self._format(value) for value in self.values]
+            self.minimum = self.maximum = None
+            self.total = 0.0
+
+    def append(self, raw: Any):
+        row_no = self.count
+        self.count += 1
+        if raw is None or raw == "":
+            self.nulls.add(row_no)
+            self.values.append(self._empty())
+            return
+        if self.kind == "text":
+            kind, value = "text", raw.strip() if isinstance(raw, str) else raw
+        else:
+            kind, value = self._parse(raw)
+            if kind == "integer" and not -2 ** 63 <= value < 2 ** 63:
+                kind, value = "number", float(value)
+            self._widen(kind)
+        if self.kind == "text":
+            value = self._format(value)
+        elif self.kind == "number":
+            value = float(value)
+        self.values.append(value)
+        if self.kind in ("integer", "number"):
+            self.total += value
+            self.minimum = value if self.minimum is None or value < self.minimum else self.minimum
+            self.maximum = value if self.maximum is None or value > self.maximum else self.maximum
+        if self.distinct is not None:
+            self.distinct.add(value)
+            if len(self.distinct) > DISTINCT_LIMIT:
+                self.distinct = None
+
+    def _empty(self) -> Any:
+        return {"integer": 0, "number": 0.0, "boolean": False}.get(self.kind, "")
+
+    @staticmethod
+    def _format(value: Any) -> str:
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    def get(self, row_no: int) -> Any:
+        return None if row_no in self.nulls else self.values[row_no]
+
+    def describe(self) -> Dict[str, Any]:
+        non_null = self.count - len(self.nulls)
+        info: Dict[str, Any] = {"name": self.name, "type": self.kind, "non_null": non_null, "nulls": len(self.nulls)}
+        if self.minimum is not None:
+            info.update(min=self.minimum, max=self.maximum)
+        if self.kind in ("integer", "number") and non_null:
+            info["mean"] = round(self.total / non_null, 6)
+        info["distinct"] = len(self.distinct) if self.distinct is not None else f">{DISTINCT_LIMIT}"
+        return info
+
+    def nbytes(self) -> int:
+        if isinstance(self.values, array):
+            return self.values.itemsize * len(self.values)
+        if self.kind == "boolean":
+            return len(self.values)
+        return sum(len(value) for value in self.values)
+
+
+# -------------------------- 表 --------------------------
+class Table:
+    """一个表格文件：列存储、统计信息、主键列索引，以及渲染成片段时每个片段对应的行范围"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.columns: List[Column] = []
+        self._column_numbers: Dict[str, int] = {}
+        self.row_count = 0
+        self.truncated = False
+        self.key_column: Optional[int] = None
+        self.key_rows: Dict[str, int] = {}
+        self.chunk_first_rows: List[int] = []
+        self.rendered_rows = 0
+
+    def add_row(self, row: Row):
+        for name in row:
+            if name not in self._column_numbers:
+                self._column_numbers[name] = len(self.columns)
+                self.columns.append(Column(name, self.row_count))
+        for column in self.columns:
+            column.append(row.get(column.name))
+        self.row_count += 1
+
+    def row(self, row_no: int) -> Row:
+        """第row_no行（从0开始）"""
+        return {column.name: column.get(row_no) for column in self.columns}
+
+    def _find_key(self):
+        """主键列：值全部非空且互不相同，优先选择名为 id/key 等的列，其次是第一列"""
+        candidates = sorted(range(len(self.columns)),
+                            key=lambda n: (self.columns[n].name.lower() not in _KEY_NAMES and
+                                           not self.columns[n].name.lower().endswith("_id"), n))
+        for column_no in candidates[:3]:
+            column = self.columns[column_no]
+            if column.nulls or column.kind not in ("integer", "text"):
+                continue
+            keys = {Column._format(value): row_no for row_no, value in enumerate(column.values)}
+            if len(keys) == self.row_count:
+                self.key_column, self.key_rows = column_no, keys
+                return
+
+    def row_line(self, row_no: int) -> str:
+        cells = []
+        for column in self.columns:
+            value = column.get(row_no)
+            if value is None:
+                continue
+            text = Column._format(value).replace("\r", " ").replace("\n", " ")
+            if len(text) > TABULAR_MAX_CELL_CHARS:
+                text = text[:TABULAR_MAX_CELL_CHARS] + "…"
+            cells.append(f"{column.name}={text}")
+        return f"第{row_no + 1}行: " + "; ".join(cells)
+
+    def summary(self) -> str:
+        lines = [f"# 表格 {self.filename}",
+                 f"共 {self.row_count} 行{'（超出上限，之后的行未收录）' if self.truncated else ''}，"
+                 f"{len(self.columns)} 列"]
+        if self.rendered_rows < self.row_count:
+            lines.append(f"文档大小超出上限，只有前 {self.rendered_rows} 行生成了片段")
+        if self.key_column is not None:
+            lines.append(f"主键列: {self.columns[self.key_column].name}")
+        for column in self.columns:
+            info = column.describe()
+            parts = [f"类型 {info['type']}", f"非空 {info['non_null']}", f"不同值 {info['distinct']}"]
+            if "min" in info:
+                parts.append(f"最小 {Column._format(info['min'])[:TABULAR_MAX_CELL_CHARS]}")
+                parts.append(f"最大 {Column._format(info['max'])[:TABULAR_MAX_CELL_CHARS]}")
+            if "mean" in info:
+                parts.append(f"平均 {info['mean']:g}")
+            lines.append(f"- 列 {column.name}: " + ", ".join(parts))
+        return "\n".join(lines)
+
+    def render(self, max_chars: Optional[int] = None) -> str:
+        """
+        渲染成文档：第一段为表结构和统计摘要，之后每段为若干行记录（不超过TABULAR_CHUNK_ROWS行/TABULAR_CHUNK_CHARS字符），
+        段首的标题注明行范围和列名，摘录时作为上下文保留
+        逐段生成，总大小达到max_chars（默认TABULAR_MAX_RENDER_CHARS）后停止，之后的行不生成片段
+        """
+        if max_chars is None:
+            max_chars = TABULAR_MAX_RENDER_CHARS
+        column_names = ", ".join(column.name for column in self.columns)
+        paragraphs: List[str] = []
+        total = 0
+        self.chunk_first_rows = []
+        row_no = 0
+        while row_no < self.row_count and total < max_chars:
+            lines, size, first = [], 0, row_no
+            while row_no < self.row_count and len(lines) < TABULAR_CHUNK_ROWS and \
+                    (not lines or size < TABULAR_CHUNK_CHARS):
+                line = self.row_line(row_no)
+                lines.append(line)
+                size += len(line) + 1
+                row_no += 1
+            self.chunk_first_rows.append(first)
+            paragraphs.append(f"## 第{first + 1}-{row_no}行 | 列: {column_names}\n" + "\n".join(lines))
+            total += len(paragraphs[-1]) + 2
+        self.rendered_rows = row_no
+        if row_no < self.row_count:
+            file_sniffer.stats.add("table_rows_unrendered", self.row_count - row_no)
+        # 摘要要注明未生成片段的行，最后生成
+        paragraphs.insert(0, self.summary())
+        return "\n\n".join(paragraphs)
+
+    def chunk_for_row(self, row_no: int) -> Optional[int]:
+        """第row_no行（从0开始）所在片段的片段ID（片段0为摘要）；该行没有生成片段时返回None"""
+        if row_no >= self.rendered_rows:
+            return None
+        return bisect_right(self.chunk_first_rows, row_no)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "rows": self.row_count,
+            "truncated": self.truncated,
+            "key": self.columns[self.key_column].name if self.key_column is not None else None,
+            "columns": [column.describe() for column in self.columns],
+            "bytes": sum(column.nbytes() for column in self.columns),
+        }
+
+
+# -------------------------- 流式解析 --------------------------
+def _flatten(value: Any, prefix: str = "", depth: int = 0) -> Row:
+    """嵌套对象展开为 a.b 形式的列，数组和更深的层级序列化为JSON文本"""
+    if isinstance(value, dict) and depth < 3:
+        row: Row = {}
+        for key, item in value.items():
+            row.update(_flatten(item, f"{prefix}{key}.", depth + 1))
+        return row
+    name = prefix[:-1] or "value"
+    if isinstance(value, (dict, list)):
+        return {name: json.dumps(value, ensure_ascii=False)}
+    return {name: value}
+
+
+def _read_delimited(f, delimiter: str) -> Iterator[Row]:
+    reader = csv.reader(f, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    names = []
+    for column_no, name in enumerate(header):
+        name = name.strip() or f"col{column_no + 1}"
+        names.append(name if name not in names else f"{name}_{column_no + 1}")
+    for fields in reader:
+        if not any(field.strip() for field in fields):
+            continue
+        if len(fields) > len(names):
+            names.extend(f"col{column_no + 1}" for column_no in range(len(names), len(fields)))
+        yield dict(zip(names, fields))
+
+
+def _read_json_lines(f) -> Iterator[Row]:
+    """逐行解码，格式错误的行跳过并计入 skipped_malformed_lines"""
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            file_sniffer.stats.add("skipped_malformed_lines")
+            continue
+        yield _flatten(value)
+
+
+def _incomplete(error: ValueError, buffer: str) -> bool:
+    """解码失败是否可能只是因为元素在缓冲区末尾被截断（读入更多数据后可以解码）"""
+    if not isinstance(error, json.JSONDecodeError):
+        return True
+    return error.msg.startswith("Unterminated string") or error.pos >= len(buffer) - _BOUNDARY_CHARS
+
+
+def _read_json_array(f) -> Iterator[Row]:
+    """
+    逐个解码JSON数组的元素，缓冲区只保留尚未解码的部分
+    元素格式错误时抛出NotTabular（整个文件按普通文本处理），不会返回不完整的表格
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(_READ_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise NotTabular()
+    position = 1
+    eof = False
+    while True:
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # 数字可能在缓冲区边界处被截断，未到文件末尾时多读一些再解码
+                if end == len(buffer) and not eof:
+                    raise ValueError
+                break
+            except ValueError as e:
+                if eof:
+                    # 只缺少结尾的"]"（文件可能还在写入）时保留已解码的元素
+                    if buffer[position:].strip():
+                        raise NotTabular()
+                    return
+                if not _incomplete(e, buffer) or len(buffer) - position > _MAX_ELEMENT_CHARS:
+                    raise NotTabular()
+                more = f.read(_READ_SIZE)
+                eof = not more
+                buffer = buffer[position:] + more
+                position = 0
+        yield _flatten(value)
+        position = end
+
+
+def read_table(file_path: str, filename: str) -> Optional[Table]:
+    """
+    流式解析表格文件，逐行写入列存储（内存占用与收录的行数成正比，与文件大小无关）
+    不是表格（如JSON对象）、二进制或超出大小上限时返回None
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if os.path.getsize(file_path) > TABULAR_MAX_FILE_BYTES:
+            file_sniffer.stats.add("skipped_too_large")
+            return None
+        with open(file_path, "rb") as f:
+            encoding = file_sniffer.detect_encoding(f.read(file_sniffer.SNIFF_BYTES))
+        if encoding is None:
+            file_sniffer.stats.add("skipped_binary")
+            return None
+        table = Table(filename)
+        with open(file_path, "r", encoding=encoding, errors="replace", newline="") as f:
+            if TABULAR_EXTENSIONS[extension] is not None:
+                rows = _read_delimited(f, TABULAR_EXTENSIONS[extension])
+            elif extension == ".json":
+                rows = _read_json_array(f)
+            else:
+                rows = _read_json_lines(f)
+            for row in rows:
+                if table.row_count >= TABULAR_MAX_ROWS:
+                    table.truncated = True
+                    break
+                table.add_row(row)
+    except NotTabular:
+        return None
+    except (OSError, csv.Error, UnicodeError):
+        file_sniffer.stats.add("skipped_error")
+        return None
+    table._find_key()
+    file_sniffer.stats.add("tables_loaded")
+    file_sniffer.stats.add("table_rows", table.row_count)
+    return table
+
+
+# -------------------------- 表注册表 --------------------------
+class TableStore:
+    """各文档集合中已解析的表格：(集合目录, 相对路径) -> Table，用于按主键值或行号直接定位片段"""
+
+    def __init__(self):
+        self._tables: Dict[str, Dict[str, Table]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, folder_path: str, relative_path: str) -> Optional[str]:
+        """解析表格并登记，返回渲染后的文档；不是表格时返回None"""
+        table = read_table(os.path.join(folder_path, relative_path), relative_path)
+        content = table.render() if table is not None else None
+        with self._lock:
+            tables = self._tables.setdefault(os.path.abspath(folder_path), {})
+            if table is None:
+                tables.pop(relative_path, None)
+            else:
+                tables[relative_path] = table
+        return content
+
+    def remove(self, folder_path: str, relative_path: str):
+        with self._lock:
+            self._tables.get(os.path.abspath(folder_path), {}).pop(relative_path, None)
+
+    def clear(self, folder_path: str):
+        with self._lock:
+            self._tables.pop(os.path.abspath(folder_path), None)
+
+    def get(self, folder_path: str, relative_path: str) -> Optional[Table]:
+        return self._tables.get(os.path.abspath(folder_path), {}).get(relative_path)
+
+    def resolve_query(self, folder_path: str, query: str, mentioned_files: List[str]) -> List[Tuple[str, int]]:
+        """
+        提到的表格文件中的主键值和"第N行"/"row N"，以及其他表格中不易误命中的主键值，对应的 (文件名, 片段ID)
+        """
+        tables = self._tables.get(os.path.abspath(folder_path))
+        if not tables:
+            return []
+        found: List[Tuple[str, int]] = []
+        rows = [int(a or b) for a, b in _ROW_PATTERN.findall(query)]
+        for filename in mentioned_files:
+            table = tables.get(filename)
+            if table is not None:
+                found.extend((filename, table.chunk_for_row(row - 1)) for row in rows if 0 < row <= table.row_count)
+        values = [value for value in _VALUE_PATTERN.findall(query) if len(value) > 1 or value.isdigit()]
+        # 查询中的普通数字（"2个副本"、"HTTP 200"）很容易与整数主键重合：
+        # 只在提到的表格中按任意主键值查找；其他表格只查找带数字或分隔符、不是纯数字的值（如 ORD-1024、alice@example.com）
+        distinctive = [value for value in values if _is_distinctive(value)]
+        for filename, table in tables.items():
+            for value in values if filename in mentioned_files else distinctive:
+                row_no = table.key_rows.get(value)
+                if row_no is not None:
+                    found.append((filename, table.chunk_for_row(row_no)))
+        return list(dict.fromkeys(item for item in found if item[1] is not None))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                folder: {filename: {"rows": table.row_count, "columns": len(table.columns),
+                                    "truncated": table.truncated,
+                                    "key": table.columns[table.key_column].name
+                                    if table.key_column is not None else None}
+                         for filename, table in tables.items()}
+                for folder, tables in self._tables.items()
+            }
+
+
+tables = TableStore()
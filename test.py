@@ -6,6 +6,8 @@ import subprocess
 from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv  # 导入读取.env文件的库
 
+import file_sniffer
+
 # -------------------------- 加载环境变量 --------------------------
 # 加载.env文件中的配置（如果不存在.env文件，会使用系统环境变量）
 load_dotenv()  # 关键：加载.env文件
@@ -149,24 +151,21 @@ def load_documents(folder_path: str, skip_binary_files: bool = True) -> Dict[str
             file_path = os.path.join(root, filename)
             file_ext = os.path.splitext(filename)[1].lower()
             
-            # 跳过二进制文件（简单判断）
-            if skip_binary_files:
-                try:
-                    # 尝试以文本模式打开，判断是否为二进制文件
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        pass
-                except UnicodeDecodeError:
-                    # 解码失败，视为二进制文件
-                    continue
-            
             # 只处理文本文件（或所有文件，如果skip_binary_files为False）
             if file_ext not in TEXT_EXTENSIONS and skip_binary_files:
                 continue
             
             # 读取文件内容
             try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
+                if skip_binary_files:
+                    # 只读取文件开头判断是否为二进制、超大或压缩/生成的文件，并识别编码
+                    content = file_sniffer.read_text_file(file_path)
+                    if content is None:
+                        print(f"跳过非文本或生成文件: {file_path}")
+                        continue
+                else:
+                    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                        content = f.read()
                 
                 # 存储相对路径（便于识别文件位置）
                 relative_path = os.path.relpath(file_path, folder_path)
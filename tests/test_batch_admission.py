@@ -0,0 +1,58 @@
+import asyncio
+import importlib
+import json
+import time
+
+import pytest
+
+import admission
+import batch_query
+import llm_client
+import settings
+
+
+async def fake_conversation(api_key, prompt, follow_up_query):
+    return {"answer": prompt}
+
+
+def test_batch_endpoint_charges_one_token_per_llm_call(monkeypatch):
+    limiter = admission.RateLimiter(rate=50, burst=5)
+    monkeypatch.setattr(llm_client, "run_rag_conversation", fake_conversation)
+    monkeypatch.setattr(batch_query, "retrieve_batch", lambda index, items, *args: [[] for _ in items])
+    items = [{"id": i, "line": i + 1, "query": f"q{i}", "top_k": 2} for i in range(15)]
+
+    async def scenario():
+        started = time.monotonic()
+        results = [result async for result in batch_query.run_batch(
+            items, None, "key", lambda query, chunks: query, "follow up", rate_limiter=limiter)]
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(scenario())
+    assert len(results) == 15 and all("error" not in result for result in results)
+    assert limiter.allowed == 15
+    # 突发的5个之后，其余10个按每秒50个的速率等待
+    assert limiter.paced > 0 and elapsed >= 0.15
+    # 这个api_key的令牌已用完，单条查询被拒绝
+    with pytest.raises(admission.RateLimited):
+        limiter.acquire("key")
+
+
+def test_batch_cli_is_not_rate_limited(monkeypatch, tmp_path):
+    for name in ("OPENROUTER_API_KEY", "API_URL", "MODEL_NAME"):
+        monkeypatch.setattr(settings, name, "test")
+    rag = importlib.import_module("rag")
+    # 服务端的限速器令牌很少（逐条扣令牌要约10秒），命令行批量评估不受影响
+    slow = admission.RateLimiter(rate=5, burst=1)
+    monkeypatch.setattr(admission, "rate_limiter", slow)
+    monkeypatch.setattr(llm_client, "run_rag_conversation", fake_conversation)
+    monkeypatch.setattr(rag, "load_documents", lambda folder: {"notes.md": "alpha beta gamma\n\ndelta epsilon"})
+
+    queries = tmp_path / "queries.jsonl"
+    queries.write_text("\n".join(json.dumps({"id": i, "query": f"alpha {i}"}) for i in range(50)), encoding="utf-8")
+    output = tmp_path / "results.jsonl"
+    started = time.monotonic()
+    rag.run_batch(str(queries), str(output))
+    assert time.monotonic() - started < 5
+    results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert len(results) == 50 and all("answer" in result for result in results)
+    assert slow.allowed == 0 and slow.paced == 0
@@ -0,0 +1,115 @@
+from batch_query import BATCH_MAX_TOP_K, parse_jsonl
+
+
+def test_parse_jsonl_rejects_out_of_range_top_k():
+    lines = [
+        '{"query": "a"}',
+        '{"query": "b", "top_k": 5}',
+        '{"query": "c", "top_k": 0}',
+        '{"query": "d", "top_k": -3}',
+        '{"query": "e", "top_k": %d}' % (BATCH_MAX_TOP_K + 1),
+        '{"query": "f", "top_k": "many"}',
+    ]
+    items = parse_jsonl(lines)
+    assert [item.get("top_k") for item in items[:2]] == [2, 5]
+    assert all("error" in item for item in items[2:])
+    assert [item["line"] for item in items[2:]] == [3, 4, 5, 6]
+
+
+def build_collection(folder):
+    """与服务端加载文档相同：表格和日志先登记再渲染"""
+    import log_index
+    import tabular
+    from search_index import ChunkIndex
+
+    (folder / "users.csv").write_text(
+        "user_id,name,plan\n" + "".join(f"u-{1000 + i},name{i},basic\n" for i in range(200)), encoding="utf-8")
+    (folder / "app.log").write_text(
+        "".join(f"2024-01-02 {h:02d}:{m:02d}:00 INFO worker heartbeat {h}{m}\n" for h in range(24) for m in range(0, 60, 5)),
+        encoding="utf-8")
+    (folder / "guide.md").write_text("# Backup\n\nThe backup job copies the database every night.\n", encoding="utf-8")
+    (folder / "notes.txt").write_text("The backup job is slow on Mondays.\n", encoding="utf-8")
+    documents = {
+        "users.csv": tabular.tables.load(str(folder), "users.csv"),
+        "app.log": log_index.logs.load(str(folder), "app.log"),
+        "guide.md": (folder / "guide.md").read_text(encoding="utf-8"),
+        "notes.txt": (folder / "notes.txt").read_text(encoding="utf-8"),
+    }
+    return ChunkIndex.build(documents)
+
+
+def test_retrieve_batch_uses_the_single_query_pipeline(tmp_path):
+    from batch_query import retrieve_batch
+    from query_plan import plan_query
+
+    index = build_collection(tmp_path)
+    items = parse_jsonl([
+        '{"query": "which plan does u-1042 have"}',
+        '{"query": "what did the worker log at 14:05 on 2024-01-02"}',
+        '{"query": "backup job", "filters": {"extensions": ["md"]}}',
+        '{"query": "backup job", "top_k": 3}',
+    ])
+    results = retrieve_batch(index, items, folder_path=str(tmp_path))
+
+    with index.lock:
+        expected = [plan_query(index, item["query"], item["top_k"], None, str(tmp_path), item["filters"])
+                    .search(index, item["top_k"]) for item in items]
+    assert results == expected
+    # 表格主键、日志时段、元数据过滤都生效
+    assert results[0][0]["filename"] == "users.csv" and "u-1042" in results[0][0]["content"]
+    assert results[1][0]["filename"] == "app.log" and "14:05" in results[1][0]["content"]
+    assert {item["filename"] for item in results[2]} == {"guide.md"}
+    assert {item["filename"] for item in results[3]} >= {"guide.md", "notes.txt"}
+
+
+def test_parse_jsonl_validates_filters():
+    items = parse_jsonl([
+        '{"query": "a", "filters": {"extensions": ["py"], "modified_after": "2024-01-01T00:00:00Z"}}',
+        '{"query": "b", "filters": {"repo": "other"}}',
+        '{"query": "c", "filters": {"modified_before": "yesterday"}}',
+    ])
+    assert items[0]["filters"] == {"extensions": ["py"], "modified_after": 1704067200.0}
+    assert "error" in items[1] and "error" in items[2]
+
+
+def test_search_batch_matches_individual_searches():
+    from search_index import ChunkIndex
+
+    index = ChunkIndex.build({f"doc{i}.md": f"alpha beta {'gamma ' * i} delta{i}\n\nepsilon {i}" for i in range(20)})
+    weights = [{"alpha": 1.0}, {"gamma": 1.0, "delta3": 2.0}, {"missing": 1.0}, {"epsilon": 1.0, "beta": 0.5}]
+    assert index.search_batch(weights, 3) == [index.search(terms, 3) for terms in weights]
+
+
+def test_run_batch_reports_bad_lines_and_answers_every_query(monkeypatch):
+    import asyncio
+
+    import llm_client
+    from batch_query import run_batch
+    from search_index import ChunkIndex
+
+    index = ChunkIndex.build({"a.md": "alpha beta", "b.md": "gamma delta"})
+    items = parse_jsonl(['{"id": "q1", "query": "alpha"}', "not json", '{"id": "q2", "query": "gamma"}'])
+    calls = []
+
+    async def conversation(api_key, prompt, follow_up_query):
+        calls.append(prompt)
+        return {"answer": prompt.upper()}
+
+    def build_prompt(query, chunks):
+        return query + ":" + ",".join(chunk["filename"] for chunk in chunks)
+
+    async def collect(retrieve_only):
+        return [result async for result in run_batch(items, index, "key", build_prompt, "sure?",
+                                                     retrieve_only=retrieve_only)]
+
+    monkeypatch.setattr(llm_client, "run_rag_conversation", conversation)
+    results = {result["id"]: result for result in asyncio.run(collect(False))}
+    assert results[2]["line"] == 2 and "error" in results[2]
+    assert results["q1"]["answer"] == "ALPHA:A.MD" and results["q1"]["sources"][0]["filename"] == "a.md"
+    assert results["q2"]["answer"] == "GAMMA:B.MD"
+    assert len(calls) == 2
+
+    # 只检索时不调用LLM
+    results = {result["id"]: result for result in asyncio.run(collect(True))}
+    assert "answer" not in results["q1"] and results["q1"]["prompt_chars"] == len("alpha:a.md")
+    assert len(calls) == 2
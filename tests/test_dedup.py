@@ -0,0 +1,46 @@
+from dedup import NearDuplicateDetector, estimated_similarity, minhash_signature
+import search_index
+from query_analysis import tokenize
+from search_index import ChunkIndex
+
+BASE = ("the retrieval service splits every document into paragraphs and builds an inverted index "
+        "over the analyzed terms so that queries can be answered without scanning the corpus")
+NEAR = BASE.replace("every document", "each document")
+OTHER = ("the billing worker reads invoices from the queue, computes taxes for every line item "
+         "and writes the totals back to the ledger database before acknowledging the message")
+
+
+def test_minhash_estimates_jaccard_similarity():
+    base = minhash_signature(tokenize(BASE))
+    assert estimated_similarity(base, minhash_signature(tokenize(BASE))) == 1.0
+    assert estimated_similarity(base, minhash_signature(tokenize(NEAR))) >= 0.5
+    assert estimated_similarity(base, minhash_signature(tokenize(OTHER))) < 0.2
+
+
+def test_detector_collapses_near_duplicates():
+    detector = NearDuplicateDetector(threshold=0.5, min_tokens=8)
+    assert detector.find_or_add(0, BASE, tokenize(BASE)) is None
+    # 仅空白不同：内容哈希直接命中
+    assert detector.find_or_add(1, BASE.replace(" ", "  \n"), tokenize(BASE)) == 0
+    assert detector.find_or_add(2, NEAR, tokenize(NEAR)) == 0
+    assert detector.find_or_add(3, OTHER, tokenize(OTHER)) is None
+    # 短片段不参与检测
+    assert detector.find_or_add(4, "see above", tokenize("see above")) is None
+    assert detector.snapshot() == {"checked": 4, "duplicates": 2, "representatives": 2}
+
+    detector.discard(0)
+    assert detector.find_or_add(5, BASE, tokenize(BASE)) is None
+
+
+def test_index_keeps_one_representative_with_sources(monkeypatch):
+    monkeypatch.setattr(search_index, "DEDUP_ENABLED", True)
+    index = ChunkIndex.build({"a.md": BASE, "b.md": BASE, "c.md": OTHER})
+    results = index.search({"inverted": 1.0, "index": 1.0}, 5)
+    assert [item["filename"] for item in results] == ["a.md"]
+    assert results[0]["sources"] == [("b.md", 0)]
+
+    # 删除代表片段后，重复的片段重新成为代表并进入倒排表
+    index.update({"a.md": None})
+    results = index.search({"inverted": 1.0, "index": 1.0}, 5)
+    assert [item["filename"] for item in results] == ["b.md"]
+    assert "sources" not in results[0]
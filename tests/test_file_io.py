@@ -0,0 +1,53 @@
+import asyncio
+import os
+import threading
+
+import file_io
+from file_io import DirectoryListing
+
+
+def test_write_bytes_replaces_the_file_atomically(tmp_path):
+    target = tmp_path / "prompt_config.json"
+    target.write_text("old", encoding="utf-8")
+    file_io.write_bytes(str(target), b'{"system_prompt": "new"}')
+    assert target.read_bytes() == b'{"system_prompt": "new"}'
+    # 不留下临时文件
+    assert os.listdir(tmp_path) == ["prompt_config.json"]
+    assert file_io.stat_file(str(target)).st_size == len(b'{"system_prompt": "new"}')
+    assert file_io.stat_file(str(tmp_path)) is None
+    assert file_io.stat_file(str(tmp_path / "missing.md")) is None
+
+
+def test_run_io_uses_the_file_io_pool():
+    async def scenario():
+        return await file_io.run_io(lambda: threading.current_thread().name), threading.current_thread().name
+
+    worker, loop_thread = asyncio.run(scenario())
+    assert worker.startswith("file-io") and worker != loop_thread
+
+
+def test_listing_is_cached_until_the_directory_changes(tmp_path):
+    for name in ("b.md", "a.md", "c.md"):
+        (tmp_path / name).write_text(name * 10, encoding="utf-8")
+    (tmp_path / "sub").mkdir()
+    listing = DirectoryListing(str(tmp_path), ttl=60)
+
+    async def scenario():
+        first = await listing.page(0, 2)
+        again = await listing.page(2, 2)
+        assert listing.scans == 1
+        assert [item["name"] for item in first["files"]] == ["a.md", "b.md"] and first["total"] == 3
+        assert [item["name"] for item in again["files"]] == ["c.md"]
+
+        # 新增文件改变目录的修改时间，下一次请求重新读取
+        (tmp_path / "d.md").write_text("d", encoding="utf-8")
+        os.utime(tmp_path, ns=(0, os.stat(tmp_path).st_mtime_ns + 10 ** 9))
+        by_size = await listing.page(0, 10, sort="size", descending=True)
+        assert listing.scans == 2 and by_size["total"] == 4
+        assert by_size["files"][-1]["name"] == "d.md"
+
+        listing.invalidate()
+        await listing.entries()
+        assert listing.scans == 3
+
+    asyncio.run(scenario())
@@ -0,0 +1,47 @@
+import file_sniffer
+from file_sniffer import detect_encoding, read_text_file, sniff_file
+
+
+def test_binary_files_are_rejected(tmp_path):
+    image = tmp_path / "logo.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + bytes(range(256)))
+    assert sniff_file(str(image)) == (None, "binary")
+    # 没有NUL字节，但既不是UTF-8也不是GB18030
+    noise = tmp_path / "data.txt"
+    noise.write_bytes(bytes([0x80, 0xff, 0xfd, 0x81]) * 200)
+    assert sniff_file(str(noise))[0] is None
+
+
+def test_minified_and_generated_files_are_rejected(tmp_path):
+    bundle = tmp_path / "bundle.js"
+    bundle.write_text("var a=1;" * 2000, encoding="utf-8")
+    assert sniff_file(str(bundle)) == (None, "generated")
+    lock = tmp_path / "package-lock.json"
+    lock.write_text('{"name": "demo"}\n', encoding="utf-8")
+    assert sniff_file(str(lock)) == (None, "generated")
+    assert sniff_file(str(tmp_path / "app.min.js")) == (None, "generated")
+    # 文档的段落可以整段写在一行里
+    prose = tmp_path / "notes.md"
+    prose.write_text(("一段很长的说明文字。" * 60 + "\n") * 3, encoding="utf-8")
+    assert sniff_file(str(prose)) == ("utf-8", "text")
+
+
+def test_encodings_are_detected_from_the_prefix(tmp_path, monkeypatch):
+    assert detect_encoding("配置说明".encode("utf-8-sig")) == "utf-8-sig"
+    assert detect_encoding("配置说明".encode("utf-16")) == "utf-16"
+    assert detect_encoding("配置说明，请先阅读。".encode("gb18030")) == "gb18030"
+    # 前缀在多字节字符中间截断时仍判断为UTF-8
+    assert detect_encoding("中文内容".encode("utf-8")[:-1]) == "utf-8"
+
+    monkeypatch.setattr(file_sniffer, "SNIFF_BYTES", 16)
+    legacy = tmp_path / "legacy.txt"
+    legacy.write_bytes("旧系统导出的文档，使用GBK编码。".encode("gb18030"))
+    assert read_text_file(str(legacy)) == "旧系统导出的文档，使用GBK编码。"
+
+
+def test_large_files_are_skipped_without_reading(tmp_path):
+    large = tmp_path / "dump.sql"
+    large.write_text("insert into t values (1);\n" * 100, encoding="utf-8")
+    before = file_sniffer.stats.snapshot().get("skipped_too_large", 0)
+    assert read_text_file(str(large), max_bytes=100) is None
+    assert file_sniffer.stats.snapshot()["skipped_too_large"] == before + 1
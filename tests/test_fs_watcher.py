@@ -0,0 +1,63 @@
+import os
+import time
+
+from fs_watcher import DirectoryWatcher
+
+
+def wait_for(condition, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not condition():
+        time.sleep(0.02)
+    return condition()
+
+
+def test_marked_changes_are_not_reported_again(tmp_path):
+    batches = []
+    watcher = DirectoryWatcher([str(tmp_path)], lambda paths, overflow: batches.append(paths),
+                               backend="polling", debounce=0.05, max_delay=0.2, poll_interval=0.05)
+    watcher.start()
+    try:
+        path = os.path.join(str(tmp_path), "upload.txt")
+        # 上传接口：写入后自己更新了索引
+        with open(path, "w") as f:
+            f.write("first")
+        watcher.mark_applied(path)
+        time.sleep(0.4)
+        assert batches == []
+        assert watcher.counters["skipped"] == 1
+
+        # 之后文件又被别处修改，仍要回调
+        with open(path, "w") as f:
+            f.write("changed again")
+        assert wait_for(lambda: batches == [{path}])
+
+        # 删除接口
+        os.remove(path)
+        watcher.mark_applied(path)
+        time.sleep(0.4)
+        assert batches == [{path}]
+    finally:
+        watcher.stop()
+
+
+def test_inotify_failure_closes_descriptor_before_polling(tmp_path, monkeypatch):
+    import fs_watcher
+
+    created = []
+
+    class FailingInotify(fs_watcher.InotifyBackend):
+        def __init__(self, skip_dirs):
+            super().__init__(skip_dirs)
+            created.append(self)
+
+        def add_tree(self, root):
+            raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(fs_watcher, "InotifyBackend", FailingInotify)
+    watcher = DirectoryWatcher([str(tmp_path)], lambda paths, overflow: None, backend="auto")
+    watcher.start()
+    try:
+        assert watcher.backend_name == "polling"
+        assert len(created) == 1 and created[0]._fd == -1
+    finally:
+        watcher.stop()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import git_history
+from git_history import CommitHistory, is_history_file, parse_commit_chunk
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="需要git")
+
+
+def git(repo, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME="Li Lei", GIT_AUTHOR_EMAIL="lilei@example.com",
+               GIT_COMMITTER_NAME="Li Lei", GIT_COMMITTER_EMAIL="lilei@example.com",
+               GIT_AUTHOR_DATE="2024-01-02T10:00:00+00:00", GIT_COMMITTER_DATE="2024-01-02T10:00:00+00:00")
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, env=env)
+
+
+def commit_file(repo, name, content, message):
+    (repo / name).write_text(content, encoding="utf-8")
+    git(repo, "add", name)
+    git(repo, "commit", "-q", "-m", message)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    commit_file(tmp_path, "retry.py", "ATTEMPTS = 3\n", "# Add retry budget\n\nThree attempts by default.")
+    return tmp_path
+
+
+def test_commits_are_rendered_and_parsed(repo):
+    history = CommitHistory()
+    changed = history.ingest(str(repo))
+    assert changed == [os.path.join(git_history.HISTORY_DIR, "00001.gitlog")]
+    assert all(is_history_file(path) for path in changed) and not is_history_file("retry.py")
+
+    content = history.documents(str(repo))[changed[0]]
+    # 以#开头的提交说明行被转义，不会变成Markdown标题
+    assert "\n\\# Add retry budget\nThree attempts by default.\n" in content
+    assert "  +1 -0 retry.py" in content and "+ATTEMPTS = 3" in content
+    author, timestamp, paths = parse_commit_chunk(content)
+    assert author == "Li Lei <lilei@example.com>" and paths == ["retry.py"]
+    assert timestamp == 1704189600
+    assert parse_commit_chunk("## 安装\n步骤") is None
+
+    # HEAD没有变化时不重新导入
+    assert history.ingest(str(repo)) == [] and history.runs == 1
+
+
+def test_new_commits_are_appended_to_shards(repo, monkeypatch):
+    monkeypatch.setattr(git_history, "GIT_HISTORY_SHARD_COMMITS", 2)
+    history = CommitHistory()
+    history.ingest(str(repo))
+    commit_file(repo, "timeout.py", "TIMEOUT = 30\n", "Add timeout")
+    commit_file(repo, "limits.py", "LIMIT = 10\n", "Add limits")
+    changed = history.ingest(str(repo))
+    # 只读取上次HEAD之后的提交：第二个提交追加到第一个分片，第三个开始新分片
+    assert changed == [os.path.join(git_history.HISTORY_DIR, name) for name in ("00001.gitlog", "00002.gitlog")]
+    assert history.commits_ingested == 3
+    documents = history.documents(str(repo))
+    assert documents[changed[0]].count("## 提交 ") == 2 and "Add limits" in documents[changed[1]]
+
+    # 历史被改写时丢弃已有分片重新导入
+    git(repo, "reset", "-q", "--hard", "HEAD~2")
+    commit_file(repo, "other.py", "X = 1\n", "Rewrite history")
+    history.ingest(str(repo))
+    documents = history.documents(str(repo))
+    assert list(documents) == [os.path.join(git_history.HISTORY_DIR, "00003.gitlog")]
+    assert "Add timeout" not in documents[list(documents)[0]]
+
+
+def test_oldest_shards_are_dropped(repo, monkeypatch):
+    monkeypatch.setattr(git_history, "GIT_HISTORY_SHARD_COMMITS", 1)
+    monkeypatch.setattr(git_history, "GIT_HISTORY_MAX_COMMITS", 2)
+    history = CommitHistory()
+    history.ingest(str(repo))
+    for i in range(3):
+        commit_file(repo, f"file{i}.py", f"N = {i}\n", f"Commit {i}")
+        history.ingest(str(repo))
+    documents = history.documents(str(repo))
+    assert len(documents) == 2
+    assert "Commit 2" in "".join(documents.values()) and "Commit 0" not in "".join(documents.values())
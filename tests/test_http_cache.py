@@ -0,0 +1,83 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import http_cache
+from http_cache import CacheControlMiddleware, StaticDocument, etag_matches, json_response, negotiate_encoding
+
+LARGE = {"items": [f"片段 {i} 的内容" for i in range(500)]}
+
+
+def make_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    monkeypatch.setattr(http_cache, "HTTP_STATIC_MAX_AGE", 3600)
+    monkeypatch.setattr(http_cache, "compressed", http_cache.CompressionCache())
+    index = tmp_path / "index.html"
+    index.write_text("<html>首页</html>", encoding="utf-8")
+    home = StaticDocument(str(index), "text/html")
+    app = FastAPI()
+    app.add_middleware(CacheControlMiddleware)
+
+    @app.get("/large")
+    async def large(request: Request):
+        return await json_response(request, LARGE)
+
+    @app.get("/small")
+    async def small(request: Request):
+        return await json_response(request, {"ok": True}, http_cache.NO_STORE)
+
+    @app.get("/plain")
+    async def plain():
+        return {"ok": True}
+
+    @app.get("/")
+    async def root(request: Request):
+        return await home.response(request)
+
+    return TestClient(app), index
+
+
+def test_negotiation_and_etag_matching(monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    assert negotiate_encoding("gzip, deflate, br") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("*") == "gzip"
+    assert negotiate_encoding(None) is None
+    # 客户端缓存的是压缩表示时也按内容命中
+    assert etag_matches('W/"abc-gz", "other"', '"abc"')
+    assert etag_matches("*", '"abc"') and not etag_matches('"abd"', '"abc"')
+
+
+def test_large_responses_are_gzipped_and_revalidated(tmp_path, monkeypatch):
+    client, _ = make_client(tmp_path, monkeypatch)
+    first = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["content-encoding"] == "gzip" and first.json() == LARGE
+    assert first.headers["vary"] == "Accept-Encoding" and first.headers["cache-control"] == "no-cache"
+    etag = first.headers["etag"]
+    assert etag.endswith('-gz"')
+
+    plain = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.headers["etag"] != etag
+    assert plain.json() == LARGE
+
+    revalidated = client.get("/large", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+    assert revalidated.headers["etag"] == etag
+    # 压缩结果按ETag缓存，相同内容只压缩一次
+    client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert http_cache.compressed.snapshot()["hits"] == 1
+
+
+def test_small_responses_and_default_policies(tmp_path, monkeypatch):
+    client, index = make_client(tmp_path, monkeypatch)
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers and small.headers["cache-control"] == "no-store"
+    # 中间件为没有设置策略的响应补上no-store
+    assert client.get("/plain").headers["cache-control"] == "no-store"
+
+    home = client.get("/")
+    assert home.text == "<html>首页</html>"
+    assert client.get("/", headers={"If-None-Match": home.headers["etag"]}).status_code == 304
+    index.write_text("<html>新首页</html>", encoding="utf-8")
+    changed = client.get("/", headers={"If-None-Match": home.headers["etag"]})
+    assert changed.status_code == 200 and changed.text == "<html>新首页</html>"
+    assert CacheControlMiddleware(None)._policy("/static/app.js", []) == "public, max-age=3600"
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import search_index
+from search_index import ChunkIndex, IndexRegistry
+
+
+def make_registry(folder, fingerprints):
+    def loader(folder_path):
+        return {path.name: path.read_text(encoding="utf-8") for path in folder.iterdir()}
+
+    def fingerprint(folder_path):
+        fingerprints.append(folder_path)
+        return ",".join(f"{path.name}:{path.stat().st_mtime_ns}" for path in sorted(folder.iterdir()))
+
+    def reader(folder_path, relative_path):
+        path = folder / relative_path
+        return path.read_text(encoding="utf-8") if path.exists() else None
+
+    return IndexRegistry(loader, fingerprint, reader)
+
+
+def test_unwatched_collection_is_fingerprinted_at_most_once_per_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "INDEX_FINGERPRINT_INTERVAL", 0.2)
+    (tmp_path / "a.md").write_text("alpha", encoding="utf-8")
+    fingerprints = []
+    registry = make_registry(tmp_path, fingerprints)
+
+    index = registry.get(str(tmp_path))
+    for _ in range(50):
+        assert registry.get(str(tmp_path)) is index
+    assert len(fingerprints) == 1 and registry.is_cached(str(tmp_path))
+
+    # 外部修改在间隔过后被发现
+    (tmp_path / "b.md").write_text("beta", encoding="utf-8")
+    time.sleep(0.25)
+    assert not registry.is_cached(str(tmp_path))
+    rebuilt = registry.get(str(tmp_path))
+    assert rebuilt is not index and "b.md" in rebuilt.file_numbers
+    assert len(fingerprints) == 2
+
+
+def test_query_searches_while_holding_the_index_lock(monkeypatch):
+    import app
+    from query_plan import QueryPlan
+
+    index = ChunkIndex.build({"a.md": "alpha beta", "b.md": "gamma delta"})
+    held = []
+    original = QueryPlan.search
+
+    def search(self, searched_index, top_k):
+        def try_lock():
+            acquired = searched_index.lock.acquire(blocking=False)
+            if acquired:
+                searched_index.lock.release()
+            held.append(not acquired)
+
+        # 后台更新线程此时拿不到锁
+        probe = threading.Thread(target=try_lock)
+        probe.start()
+        probe.join()
+        return original(self, searched_index, top_k)
+
+    monkeypatch.setattr(QueryPlan, "search", search)
+    assert app.retrieve_relevant_content("alpha", index)[0]["filename"] == "a.md"
+    assert held == [True]
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_create_components():
+    # 在新进程中导入，检查导入时没有创建监听器和索引，也没有导入只在运行时才用到的httpx、ctypes
+    code = ("import sys, app; "
+            "assert app.file_watcher is None and app.index_registry is None; "
+            "assert 'httpx' not in sys.modules and 'ctypes' not in sys.modules")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
+def test_readiness_flips_after_index_warm_up(tmp_path, monkeypatch):
+    import app
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, "DOCS_FOLDER", "docs")
+    monkeypatch.setattr(app, "GIT_REPOS_FOLDER", "git_repos")
+    monkeypatch.setattr(app, "CONFIG_FOLDER", "config")
+    # 测试结束后恢复为未创建的状态
+    monkeypatch.setattr(app, "file_watcher", None)
+    monkeypatch.setattr(app, "index_registry", None)
+    # 其他测试可能已经跑过启动流程，从初始状态开始
+    components = {name: dict(component, status="pending" if component["status"] != "disabled" else "disabled",
+                             seconds=None, error=None)
+                  for name, component in app.lifecycle.components.items()}
+    components["index"]["required"] = True
+    monkeypatch.setattr(app.lifecycle, "components", components)
+    monkeypatch.setattr(app.lifecycle, "startup_began", None)
+    monkeypatch.setattr(app.lifecycle, "ready_at", None)
+    monkeypatch.setattr(app.lifecycle, "shutting_down", False)
+
+    release = threading.Event()
+    original_loader = app.load_documents
+
+    def slow_loader(folder_path):
+        release.wait(10)
+        return original_loader(folder_path)
+
+    monkeypatch.setattr(app, "load_documents", slow_loader)
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "a.md").write_text("alpha beta", encoding="utf-8")
+
+    with TestClient(app.app) as client:
+        assert app.index_registry is not None
+        # 预热索引期间：存活检查可用，就绪检查返回503
+        assert client.get("/health/live").status_code == 200
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["components"]["index"]["status"] in ("pending", "starting")
+
+        release.set()
+        for _ in range(200):
+            response = client.get("/health/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.05)
+        assert response.status_code == 200
+        assert response.json()["components"]["index"]["status"] == "ready"
+    # 关闭后不再就绪
+    assert not app.lifecycle.is_ready()
@@ -0,0 +1,176 @@
+import asyncio
+
+import httpx
+import pytest
+
+from llm_transport import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, LLMError, LLMTransport
+
+URL = "http://upstream.test/chat"
+
+
+class FaultyUpstream:
+    """故障注入的上游桩：按mode返回错误、成功或一直挂起"""
+
+    def __init__(self):
+        self.mode = "fail"
+        self.calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.mode == "hang":
+            await asyncio.Event().wait()
+        if self.mode == "fail":
+            return httpx.Response(503, text="unavailable")
+        if self.mode == "throttle":
+            return httpx.Response(429, headers={"Retry-After": "0"}, text="slow down")
+        if self.mode == "bad_request":
+            return httpx.Response(400, text="bad request")
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+
+def make_transport(upstream: FaultyUpstream, threshold: int = 2, reset: float = 0.05) -> LLMTransport:
+    transport = LLMTransport(max_retries=0, backoff_base=0.001)
+    transport._client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    transport._breakers[URL] = CircuitBreaker(threshold, reset)
+    return transport
+
+
+async def open_breaker(transport: LLMTransport):
+    for _ in range(transport.breaker(URL).threshold):
+        with pytest.raises(LLMError):
+            await transport.post_json(URL, "key", {})
+    assert transport.breaker(URL).state == "open"
+    with pytest.raises(CircuitOpenError):
+        await transport.post_json(URL, "key", {})
+
+
+def test_breaker_opens_and_recovers_after_successful_probe():
+    async def scenario():
+        upstream = FaultyUpstream()
+        transport = make_transport(upstream)
+        await open_breaker(transport)
+        await asyncio.sleep(0.06)
+        upstream.mode = "ok"
+        assert (await transport.post_json(URL, "key", {}))["choices"]
+        assert transport.breaker(URL).state == "closed"
+        await transport.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    async def scenario():
+        upstream = FaultyUpstream()
+        transport = make_transport(upstream)
+        await open_breaker(transport)
+        await asyncio.sleep(0.06)
+
+        # 探测请求挂起时客户端断开
+        upstream.mode = "hang"
+        probe = asyncio.ensure_future(transport.post_json(URL, "key", {}))
+        await asyncio.sleep(0.01)
+        assert transport.breaker(URL).state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        upstream.mode = "ok"
+        assert (await transport.post_json(URL, "key", {}))["choices"]
+        assert transport.breaker(URL).state == "closed"
+        await transport.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_probe_out_of_deadline_releases_half_open_slot():
+    async def scenario():
+        upstream = FaultyUpstream()
+        transport = make_transport(upstream)
+        await open_breaker(transport)
+        await asyncio.sleep(0.06)
+
+        expired = Deadline(0)
+        with pytest.raises(DeadlineExceeded):
+            await transport.post_json(URL, "key", {}, deadline=expired)
+
+        upstream.mode = "ok"
+        assert (await transport.post_json(URL, "key", {}))["choices"]
+        await transport.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_throttled_probe_reopens_breaker():
+    async def scenario():
+        upstream = FaultyUpstream()
+        transport = make_transport(upstream)
+        await open_breaker(transport)
+        await asyncio.sleep(0.06)
+
+        # 上游仍然饱和：探测收到429，不能关闭熔断器
+        upstream.mode = "throttle"
+        with pytest.raises(LLMError):
+            await transport.post_json(URL, "key", {})
+        assert transport.breaker(URL).state == "open"
+        with pytest.raises(CircuitOpenError):
+            await transport.post_json(URL, "key", {})
+        await transport.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_client_errors_neither_close_nor_reset_breaker():
+    async def scenario():
+        upstream = FaultyUpstream()
+        transport = make_transport(upstream, threshold=2)
+        breaker = transport.breaker(URL)
+
+        # 关闭状态：400和429不清零连续失败计数
+        with pytest.raises(LLMError):
+            await transport.post_json(URL, "key", {})
+        for mode in ("bad_request", "throttle"):
+            upstream.mode = mode
+            with pytest.raises(LLMError):
+                await transport.post_json(URL, "key", {})
+        assert breaker.state == "closed" and breaker.failures == 1
+
+        upstream.mode = "fail"
+        with pytest.raises(LLMError):
+            await transport.post_json(URL, "key", {})
+        assert breaker.state == "open"
+        await asyncio.sleep(0.06)
+
+        # 半开：探测收到400，只释放探测名额，下一个请求继续探测
+        upstream.mode = "bad_request"
+        with pytest.raises(LLMError):
+            await transport.post_json(URL, "key", {})
+        assert breaker.state == "half_open"
+        upstream.mode = "ok"
+        assert (await transport.post_json(URL, "key", {}))["choices"]
+        assert breaker.state == "closed"
+        await transport.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_retryable_errors_are_retried_until_success():
+    async def scenario():
+        upstream = FaultyUpstream()
+        transport = make_transport(upstream, threshold=5)
+        transport.max_retries = 3
+        original = upstream.__call__
+
+        async def flaky(request):
+            if upstream.calls < 2:
+                upstream.calls += 1
+                return httpx.Response(503, headers={"Retry-After": "0"})
+            upstream.mode = "ok"
+            return await original(request)
+
+        transport._client = httpx.AsyncClient(transport=httpx.MockTransport(flaky))
+        assert (await transport.post_json(URL, "key", {}))["choices"]
+        assert transport.counters["retries"] == 2
+        assert transport.breaker(URL).state == "closed"
+        await transport.aclose()
+
+    asyncio.run(scenario())
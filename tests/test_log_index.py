@@ -0,0 +1,85 @@
+import calendar
+
+import log_index
+from log_index import LogStore, parse_time_ranges
+
+DAY = calendar.timegm((2024, 1, 2, 0, 0, 0, 0, 0, 0))
+
+
+def at(hour, minute, second=0):
+    return DAY + hour * 3600 + minute * 60 + second
+
+
+def log_lines(minutes):
+    lines = []
+    for minute in minutes:
+        lines.append(f"2024-01-02 14:{minute:02d}:00 INFO request {minute} handled\n")
+        if minute == 7:
+            lines.append("Traceback (most recent call last):\n  File \"app.py\", line 1\n")
+    return "".join(lines)
+
+
+def test_parse_time_ranges():
+    assert parse_time_ranges("2024-01-02 的错误日志") == [(DAY, DAY + 86400, True)]
+    window = log_index.LOG_QUERY_WINDOW_SECONDS
+    assert parse_time_ranges("14:05 的报错") == [(at(14, 5) - DAY - window, at(14, 6) - DAY + window, False)]
+    # 结束时间沿用开始时间的日期
+    assert parse_time_ranges("2024-01-02 14:05 到 14:20") == [(at(14, 5), at(14, 21), True)]
+    assert parse_time_ranges("23:50-00:10") == [(at(23, 50) - DAY, at(0, 11) - DAY + 86400, False)]
+    assert parse_time_ranges("版本 3.14 的日志") == []
+
+
+def test_find_segments_in_ordered_log(tmp_path):
+    (tmp_path / "app.log").write_text(log_lines(range(20)), encoding="utf-8")
+    store = LogStore()
+    content = store.load(str(tmp_path), "app.log")
+    log = store.get(str(tmp_path), "app.log")
+    assert log.ordered and len(log.segments) == 20
+    # 每分钟一段，段首注明时间范围和行号；堆栈行归入前一个条目所在的段
+    paragraphs = content.split("\n\n")
+    assert paragraphs[7].startswith("## 2024-01-02 14:07:00 ~ 2024-01-02 14:07:00 | 第8-10行")
+    assert "Traceback" in paragraphs[7]
+
+    assert log.find((at(14, 5), at(14, 7, 30), True)) == [5, 6, 7]
+    assert log.find((at(15, 0), at(15, 30), True)) == []
+    # 不带日期的时间范围落到文件的最后一天
+    assert log.find((at(14, 18) - DAY, at(14, 30) - DAY, False)) == [18, 19]
+    assert store.resolve_query(str(tmp_path), "2024-01-02 14:03 到 14:04 的日志", []) == \
+        [("app.log", 3), ("app.log", 4), ("app.log", 5)]
+
+
+def test_find_segments_in_unordered_log(tmp_path):
+    (tmp_path / "merged.log").write_text(log_lines([0, 10, 5, 20, 3, 15]), encoding="utf-8")
+    store = LogStore()
+    store.load(str(tmp_path), "merged.log")
+    log = store.get(str(tmp_path), "merged.log")
+    assert not log.ordered
+    # 起始时间无序时不能二分结束位置，仍要找到文件后部的早期分段
+    assert log.find((at(14, 2), at(14, 6), True)) == [2, 4]
+    assert log.find((at(14, 14), at(14, 30), True)) == [3, 5]
+
+
+def test_appended_lines_are_parsed_incrementally(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text(log_lines(range(5)), encoding="utf-8")
+    store = LogStore()
+    store.load(str(tmp_path), "app.log")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(log_lines(range(5, 8)) + "2024-01-02 14:08:00 INFO partial")
+    content = store.load(str(tmp_path), "app.log")
+    assert store.incremental_loads == 1 and store.full_loads == 1
+    log = store.get(str(tmp_path), "app.log")
+    assert log.find((at(14, 6), at(14, 8), True)) == [6, 7, 8]
+    assert content.endswith("partial")
+
+    # 文件被轮转后重新解析
+    path.write_text("2024-01-03 09:00:00 INFO rotated\n", encoding="utf-8")
+    store.load(str(tmp_path), "app.log")
+    assert store.full_loads == 2 and store.get(str(tmp_path), "app.log").line_count == 1
+
+
+def test_log_queries_are_detected():
+    assert LogStore.is_log_query("昨天下午的报错", [])
+    assert LogStore.is_log_query("show stack traces", [])
+    assert LogStore.is_log_query("14:05 发生了什么", ["app.log"])
+    assert not LogStore.is_log_query("如何配置超时", ["guide.md"])
@@ -0,0 +1,37 @@
+from passages import PassageExtractor
+
+FILLER = "This paragraph talks about something unrelated to the question at hand."
+
+
+def long_chunk():
+    lines = [FILLER] * 10 + ["The retry budget is three attempts with exponential backoff."] + [FILLER] * 10 + \
+        ["Timeouts are configured with LLM_TIMEOUT in seconds."] + [FILLER] * 5
+    return {"filename": "guide.md", "chunk_id": 4, "start_line": 100, "content": "\n".join(lines)}
+
+
+def test_extracts_the_windows_that_cover_the_query_terms():
+    extractor = PassageExtractor(enabled=True)
+    item = long_chunk()
+    result = extractor.extract(item, {"retry": 1.0, "backoff": 1.0, "timeout": 0.5, "timeouts": 0.5})
+    assert result["excerpt"] is True
+    assert result["content"] == ("The retry budget is three attempts with exponential backoff."
+                                 "\n……\nTimeouts are configured with LLM_TIMEOUT in seconds.")
+    # 行号换算到原文件
+    assert result["lines"] == [(110, 110), (121, 121)]
+    assert result["filename"] == "guide.md" and item["content"] == long_chunk()["content"]
+    snapshot = extractor.snapshot()
+    assert snapshot["excerpted"] == 1 and snapshot["chars_after"] < snapshot["chars_before"]
+
+
+def test_short_chunks_definitions_and_misses_are_kept_whole():
+    extractor = PassageExtractor(enabled=True)
+    weights = {"retry": 1.0}
+    short = {"filename": "a.md", "chunk_id": 0, "content": "The retry budget is three attempts."}
+    assert extractor.extract(short, weights) is short
+    definition = dict(long_chunk(), chunk_id="10:40")
+    assert extractor.extract(definition, weights) is definition
+    no_hits = long_chunk()
+    assert extractor.extract(no_hits, {"database": 1.0}) is no_hits
+    # 关闭时原样返回
+    item = long_chunk()
+    assert PassageExtractor(enabled=False).extract(item, weights) is item
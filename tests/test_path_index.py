@@ -0,0 +1,52 @@
+from path_index import PathIndex, extract_path_mentions
+from search_index import ChunkIndex
+
+PATHS = ["app.py", "src/app.py", "src/utils/helpers.py", "docs/guide.md", "docs/api/auth.md", "notes/mysql中的事务.md"]
+
+
+def test_suffix_lookup_matches_whole_components():
+    paths = PathIndex(PATHS)
+    assert sorted(paths.lookup_suffix("app.py")) == ["app.py", "src/app.py"]
+    assert paths.lookup_suffix("src/app.py") == ["src/app.py"]
+    assert paths.lookup_suffix("SRC\\App.py") == ["src/app.py"]
+    # 后缀必须是完整的路径组件
+    assert paths.lookup_suffix("pp.py") == []
+    assert paths.lookup_suffix("utils/app.py") == []
+
+
+def test_directory_prefix_and_embedded_file_names():
+    paths = PathIndex(PATHS)
+    assert paths.resolve("docs/") == ["docs/api/auth.md", "docs/guide.md"]
+    # 文件名和其他文字粘连：通过n-gram找到候选，再确认是子串
+    assert paths.lookup_embedded("看看mysql中的事务.md里怎么说") == ["notes/mysql中的事务.md"]
+    assert paths.lookup_embedded("guide") == []
+
+
+def test_remove_prunes_trie_and_ngrams():
+    paths = PathIndex(PATHS)
+    paths.remove("src/app.py")
+    assert paths.lookup_suffix("app.py") == ["app.py"]
+    assert paths.lookup_suffix("src/app.py") == []
+    paths.remove("notes/mysql中的事务.md")
+    assert paths.lookup_embedded("mysql中的事务.md") == []
+    paths.remove("docs/api/auth.md")
+    assert paths.lookup_prefix("docs/api") == []
+    assert len(paths) == len(PATHS) - 3
+
+
+def test_query_mentions_are_resolved_in_order():
+    assert extract_path_mentions("比较 `src/app.py` 和 helpers.py，以及 docs/ 目录") == \
+        ["src/app.py", "helpers.py", "docs/"]
+    paths = PathIndex(PATHS)
+    assert paths.resolve_query("helpers.py 调用了 src/app.py 吗？") == ["src/utils/helpers.py", "src/app.py"]
+
+
+def test_mentioned_file_is_returned_first():
+    index = ChunkIndex.build({
+        "README.md": "the config loader reads settings",
+        "src/loader.py": "def load(): pass",
+        "docs/config.md": "config config config loader settings",
+    })
+    mentioned = index.paths.resolve_query("loader.py 的 config")
+    results = index.search({"config": 1.0, "loader": 1.0}, 2, priority_files=mentioned)
+    assert results[0]["filename"] == "src/loader.py"
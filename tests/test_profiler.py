@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import profiler
+
+
+def busy_worker(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_captures_other_threads_and_exports():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_worker, args=(stop,), name="busy")
+    worker.start()
+    try:
+        result = profiler.SamplingProfiler().sample(0.2, 0.005)
+    finally:
+        stop.set()
+        worker.join()
+    assert result["samples"] > 5
+    busy = [stack for stack in result["stacks"] if stack[0] == "busy"]
+    assert busy and any(frame.startswith("busy_worker (test_profiler.py:") for frame in busy[0])
+
+    collapsed = profiler.to_collapsed(result)
+    assert any(line.startswith("busy;") for line in collapsed.splitlines())
+    speedscope = profiler.to_speedscope(result)
+    profile = next(p for p in speedscope["profiles"] if p["name"] == "busy")
+    assert len(profile["samples"]) == len(profile["weights"])
+    assert all(0 <= frame < len(speedscope["shared"]["frames"]) for sample in profile["samples"] for frame in sample)
+
+
+def test_only_one_sampling_run_at_a_time():
+    sampler = profiler.SamplingProfiler()
+    started = threading.Event()
+    thread = threading.Thread(target=lambda: (started.set(), sampler.sample(0.3, 0.01)))
+    thread.start()
+    started.wait()
+    time.sleep(0.05)
+    with pytest.raises(profiler.ProfilerBusy):
+        sampler.sample(0.1)
+    thread.join()
+    assert sampler.runs == 1
+
+
+def slow_helper():
+    return sum(i * i for i in range(20000))
+
+
+def test_request_profile_includes_worker_threads():
+    profiles = profiler.RequestProfiles(keep=2)
+
+    async def handle_request():
+        profile = profiles.start()
+        assert profiles.start() is None  # 同一时间只分析一个请求
+        await asyncio.to_thread(profiler.profiled, slow_helper)
+        return profiles.finish(profile, "GET /query")
+
+    profile_id = asyncio.run(handle_request())
+    report = profiles.get(profile_id)
+    assert report.startswith("GET /query") and "slow_helper" in report
+    # 没有在分析的请求时，profiled直接执行
+    assert profiler.profiled(slow_helper) == slow_helper()
+
+    ids = [asyncio.run(handle_request()) for _ in range(2)]
+    assert profiles.get(profile_id) is None and all(profiles.get(i) for i in ids)
+
+
+def test_admin_token_is_required(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILING_ADMIN_TOKEN", "")
+    assert not profiler.check_admin_token("")
+    monkeypatch.setattr(profiler, "PROFILING_ADMIN_TOKEN", "secret")
+    assert profiler.check_admin_token("secret")
+    assert not profiler.check_admin_token("wrong") and not profiler.check_admin_token(None)
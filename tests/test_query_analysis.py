@@ -0,0 +1,22 @@
+from query_analysis import STOP_WORDS_ZH, SYNONYM_WEIGHT, SynonymTable, analyze_query, tokenize
+
+
+def test_single_character_stop_words_only_drop_standalone():
+    assert tokenize("是否 总是 于是 但是 还是") == ["总是", "于是", "但是"]
+    assert tokenize("首都 成就 目的") == ["首都", "成就", "目的"]
+    assert tokenize("的 是 和") == []
+    assert all(term not in STOP_WORDS_ZH for term in tokenize("我 请 你 说说 他们 怎么 部署"))
+
+
+def test_multi_character_stop_words_split_runs():
+    assert tokenize("如何配置数据库") == ["配置", "置数", "数据", "据库"]
+    assert tokenize("What does the B/S model mean?") == ["b/s", "model"]
+
+
+def test_synonyms_expand_with_lower_weight():
+    table = SynonymTable([["TS", "typescript"], ["部署", "上线"]])
+    weights = analyze_query("ts 部署 部署", table)
+    assert weights["部署"] == 2.0 and weights["ts"] == 1.0
+    assert weights["typescript"] == SYNONYM_WEIGHT and weights["上线"] == SYNONYM_WEIGHT
+    # 英文短语按单词边界匹配
+    assert "typescript" not in analyze_query("requests timeout", table)
@@ -0,0 +1,51 @@
+import retrieval_cache
+from retrieval_cache import RetrievalCache
+from search_index import ChunkIndex
+
+
+def test_lru_eviction_and_generation_invalidation(tmp_path):
+    folder = str(tmp_path)
+    cache = RetrievalCache(max_entries=2)
+    keys = [cache.make_key(folder, [(term, 1.0)], 2) for term in ("alpha", "beta", "gamma")]
+    for key in keys:
+        cache.put(key, [("a.md", 0, 1.0, 1)])
+    # 最久未使用的条目被淘汰
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == [("a.md", 0, 1.0, 1)]
+    assert cache.evictions == 1 and cache.memory_bytes > 0
+
+    # 版本号递增后，旧条目被清除，新的键不会命中旧结果
+    stale_key = keys[2]
+    generation = retrieval_cache.generations.bump(folder)
+    cache.invalidate(retrieval_cache.collection_key(folder), generation)
+    assert cache.get(stale_key) is None
+    assert cache.make_key(folder, [("gamma", 1.0)], 2) != stale_key
+
+    # 基于旧版本号算出的结果不会写入
+    cache.put(stale_key, [("a.md", 0, 1.0, 1)])
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_query_results_are_cached_until_the_corpus_changes(tmp_path, monkeypatch):
+    import app
+
+    cache = RetrievalCache(max_entries=16)
+    monkeypatch.setattr(retrieval_cache, "cache", cache)
+    folder = str(tmp_path)
+    index = ChunkIndex.build({"a.md": "alpha beta", "b.md": "gamma delta", "c.md": "alpha gamma"})
+
+    first = app.retrieve_relevant_content("alpha", index, 2, folder_path=folder)
+    assert cache.misses == 1 and cache.snapshot()["entries"] == 1
+    second = app.retrieve_relevant_content("alpha", index, 2, folder_path=folder)
+    assert cache.hits == 1
+    assert [(item["filename"], item["chunk_id"]) for item in second] == \
+        [(item["filename"], item["chunk_id"]) for item in first]
+
+    # top_k不同是不同的缓存条目
+    app.retrieve_relevant_content("alpha", index, 1, folder_path=folder)
+    assert cache.misses == 2
+
+    # 语料变化后重新检索
+    retrieval_cache.generations.bump(folder)
+    app.retrieve_relevant_content("alpha", index, 2, folder_path=folder)
+    assert cache.misses == 3 and cache.hits == 1
@@ -0,0 +1,34 @@
+import os
+
+from query_analysis import analyze_query
+from search_index import ChunkIndex
+
+SHARED = "部署时需要先配置 replicas 副本数量，然后执行 rollout restart 重启服务，最后检查 readiness 探针状态是否正常"
+
+
+def build_index() -> ChunkIndex:
+    documents = {
+        os.path.join("docs", "deploy.md"): "# 部署\n\n" + SHARED,
+        os.path.join("other", "copy.md"): "# 副本\n\n" + SHARED,
+        os.path.join("other", "unrelated.md"): "# 其他\n\n这里介绍日志格式和字段含义",
+    }
+    return ChunkIndex.build(documents)
+
+
+def test_filtered_duplicate_is_found_through_its_representative():
+    index = build_index()
+    assert index.duplicate_of, "两个文件中的相同片段应被合并为一组重复片段"
+
+    allowed = index.metadata.select(path_prefix="other")
+    results = index.search(analyze_query("rollout restart replicas"), top_k=2, allowed=allowed)
+
+    assert results, "过滤范围内有命中的重复片段时不能返回空结果"
+    assert results[0]["filename"] == os.path.join("other", "copy.md")
+    assert results[0]["score"] > 0
+
+
+def test_unfiltered_search_still_returns_representative():
+    index = build_index()
+    results = index.search(analyze_query("rollout restart replicas"), top_k=1)
+    assert results[0]["filename"] == os.path.join("docs", "deploy.md")
+    assert results[0]["sources"] == [(os.path.join("other", "copy.md"), 1)]
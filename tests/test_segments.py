@@ -0,0 +1,62 @@
+from segments import (MERGE_FACTOR, build_segment, decode_varints, encode_varints, merge_segments, pack_posting,
+                      pick_merge)
+from search_index import ChunkIndex
+
+
+def test_varint_round_trip():
+    values = [0, 1, 127, 128, 255, 300, 16383, 16384, 2 ** 31, 2 ** 63 - 1]
+    data = encode_varints(values)
+    assert decode_varints(data) == values
+    assert len(encode_varints([127])) == 1 and len(encode_varints([128])) == 2
+    assert decode_varints(b"") == []
+
+
+def test_segment_lookup_and_tombstones():
+    segment = build_segment({
+        "alpha": [(40, pack_posting(2, False)), (7, pack_posting(1, True))],
+        "beta": [(12, pack_posting(3, False))],
+    })
+    assert list(segment.chunk_nos) == [7, 12, 40]
+    assert segment.lookup("alpha") == [(7, pack_posting(1, True)), (40, pack_posting(2, False))]
+    assert segment.lookup("missing") == []
+
+    segment.delete(7)
+    segment.delete(7)
+    assert segment.deleted == 1 and segment.live_count == 2
+    assert segment.lookup("alpha") == [(40, pack_posting(2, False))]
+
+
+def test_tiered_merge_drops_tombstones():
+    segments = [build_segment({"term": [(chunk_no, pack_posting(1, False))], f"only{chunk_no}": [(chunk_no, 2)]})
+                for chunk_no in range(MERGE_FACTOR)]
+    # 不到MERGE_FACTOR个同档位的段时不合并
+    assert pick_merge(segments[:-1]) == []
+    assert pick_merge(segments) == segments
+
+    segments[1].delete(1)
+    merged = merge_segments(segments)
+    assert list(merged.chunk_nos) == [0, 2, 3] and merged.deleted == 0
+    assert [chunk_no for chunk_no, _ in merged.lookup("term")] == [0, 2, 3]
+    assert "only1" not in merged.postings
+
+    # 墓碑占比过高的段单独重写
+    big = build_segment({"term": [(chunk_no, 2) for chunk_no in range(100, 110)]})
+    for chunk_no in range(100, 104):
+        big.delete(chunk_no)
+    assert pick_merge([big]) == [big]
+
+
+def test_index_merges_segments_without_changing_results():
+    index = ChunkIndex.build({"base.md": "alpha beta gamma"})
+    for i in range(MERGE_FACTOR * 2):
+        index.update({f"doc{i}.md": f"alpha delta{i}\n\nbeta epsilon"}, merge=False)
+    index.update({"doc0.md": None, "doc3.md": "alpha rewritten"}, merge=False)
+    before = index.search({"alpha": 1.0, "beta": 0.5}, 20)
+    segments_before = index.segment_stats()["segments"]
+
+    index.start_merge(background=False)
+    stats = index.segment_stats()
+    assert stats["merges"] >= 1 and stats["segments"] < segments_before
+    assert index.search({"alpha": 1.0, "beta": 0.5}, 20) == before
+    assert "doc0.md" not in {item["filename"] for item in before}
+    assert index.search({"delta0": 1.0}, 5) == []
@@ -0,0 +1,28 @@
+from sessions import SESSION_MAX_TURNS, Session
+
+
+def run_turns(session: Session, count: int):
+    """逐轮对话，返回每轮发送的历史（不含本轮问题）"""
+    histories = []
+    for i in range(count):
+        histories.append(session.messages(f"message {i}")[:-1])
+        session.add_turn(f"question {i}", f"message {i}", {"role": "assistant", "content": f"answer {i}"},
+                         [{"filename": "doc.txt", "chunk_id": i}])
+    return histories
+
+
+def test_truncation_keeps_prefix_stable_between_blocks():
+    session = Session("s")
+    session.bind("collection", "system prompt")
+    histories = run_turns(session, SESSION_MAX_TURNS * 3)
+
+    changed = [i for i in range(1, len(histories))
+               if histories[i][:len(histories[i - 1])] != histories[i - 1]]
+    # 逐轮丢弃时超过上限后每轮都会变化
+    assert len(changed) <= 2 * SESSION_MAX_TURNS // max(1, SESSION_MAX_TURNS // 2)
+    assert all(history[0] == {"role": "system", "content": "system prompt"} for history in histories)
+    assert len(session.turns) <= SESSION_MAX_TURNS
+    assert set(session.pinned) == {key for turn in session.turns for key in turn["chunks"]}
+    # 丢弃的轮次以问题列表的形式保留
+    assert session.dropped_questions[-1] == f"question {session.turn_offset - 1}"
+    assert f"question {session.turn_offset - 1}" in session.messages("next")[1]["content"]
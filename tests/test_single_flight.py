@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from llm_client import SingleFlight
+
+
+def test_cancelled_leader_does_not_cancel_coalesced_waiters():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.ensure_future(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("k", upstream))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        release.set()
+        assert await waiter == "answer"
+        assert calls == 1
+        assert flight.inflight_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_shared_call_is_cancelled_when_every_caller_leaves():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def upstream():
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flight.do("k", upstream)) for _ in range(2)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert flight.inflight_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_errors_are_shared():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("k", upstream), flight.do("k", upstream), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(scenario())
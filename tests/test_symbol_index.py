@@ -0,0 +1,90 @@
+from search_index import ChunkIndex
+from symbol_index import LANGUAGE_BY_EXTENSION, SymbolTable, extract_symbols
+
+
+def test_every_grammar_extension_is_loaded(tmp_path):
+    import app
+
+    assert set(LANGUAGE_BY_EXTENSION) <= set(app.TEXT_EXTENSIONS)
+    (tmp_path / "lib.rs").write_text("pub fn parse_header(input: &str) -> u32 {\n    0\n}\n", encoding="utf-8")
+    (tmp_path / "View.tsx").write_text("export function RenderPanel() {\n  return null;\n}\n", encoding="utf-8")
+    documents = app.load_documents(str(tmp_path))
+    assert set(documents) == {"lib.rs", "View.tsx"}
+    assert [symbol.name for symbol in extract_symbols("lib.rs", documents["lib.rs"])] == ["parse_header"]
+    assert [symbol.name for symbol in extract_symbols("View.tsx", documents["View.tsx"])] == ["RenderPanel"]
+
+
+PYTHON_SOURCE = '''import os
+
+
+class ChunkIndex:
+    """索引"""
+
+    def search(self, terms):
+        total = 0
+        for term in terms:
+            total += 1
+        return total
+
+    @staticmethod
+    def build(documents):
+        return ChunkIndex()
+
+
+def load_documents(folder):
+    return os.listdir(folder)
+'''
+
+GO_SOURCE = '''package main
+
+type Server struct {
+    addr string
+}
+
+func (s *Server) ListenAndServe() error {
+    if s.addr == "" {
+        return nil
+    }
+    return nil
+}
+
+func main() {
+}
+'''
+
+
+def test_python_definitions_and_methods():
+    symbols = {symbol.qualname: symbol for symbol in extract_symbols("index.py", PYTHON_SOURCE)}
+    assert set(symbols) == {"ChunkIndex", "ChunkIndex.search", "ChunkIndex.build", "load_documents"}
+    assert symbols["ChunkIndex.search"].kind == "method"
+    assert (symbols["ChunkIndex.search"].start_line, symbols["ChunkIndex.search"].end_line) == (7, 11)
+    # 装饰器属于定义的一部分
+    assert symbols["ChunkIndex.build"].start_line == 13
+    assert symbols["load_documents"].kind == "function"
+
+
+def test_brace_language_definitions_end_at_the_closing_brace():
+    symbols = {symbol.name: symbol for symbol in extract_symbols("server.go", GO_SOURCE)}
+    assert (symbols["ListenAndServe"].start_line, symbols["ListenAndServe"].end_line) == (7, 12)
+    assert (symbols["main"].start_line, symbols["main"].end_line) == (14, 15)
+    assert extract_symbols("notes.md", "def not_code(): pass") == []
+
+
+def test_symbol_table_lookup():
+    table = SymbolTable()
+    table.add_all(extract_symbols("index.py", PYTHON_SOURCE))
+    names = lambda numbers: sorted(table.symbols[number].qualname for number in numbers)
+    assert names(table.lookup("chunkindex.search")) == ["ChunkIndex.search"]
+    assert names(table.lookup("load_documents")) == ["load_documents"]
+    assert names(table.lookup_prefix("chunkindex")) == ["ChunkIndex", "ChunkIndex.build", "ChunkIndex.search"]
+    # 只有明显是标识符的词才解析为符号
+    assert names(table.resolve_query("how does load_documents work")) == ["load_documents"]
+    assert names(table.resolve_query("what does `search` return")) == ["ChunkIndex.search"]
+    assert table.resolve_query("how to search documents") == []
+
+
+def test_symbol_query_returns_the_whole_definition():
+    index = ChunkIndex.build({"index.py": PYTHON_SOURCE, "README.md": "search the index with search terms"})
+    results = index.search({"search": 1.0}, 1, priority_chunks=index.resolve_symbols("ChunkIndex.search()"))
+    assert results[0]["filename"] == "index.py"
+    assert "def search(self, terms):" in results[0]["content"] and "return total" in results[0]["content"]
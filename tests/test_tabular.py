@@ -0,0 +1,110 @@
+import json
+
+import file_sniffer
+import tabular
+
+
+def write_users(folder, rows):
+    path = folder / "users.csv"
+    path.write_text("user_id,name,plan\n" + "".join(f"u-{1000 + i},name{i},basic\n" for i in range(rows)),
+                    encoding="utf-8")
+    return str(path)
+
+
+def json_rows():
+    return json.dumps([{"id": i, "meta": {"label": f"code {i}", "tags": ["a", "b"]}} for i in range(40, 50)])
+
+
+def test_render_stops_at_size_limit(tmp_path):
+    table = tabular.read_table(write_users(tmp_path, 5000), "users.csv")
+    full = table.render(max_chars=10 ** 9)
+    assert table.rendered_rows == 5000
+
+    before = file_sniffer.stats.snapshot().get("table_rows_unrendered", 0)
+    capped = table.render(max_chars=20000)
+    assert len(capped) < 20000 + 2 * tabular.TABULAR_CHUNK_CHARS + len(table.summary())
+    assert 0 < table.rendered_rows < 5000
+    assert f"只有前 {table.rendered_rows} 行生成了片段" in capped
+    assert file_sniffer.stats.snapshot()["table_rows_unrendered"] - before == 5000 - table.rendered_rows
+    assert len(capped) < len(full)
+    # 没有生成片段的行不能定位到片段
+    assert table.chunk_for_row(0) == 1
+    assert table.chunk_for_row(table.rendered_rows) is None
+
+
+def test_key_lookup_skips_unrendered_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(tabular, "TABULAR_MAX_RENDER_CHARS", 20000)
+    write_users(tmp_path, 5000)
+    store = tabular.TableStore()
+    content = store.load(str(tmp_path), "users.csv")
+    table = store.get(str(tmp_path), "users.csv")
+    assert content.count("\n## ") == len(table.chunk_first_rows)
+    assert store.resolve_query(str(tmp_path), "plan of u-1003", []) == [("users.csv", 1)]
+    assert store.resolve_query(str(tmp_path), "plan of u-5999", []) == []
+
+
+def test_malformed_json_lines_are_counted(tmp_path):
+    path = tmp_path / "events.jsonl"
+    path.write_text('{"id": "e-1", "kind": "start"}\n{"id": "e-2", \nnot json\n{"id": "e-3", "kind": "stop"}\n',
+                    encoding="utf-8")
+    before = file_sniffer.stats.snapshot().get("skipped_malformed_lines", 0)
+    table = tabular.read_table(str(path), "events.jsonl")
+    assert table.row_count == 2
+    assert file_sniffer.stats.snapshot()["skipped_malformed_lines"] - before == 2
+
+
+def test_columns_are_typed_and_summarized(tmp_path):
+    path = tmp_path / "orders.csv"
+    path.write_text("order_id,amount,paid,zip,note\n"
+                    "ORD-1,10,true,007,first\n"
+                    "ORD-2,12.5,false,010,\n"
+                    "ORD-3,7,true,100,third\n", encoding="utf-8")
+    table = tabular.read_table(str(path), "orders.csv")
+    columns = {column["name"]: column for column in table.describe()["columns"]}
+    assert columns["amount"]["type"] == "number" and columns["amount"]["min"] == 7 and columns["amount"]["max"] == 12.5
+    assert columns["paid"]["type"] == "boolean"
+    # 带前导零的编号按文本保留
+    assert columns["zip"]["type"] == "text" and table.row(0)["zip"] == "007"
+    assert columns["note"]["nulls"] == 1
+    assert table.describe()["key"] == "order_id"
+    assert table.row_line(1) == "第2行: order_id=ORD-2; amount=12.5; paid=false; zip=010"
+
+
+def test_key_and_row_number_lookup(tmp_path):
+    write_users(tmp_path, 100)
+    (tmp_path / "codes.json").write_text(json_rows(), encoding="utf-8")
+    store = tabular.TableStore()
+    store.load(str(tmp_path), "users.csv")
+    store.load(str(tmp_path), "codes.json")
+    users = store.get(str(tmp_path), "users.csv")
+    first_rows = users.chunk_first_rows
+    assert first_rows[0] == 0 and len(first_rows) == 100 // tabular.TABULAR_CHUNK_ROWS
+
+    # 主键值定位到记录所在的片段（片段0为摘要）
+    assert store.resolve_query(str(tmp_path), "what plan is u-1045 on", []) == \
+        [("users.csv", users.chunk_for_row(45))]
+    # "第N行"只在提到的表格中定位
+    assert store.resolve_query(str(tmp_path), "users.csv 第 21 行", ["users.csv"]) == [("users.csv", 2)]
+    assert store.resolve_query(str(tmp_path), "第 21 行", []) == []
+    # 纯数字主键只在提到的表格中查找
+    assert store.resolve_query(str(tmp_path), "code 42", []) == []
+    assert store.resolve_query(str(tmp_path), "code 42", ["codes.json"]) == [("codes.json", 1)]
+
+    store.remove(str(tmp_path), "users.csv")
+    assert store.resolve_query(str(tmp_path), "u-1045", []) == []
+
+
+def test_json_arrays_are_streamed_and_objects_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(tabular, "_READ_SIZE", 16)
+    codes = tmp_path / "codes.json"
+    codes.write_text(json_rows(), encoding="utf-8")
+    table = tabular.read_table(str(codes), "codes.json")
+    assert table.row_count == 10 and table.columns[table.key_column].name == "id"
+    assert table.row(2)["meta.label"] == "code 42"
+
+    config = tmp_path / "config.json"
+    config.write_text('{"rows": [1, 2, 3]}', encoding="utf-8")
+    assert tabular.read_table(str(config), "config.json") is None
+    broken = tmp_path / "broken.json"
+    broken.write_text('[{"id": 1}, {"id": ', encoding="utf-8")
+    assert tabular.read_table(str(broken), "broken.json") is None